@@ -3,31 +3,592 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
 
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
 import numpy as np
 import pandas as pd
 import copy
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.ensemble import GradientBoostingClassifier
 from sklearn.ensemble import AdaBoostClassifier
 from sklearn.model_selection import cross_val_score
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import precision_score
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_selection import chi2
 from scipy import sparse
 from scipy import stats
-from scipy.stats import bootstrap
+
+# the CIs of the error rates are computed as by the server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ui", "server"))
+from rule_explorer.confidence import wilson_ci, clopper_pearson_ci, bootstrap_ci
 
 MAXINT = 1073741819
+# max number of (rule, feature) counts held in memory at once when mining pairs
+PAIR_BLOCK_SIZE = 1 << 24
+# similar tokens kept per token, and the min cosine similarity of tokens grouped in an OR rule
+SIMILARITY_TOP_K = 20
+SIMILARITY_THRESHOLD = 0.5
+# max tokens of an OR rule
+OR_MAX_SIZE = 5
+# max conditions of a rule mined level by level, and the memory of the bitsets of one level
+DEEP_MAX_DEPTH = 3
+DEEP_MEMORY_MB = 1024
+# columns of the token matrix kept for the surrogate forest when prescreening
+PRESCREEN_K = 2000
+# set bits of each byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class TokenPairMiner:
+    '''support and error count of all token pairs from sparse products,
+    only the pairs passing the filter are materialized into doc lists'''
+    def __init__(self, X, y, X_test, y_test, error_rates, filter_threshold):
+        self.X = X
+        self.y = y
+        self.X_test = X_test
+        self.y_test = y_test
+        self.error_rates = error_rates
+        self.filter_threshold = filter_threshold
+
+        self.X_bin = sparse.csc_matrix((X != 0).astype(np.int64))
+        self.X_err = sparse.csc_matrix(self.X_bin.multiply(y.reshape(-1, 1)))
+        self.X_test_bin = sparse.csc_matrix((X_test != 0).astype(np.int64))
+        self.X_bin.sort_indices()
+        self.X_test_bin.sort_indices()
+
+    def column_rows(self, X_bin, i):
+        return X_bin.indices[X_bin.indptr[i]:X_bin.indptr[i+1]]
+
+    def mine(self, start, end):
+        rules = []
+        num_token = self.X.shape[1]
+        block_size = max(1, PAIR_BLOCK_SIZE // max(1, num_token))
+        for block_start in range(start, end, block_size):
+            block_end = min(block_start+block_size, end)
+            supports = (self.X_bin[:, block_start:block_end].T @ self.X_bin).toarray()
+            error_counts = (self.X_err[:, block_start:block_end].T @ self.X_bin).toarray()
+            for i in range(block_start, block_end):
+                support = supports[i-block_start, i+1:]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    err_rate = np.where(support > 0, error_counts[i-block_start, i+1:]/support, 0)
+                passed = (err_rate > self.error_rates[i]) & (err_rate > self.error_rates[i+1:]) \
+                    & (err_rate > self.filter_threshold['err_rate']) & (support > self.filter_threshold['support'])
+                for j in (np.where(passed)[0] + i + 1).tolist():
+                    rules.append(self.materialize(i, j))
+        return rules
+
+    def materialize(self, i, j):
+        error_idx = np.intersect1d(self.column_rows(self.X_bin, i),
+            self.column_rows(self.X_bin, j), assume_unique=True)
+        error_idx_test = np.intersect1d(self.column_rows(self.X_test_bin, i),
+            self.column_rows(self.X_test_bin, j), assume_unique=True)
+        err_rate_test = 0
+        if (error_idx_test.shape[0] > 0):
+            err_rate_test = np.sum(self.y_test[error_idx_test])/error_idx_test.shape[0]
+        return {
+            'rules': [{'feature': i, 'sign': '>'}, {'feature': j, 'sign': '>'}],
+            'doc_idx': error_idx.tolist(),
+            'doc_idx_test': error_idx_test.tolist(),
+            'err_rate': np.sum(self.y[error_idx])/error_idx.shape[0],
+            'err_rate_test': err_rate_test,
+        }
+
+class HfeatPairMiner:
+    '''support and error count of all (feature=val, feature=val) pairs from contingency
+    tables of one-hot bins, only the pairs passing the filter are materialized into doc lists'''
+    def __init__(self, X, y, X_test, y_test, num_bin, error_rates, filter_threshold):
+        self.X = X
+        self.y = y
+        self.X_test = X_test
+        self.y_test = y_test
+        self.num_bin = num_bin
+        self.error_rates = error_rates
+        self.filter_threshold = filter_threshold
+
+    def one_hot(self, X, num_val):
+        # doc x (feature, val) indicator matrix, features first then vals
+        return (X[:, :, np.newaxis] == np.arange(num_val)).reshape(X.shape[0], -1).astype(np.float64)
+
+    def count_pairs(self, start, end, num_val):
+        # rows: (i, val_i) for i in [start, end), cols: (j, val_j) for all j
+        num_feat = self.X.shape[1]
+        supports = np.zeros(shape=((end-start)*num_val, num_feat*num_val))
+        error_counts = np.zeros(shape=supports.shape)
+        chunk_size = max(1, PAIR_BLOCK_SIZE // (num_feat*num_val))
+        for chunk_start in range(0, self.X.shape[0], chunk_size):
+            chunk = slice(chunk_start, chunk_start+chunk_size)
+            bins = self.one_hot(self.X[chunk], num_val)
+            left = bins[:, start*num_val:end*num_val]
+            supports += left.T @ bins
+            error_counts += (left * self.y[chunk].reshape(-1, 1)).T @ bins
+        return np.rint(supports).astype(np.int64), np.rint(error_counts).astype(np.int64)
+
+    def mine(self, start, end):
+        rules = []
+        # the vals of feature j are enumerated with num_bin[i]
+        run_start = start
+        while (run_start < end):
+            num_val = self.num_bin[run_start]
+            run_end = run_start+1
+            while (run_end < end and self.num_bin[run_end] == num_val):
+                run_end += 1
+            rules.extend(self.mine_run(run_start, run_end, num_val))
+            run_start = run_end
+        return rules
+
+    def mine_run(self, start, end, num_val):
+        rules = []
+        supports, error_counts = self.count_pairs(start, end, num_val)
+        for i in range(start, end):
+            other_rates = np.repeat(self.error_rates[i+1:], num_val)
+            for val_i in range(num_val):
+                row = (i-start)*num_val + val_i
+                support = supports[row, (i+1)*num_val:]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    err_rate = np.where(support > 0, error_counts[row, (i+1)*num_val:]/support, 0)
+                passed = (err_rate > self.error_rates[i]) & (err_rate > other_rates) \
+                    & (err_rate > self.filter_threshold['err_rate']) & (support > self.filter_threshold['support'])
+                if (not passed.any()):
+                    continue
+                rows = np.where(self.X[:, i] == val_i)[0]
+                rows_test = np.where(self.X_test[:, i] == val_i)[0]
+                for k in np.where(passed)[0].tolist():
+                    rules.append(self.materialize(i, val_i, i+1+k//num_val, k%num_val, rows, rows_test))
+        return rules
+
+    def materialize(self, i, val_i, j, val_j, rows, rows_test):
+        error_idx = rows[self.X[rows, j] == val_j]
+        error_idx_test = rows_test[self.X_test[rows_test, j] == val_j]
+        err_rate_test = 0
+        if (error_idx_test.shape[0] > 0):
+            err_rate_test = np.sum(self.y_test[error_idx_test])/error_idx_test.shape[0]
+        return {
+            'rules': [{'feature': i, 'sign': '=', 'val': val_i},
+                {'feature': j, 'sign': '=', 'val': val_j}],
+            'doc_idx': error_idx.tolist(),
+            'doc_idx_test': error_idx_test.tolist(),
+            'err_rate': np.sum(self.y[error_idx])/error_idx.shape[0],
+            'err_rate_test': err_rate_test,
+        }
+
+class RuleSupport:
+    '''docs of the candidate rules of a mining run: every single condition and the pairs
+    above the support threshold, as rows of sparse (candidate x doc) matrices. They do not
+    depend on y, so the rules of a new error vector are counted with one product per split'''
+    FILES = ['members', 'members_test']
+
+    def __init__(self, rule_type, item_feature, item_val, pairs, members, members_test,
+            train_idx, test_idx, min_support, extra=None):
+        self.rule_type = rule_type
+        self.item_feature = item_feature
+        self.item_val = item_val
+        self.pairs = pairs
+        self.members = members
+        self.members_test = members_test
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.min_support = min_support
+        # e.g., good_token_idx or thresholds, restored with the supports
+        self.extra = extra or {}
+
+    @classmethod
+    def build(cls, rule_type, B, B_test, item_feature, item_val, num_bin,
+            train_idx, test_idx, min_support):
+        '''B: binary (doc x item) matrix of the train docs, an item is a token or a (feature, val)'''
+        B = sparse.csc_matrix(B, dtype=np.int64)
+        supports = sparse.triu(B.T @ B, k=1).tocsr()
+        supports.sort_indices()
+        rows = np.repeat(np.arange(supports.shape[0]), np.diff(supports.indptr))
+        cols = supports.indices
+        # same pairs as the miners: i < j by feature, vals of j enumerated with num_bin[i]
+        keep = (supports.data > min_support) & (item_feature[cols] > item_feature[rows])
+        if (rule_type == "hfeat"):
+            keep &= item_val[cols] < num_bin[item_feature[rows]]
+        pairs = np.column_stack([rows[keep], cols[keep]]).astype(np.int64)
+        return cls(rule_type, item_feature, item_val, pairs,
+            cls.pair_members(B, pairs), cls.pair_members(sparse.csc_matrix(B_test, dtype=np.int64), pairs),
+            train_idx, test_idx, min_support)
+
+    @staticmethod
+    def pair_members(B, pairs):
+        '''rows of the items followed by the rows of the pairs, docs in ascending order'''
+        items = sparse.csr_matrix(B.T)
+        blocks = [items]
+        block_size = max(1, PAIR_BLOCK_SIZE // max(1, B.shape[0]))
+        for start in range(0, pairs.shape[0], block_size):
+            block = pairs[start:start+block_size]
+            blocks.append(items[block[:, 0]].multiply(items[block[:, 1]]))
+        members = sparse.csr_matrix(sparse.vstack(blocks, format="csr"))
+        members.eliminate_zeros()
+        members.sort_indices()
+        return members
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        sparse.save_npz(os.path.join(folder, "members.npz"), self.members)
+        sparse.save_npz(os.path.join(folder, "members_test.npz"), self.members_test)
+        arrays = {'item_feature': self.item_feature, 'item_val': self.item_val, 'pairs': self.pairs,
+            'train_idx': self.train_idx, 'test_idx': self.test_idx}
+        for key, val in self.extra.items():
+            arrays['extra_'+key] = val
+        np.savez(os.path.join(folder, "arrays.npz"), **arrays)
+        with open(os.path.join(folder, "meta.json"), "w") as output:
+            output.write(json.dumps({'rule_type': self.rule_type, 'min_support': self.min_support}))
+
+    @classmethod
+    def load(cls, folder):
+        with open(os.path.join(folder, "meta.json")) as json_input:
+            meta = json.load(json_input)
+        with np.load(os.path.join(folder, "arrays.npz")) as arrays:
+            arrays = dict(arrays)
+        extra = dict([(key[len("extra_"):], val) for key, val in arrays.items() if key.startswith("extra_")])
+        return cls(meta['rule_type'], arrays['item_feature'], arrays['item_val'], arrays['pairs'],
+            sparse.load_npz(os.path.join(folder, "members.npz")).tocsr(),
+            sparse.load_npz(os.path.join(folder, "members_test.npz")).tocsr(),
+            arrays['train_idx'], arrays['test_idx'], meta['min_support'], extra)
+
+    def count(self, y, y_test):
+        '''support and error count of every candidate, on the train and test docs'''
+        tot = np.diff(self.members.indptr)
+        tot_test = np.diff(self.members_test.indptr)
+        return tot, self.members @ y, tot_test, self.members_test @ y_test
+
+def prescreen_scores(X, y, method="chi2"):
+    '''relevance of every column of a dense or sparse X to the binary y, all columns at once:
+    the chi-square statistic of the counts ("chi2"), or the mutual information between the
+    presence of the column and y ("mutual_info")'''
+    y = np.asarray(y).astype(np.float64)
+    if (method == "chi2"):
+        scores = chi2(X, y)[0]
+    elif (method == "mutual_info"):
+        X_bin = (X != 0)
+        X_bin = X_bin.astype(np.float64) if not sparse.issparse(X_bin) else sparse.csr_matrix(X_bin, dtype=np.float64)
+        num_doc = X.shape[0]
+        num_err = y.sum()
+        col = np.asarray(X_bin.sum(axis=0)).reshape(-1)
+        col_err = np.asarray(X_bin.T @ y).reshape(-1)
+        # 2x2 table of (column present, error) per column
+        scores = np.zeros(shape=col.shape[0])
+        for count, col_count, y_count in [(col_err, col, num_err), (col - col_err, col, num_doc - num_err),
+                (num_err - col_err, num_doc - col, num_err), (num_doc - col - num_err + col_err, num_doc - col, num_doc - num_err)]:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                term = count / num_doc * np.log(count * num_doc / (col_count * y_count))
+            scores += np.where(count > 0, term, 0)
+    else:
+        raise ValueError("unknown prescreening method: "+str(method))
+    return np.nan_to_num(scores)
+
+def surrogate_key(X, y, params):
+    '''hash of the train docs, the error vector and the parameters of the surrogate forest'''
+    digest = hashlib.sha1()
+    if (sparse.issparse(X)):
+        X = sparse.csr_matrix(X)
+        X.sort_indices()
+        arrays = [X.indptr, X.indices, X.data]
+    else:
+        arrays = [X]
+    for array in arrays + [np.asarray(y)]:
+        array = np.ascontiguousarray(array)
+        digest.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+        digest.update(array.view(np.uint8).reshape(-1) if array.size > 0 else b"")
+    digest.update(json.dumps([str(type(X)), list(X.shape), params], sort_keys=True).encode())
+    return digest.hexdigest()
+
+def pack_columns(B):
+    '''(item x byte) bitsets of the columns of a dense or sparse (doc x item) matrix'''
+    num_doc, num_item = B.shape
+    if (sparse.issparse(B)):
+        B = sparse.csc_matrix(B)
+    bits = np.zeros(shape=(num_item, (num_doc+7)//8), dtype=np.uint8)
+    block_size = max(1, PAIR_BLOCK_SIZE // max(1, num_doc))
+    for start in range(0, num_item, block_size):
+        cols = B[:, start:start+block_size]
+        cols = cols.toarray() if sparse.issparse(cols) else np.asarray(cols)
+        bits[start:start+block_size] = np.packbits(cols.T != 0, axis=1)
+    return bits
+
+def popcount(bits):
+    return POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+class LevelwiseMiner:
+    '''conjunctions of up to max_depth items (tokens or (feature, val) bins), mined level by level.
+    A rule is kept when its support and error rate pass the filter and its error rate is above the
+    rate of every rule made of a subset of its conditions (for pairs, above both single conditions).
+    The docs of a candidate are the bitset of its parent AND the bitset of the added item. A candidate
+    is not extended when its support is at most the threshold, or when no subset of its docs above
+    the support threshold, at best err / (support+1), can beat it and its subsets'''
+    def __init__(self, B, y, B_test, y_test, item_feature, item_cond, filter_threshold):
+        '''B: (doc x item) matrix of the train docs, two items of the same feature are never combined,
+        item_cond(item) is the condition of an item in the rules'''
+        self.num_doc = B.shape[0]
+        self.num_doc_test = B_test.shape[0]
+        self.bits = pack_columns(B)
+        self.bits_test = pack_columns(B_test)
+        self.y_bits = np.packbits(np.asarray(y) != 0)
+        self.y = np.asarray(y)
+        self.y_test = np.asarray(y_test)
+        self.item_feature = np.asarray(item_feature)
+        self.item_cond = item_cond
+        self.filter_threshold = filter_threshold
+
+    def mine(self, max_depth=DEEP_MAX_DEPTH, time_budget=None, memory_budget_mb=DEEP_MEMORY_MB):
+        '''time_budget (seconds) stops the search, the most promising candidates (highest bound) of a
+        level are extended first; the candidates of the next level beyond memory_budget_mb keep the
+        most promising ones. self.stats counts the candidates of each level and tells if the search
+        was cut short'''
+        start = time.perf_counter()
+        deadline = None if time_budget is None else start + time_budget
+        max_child = max(1, int(memory_budget_mb * 2**20) // max(1, self.bits.shape[1]))
+        min_support = self.filter_threshold['support']
+        min_rate = self.filter_threshold['err_rate']
+        self.stats = {'levels': [], 'out_of_time': False, 'out_of_memory': False}
+
+        tot = popcount(self.bits)
+        err = popcount(self.bits & self.y_bits)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(tot > 0, err/np.maximum(tot, 1), 0)
+        bound = np.minimum(1., err/(min_support+1))
+        supported = tot > min_support
+        found = [((i,), self.bits[i], rate[i]) for i in np.flatnonzero(supported & (rate > min_rate)).tolist()]
+        items = np.flatnonzero(supported & (bound > np.maximum(min_rate, rate)))
+        # frontier: items, bitsets, best rate of the rule and its subsets, bound
+        frontier = (items.reshape(-1, 1), self.bits[items], rate[items], bound[items])
+        kept = dict([((i,), rate[i]) for i in items.tolist()])
+        self.stats['levels'].append({'candidates': int(tot.shape[0]), 'supported': int(supported.sum()),
+            'rules': len(found), 'extended': int(items.shape[0])})
+
+        for depth in range(2, max_depth+1):
+            if (frontier[0].shape[0] == 0 or self.stats['out_of_time']):
+                break
+            level = {'candidates': 0, 'supported': 0, 'rules': 0, 'extended': 0}
+            children = []
+            num_child = 0
+            next_kept = {}
+            for ix in np.argsort(-frontier[3], kind='stable').tolist():
+                if (deadline is not None and time.perf_counter() > deadline):
+                    self.stats['out_of_time'] = True
+                    break
+                node = tuple(frontier[0][ix].tolist())
+                last = node[-1]
+                cand = items[(items > last) & (self.item_feature[items] > self.item_feature[last])]
+                if (cand.shape[0] == 0):
+                    continue
+                child_bits = frontier[1][ix] & self.bits[cand]
+                child_tot = popcount(child_bits)
+                child_err = popcount(child_bits & self.y_bits)
+                level['candidates'] += int(cand.shape[0])
+                extend = []
+                for pos in np.flatnonzero(child_tot > min_support).tolist():
+                    child = node + (int(cand[pos]),)
+                    # every subset must still be extendable, the best rate comes from the parents
+                    best = frontier[2][ix]
+                    for drop in range(len(child)-2, -1, -1):
+                        parent_best = kept.get(child[:drop]+child[drop+1:])
+                        if (parent_best is None):
+                            best = None
+                            break
+                        best = max(best, parent_best)
+                    if (best is None):
+                        continue
+                    level['supported'] += 1
+                    child_rate = child_err[pos]/child_tot[pos]
+                    if (child_rate > min_rate and child_rate > best):
+                        found.append((child, child_bits[pos].copy(), child_rate))
+                        level['rules'] += 1
+                    best = max(best, child_rate)
+                    child_bound = min(1., child_err[pos]/(min_support+1))
+                    if (depth < max_depth and child_bound > max(min_rate, best)):
+                        next_kept[child] = best
+                        extend.append((pos, best, child_bound))
+                if (len(extend) == 0):
+                    continue
+                pos = np.array([x[0] for x in extend])
+                children.append((np.column_stack([np.tile(frontier[0][ix], (pos.shape[0], 1)), cand[pos]]),
+                    child_bits[pos], np.array([x[1] for x in extend]), np.array([x[2] for x in extend])))
+                num_child += pos.shape[0]
+                if (num_child > max_child):
+                    children = [self.most_promising(children, max_child * 3 // 4)]
+                    num_child = children[0][0].shape[0]
+                    # the dropped candidates are not extended
+                    self.stats['out_of_memory'] = True
+
+            if (len(children) > 0):
+                frontier = tuple([np.concatenate([child[k] for child in children]) for k in range(4)])
+            else:
+                frontier = (np.zeros(shape=(0, depth), dtype=np.int64), np.zeros(shape=(0, self.bits.shape[1]), dtype=np.uint8),
+                    np.zeros(0), np.zeros(0))
+            level['extended'] = int(frontier[0].shape[0])
+            self.stats['levels'].append(level)
+            kept = next_kept
+
+        self.stats['elapsed'] = time.perf_counter() - start
+        found.sort(key=lambda x: (len(x[0]), x[0]))
+        return [self.materialize(*x) for x in found]
+
+    @staticmethod
+    def most_promising(children, limit):
+        merged = [np.concatenate([child[k] for child in children]) for k in range(4)]
+        keep = np.sort(np.argsort(-merged[3], kind='stable')[:limit])
+        return tuple([x[keep] for x in merged])
+
+    def materialize(self, items, bits, err_rate):
+        error_idx = np.flatnonzero(np.unpackbits(bits, count=self.num_doc))
+        bits_test = np.bitwise_and.reduce(self.bits_test[list(items)], axis=0)
+        error_idx_test = np.flatnonzero(np.unpackbits(bits_test, count=self.num_doc_test))
+        err_rate_test = 0
+        if (error_idx_test.shape[0] > 0):
+            err_rate_test = np.sum(self.y_test[error_idx_test])/error_idx_test.shape[0]
+        return {
+            'rules': [self.item_cond(item) for item in items],
+            'doc_idx': error_idx.tolist(),
+            'doc_idx_test': error_idx_test.tolist(),
+            'err_rate': err_rate,
+            'err_rate_test': err_rate_test,
+        }
+
+def top_k_similarity(X_bin, top_k=SIMILARITY_TOP_K, threshold=SIMILARITY_THRESHOLD):
+    '''cosine similarity of the columns of a sparse matrix, only the top_k most similar columns
+    above threshold are kept per column (a sparse matrix of at most top_k x columns values),
+    the products are done by blocks of columns'''
+    X_bin = sparse.csc_matrix(X_bin, dtype=np.float64)
+    num_col = X_bin.shape[1]
+    if (num_col < 2):
+        return sparse.csr_matrix((num_col, num_col))
+    norms = np.sqrt(np.asarray(X_bin.multiply(X_bin).sum(axis=0)).reshape(-1))
+    with np.errstate(divide='ignore'):
+        inv_norms = np.where(norms > 0, 1/norms, 0)
+    X_norm = sparse.csc_matrix(X_bin @ sparse.diags(inv_norms))
+    X_norm_T = sparse.csr_matrix(X_norm.T)
+    k = min(top_k, num_col-1)
+    block_size = max(1, PAIR_BLOCK_SIZE // num_col)
+    rows, cols, vals = [], [], []
+    for start in range(0, num_col, block_size):
+        end = min(start+block_size, num_col)
+        sims = (X_norm_T[start:end] @ X_norm).toarray()
+        sims[np.arange(end-start), np.arange(start, end)] = 0
+        top = np.argpartition(-sims, k-1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        keep = (top_sims >= threshold) & (top_sims > 0)
+        rows.append(np.repeat(np.arange(start, end), k)[keep.reshape(-1)])
+        cols.append(top[keep])
+        vals.append(top_sims[keep])
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(num_col, num_col))
+
+class SharedArrays:
+    '''numpy arrays written once to memory-mapped files, so pool workers map
+    the same pages instead of unpickling a copy per task'''
+    def __init__(self, arrays):
+        self.folder = tempfile.mkdtemp(prefix="debug_rule_")
+        self.paths = {}
+        for name, arr in arrays.items():
+            self.paths[name] = os.path.join(self.folder, name+".npy")
+            np.save(self.paths[name], np.ascontiguousarray(arr))
+
+    def close(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def split_shards(num_feat, num_shard):
+    '''split the outer feature index into contiguous shards with about the same number of pairs'''
+    if (num_feat == 0):
+        return []
+    work = np.cumsum(np.arange(num_feat, 0, -1))
+    cuts = np.searchsorted(work, np.linspace(0, work[-1], num_shard+1)[1:-1], side="right")
+    bounds = np.unique(np.concatenate([[0], cuts, [num_feat]])).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# state of a pool worker, set once by init_worker
+_worker = {}
+
+def init_worker(kind, paths, params):
+    arrays = dict([(name, np.load(path, mmap_mode='r')) for name, path in paths.items()])
+    _worker['arrays'] = arrays
+    if (kind == "token"):
+        _worker['miner'] = TokenPairMiner(arrays['X'], arrays['y'], arrays['X_test'], arrays['y_test'],
+            arrays['error_rates'], params['filter_threshold'])
+    elif (kind == "hfeat"):
+        _worker['miner'] = HfeatPairMiner(arrays['X'], arrays['y'], arrays['X_test'], arrays['y_test'],
+            arrays['num_bin'], arrays['error_rates'], params['filter_threshold'])
+
+def mine_shard(bounds):
+    return _worker['miner'].mine(bounds[0], bounds[1])
+
+def count_pval(error_count, tot, threshold, method="ttest"):
+    '''one-sided p-values of the error rates being above threshold, vectorized over rules.
+    method "ttest" is the one-sample t-test of the 0/1 errors of the docs (its statistic only
+    depends on the counts), "binomial" the exact binomial test, "ztest" the normal approximation'''
+    error_count = np.asarray(error_count, dtype=float)
+    tot = np.asarray(tot, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = error_count / tot
+        if (method == "ttest"):
+            # sample variance of the 0/1 errors, sum(x^2) = error_count
+            var = error_count * (1 - rate) / (tot - 1)
+            stat = (rate - threshold) / np.sqrt(var / tot)
+            # right tail only, rates below threshold get p-values above .5
+            return stat, stats.t.sf(stat, tot - 1)
+        if (method == "ztest"):
+            stat = (rate - threshold) / np.sqrt(threshold * (1 - threshold) / tot)
+            return stat, stats.norm.sf(stat)
+        if (method == "binomial"):
+            return None, np.where(tot > 0, stats.binom.sf(error_count - 1, tot, threshold), np.nan)
+    raise ValueError("unknown test: "+str(method))
+
+def benjamini_hochberg(pvals):
+    '''FDR q-values of the p-values, nan p-values are left out'''
+    pvals = np.asarray(pvals, dtype=float)
+    qvals = np.full(shape=pvals.shape, fill_value=np.nan)
+    valid = np.flatnonzero(~np.isnan(pvals))
+    if (valid.shape[0] == 0):
+        return qvals
+    order = valid[np.argsort(pvals[valid], kind='stable')]
+    ranked = pvals[order] * valid.shape[0] / np.arange(1, valid.shape[0]+1)
+    qvals[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return qvals
+
+def rule_doc_errors(rule_ix):
+    arrays = _worker['arrays']
+    return arrays['y'][arrays['doc_idx'][arrays['offsets'][rule_ix]:arrays['offsets'][rule_ix+1]]]
+
+def ci_shard(bounds):
+    return [list(bootstrap_ci(rule_doc_errors(ix), seed=[_worker['seed'], ix])) for ix in range(bounds[0], bounds[1])]
+
+def init_rule_worker(paths, seed=None):
+    init_worker("rule", paths, {})
+    _worker['seed'] = seed
 
 class DebugRule:
     def initialize(self, X, y, filter_threshold,
-            dataname=None, verbose=False):
+            dataname=None, verbose=False, n_jobs=1, columns=None):
+        '''n_jobs > 1 mines the rules with a process pool, -1 uses all cores,
+        columns are the names of the columns of X (the tokens), used by extract_or_rules.
+        X may be sparse (e.g., the CSR token corpus), self.df, self.train and self.test (DataFrames
+        of the dense X and its split) are then None, the split is kept in train_idx and test_idx'''
         self.verbose = verbose
+        self.columns = columns
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        if (sparse.issparse(X)):
+            # e.g., the CSR token corpus, split by rows as the dense matrix
+            X = sparse.csr_matrix(X)
+            train_idx, test_idx = train_test_split(np.arange(X.shape[0]), test_size=0.1, random_state=42)
+            # a DataFrame of the corpus would have a column per token of the vocabulary
+            self.df = None
+            self.train = None
+            self.test = None
+        else:
+            self.df = pd.DataFrame(data=X)
+            self.train, self.test = train_test_split(self.df, test_size=0.1, random_state=42)
+            train_idx = np.asarray(self.train.index)
+            test_idx = np.asarray(self.test.index)
         self.all = X
-        self.df = pd.DataFrame(data=X)
-        self.train, self.test = train_test_split(self.df, test_size=0.1, random_state=42)
-        train_idx = self.train.index
-        test_idx = self.test.index
+        self.train_idx = train_idx
+        self.test_idx = test_idx
         self.X = X[train_idx]
         self.y = y[train_idx].astype(int)
         self.X_test = X[test_idx]
@@ -36,7 +597,8 @@ class DebugRule:
         self.filter_threshold = filter_threshold
         self.num_bin = np.ones(shape=self.X.shape[1]) * 3
         # the last col is always y_pred or label
-        self.num_bin[-1] = np.unique(self.all[:,-1]).shape[0]
+        last_col = self.all[:,-1].toarray() if sparse.issparse(self.all) else self.all[:,-1]
+        self.num_bin[-1] = np.unique(last_col).shape[0]
         self.num_bin = self.num_bin.astype(int)
         self.dataname = dataname
 
@@ -55,14 +617,13 @@ class DebugRule:
         return self
 
     def transform(self, X):
-        cate_X = []
         num_bin = 3
         # the last col is always y_pred or label
-        for col_idx in range(X.shape[1]-1):
-            cate_X.append([self.transform_func(col_idx, ele, num_bin) for ele in X[:, col_idx]])
-        cate_X.append(X[:, -1])
-        
-        cate_X = np.transpose(np.array(cate_X))
+        thresholds = self.thresholds[:X.shape[1]-1, :num_bin-1]
+        # same as transform_func: the first threshold not below the value, or the last bin
+        below = X[:, :-1, np.newaxis] <= thresholds[np.newaxis, :, :]
+        bins = np.where(below.any(axis=2), below.argmax(axis=2), num_bin-1)
+        cate_X = np.column_stack([bins, X[:, -1]])
         return cate_X
 
     def transform_func(self, col_idx, ele, num_bin):
@@ -71,19 +632,46 @@ class DebugRule:
                 return i
         return num_bin-1
 
-    def train_surrogate_random_forest(self):
+    def train_surrogate_random_forest(self, n_jobs=None, prescreen=None, prescreen_k=PRESCREEN_K, cache_dir=None):
+        '''self.X may be sparse (e.g., the CSR corpus). prescreen "chi2" or "mutual_info" only fits the
+        forest on the prescreen_k most relevant columns (see prescreen_scores), the other columns get
+        an importance of 0. n_jobs defaults to the n_jobs of initialize. With cache_dir, the importances
+        are saved under a hash of the data and the parameters, and loaded instead of training again'''
         self.forest_model = "Random"
-        rfc=RandomForestClassifier(random_state=1234, n_estimators=100,
-            min_samples_leaf=50, 
-            max_depth=3,
-            class_weight="balanced_subsample")
+        params = {'random_state': 1234, 'n_estimators': 100, 'min_samples_leaf': 50,
+            'max_depth': 3, 'class_weight': "balanced_subsample"}
+        cache_path = None
+        if (cache_dir is not None):
+            key = surrogate_key(self.X, self.y, dict(params, prescreen=prescreen,
+                prescreen_k=prescreen_k if prescreen is not None else None, sklearn=sklearn.__version__))
+            cache_path = os.path.join(cache_dir, "surrogate_"+key+".npy")
+            if (os.path.exists(cache_path)):
+                self.importances = np.load(cache_path)
+                if (self.verbose):
+                    print("***** load surrogate random forest importances from cache *****")
+                return self
 
-        rfc.fit(self.X, self.y)
+        X = self.X
+        columns = np.arange(self.X.shape[1])
+        if (prescreen is not None and prescreen_k < self.X.shape[1]):
+            scores = prescreen_scores(X, self.y, prescreen)
+            columns = np.sort(np.argsort(-scores, kind='stable')[:prescreen_k])
+            X = X[:, columns]
+        rfc=RandomForestClassifier(n_jobs=self.n_jobs if n_jobs is None else n_jobs, **params)
+
+        rfc.fit(X, self.y)
         if (self.verbose):
             print("***** finish training surrogate random forest *****")
-           
-        self.importances = rfc.feature_importances_
-        
+
+        self.importances = np.zeros(shape=self.X.shape[1])
+        self.importances[columns] = rfc.feature_importances_
+        if (cache_path is not None):
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as output:
+                np.save(output, self.importances)
+            os.replace(tmp_path, cache_path)
+
         return self
 
     def extract_debug_rules(self):
@@ -94,7 +682,9 @@ class DebugRule:
         self.calculate_pval()
         return self
 
-    def extract_token_rule(self):
+    def extract_token_rule(self, method="sparse"):
+        '''method "sparse" counts all token pairs with sparse matrix products,
+        "loop" checks the pairs one by one'''
         self.get_important_matrix()
         self.rules = []
         error_rates = np.zeros(shape=self.good_token_idx.shape[0])
@@ -119,6 +709,18 @@ class DebugRule:
         largest_indices = token_order[::-1][:10]
         self.top_token_list = [{"feature": int(x), "err_rate": error_rates[x]} for x in largest_indices]
 
+        if (method == "loop"):
+            self.extract_token_pair_rule_loop(error_rates)
+        elif (self.n_jobs > 1):
+            arrays = {'X': self.good_X, 'y': self.y, 'X_test': self.good_testX, 'y_test': self.y_test,
+                'error_rates': error_rates}
+            self.rules.extend(self.mine_parallel("token", arrays, len(self.good_token_idx)))
+        else:
+            miner = TokenPairMiner(self.good_X, self.y, self.good_testX, self.y_test,
+                error_rates, self.filter_threshold)
+            self.rules.extend(miner.mine(0, len(self.good_token_idx)))
+
+    def extract_token_pair_rule_loop(self, error_rates):
         for i in range(len(self.good_token_idx)):
             for j in range(i+1, len(self.good_token_idx)):
                 error_idx = np.where(np.logical_and(self.good_X[:, i], self.good_X[:, j]) == 1)[0]
@@ -141,7 +743,9 @@ class DebugRule:
                         'err_rate_test': err_rate_test,
                     })
 
-    def extract_high_level_rule(self):
+    def extract_high_level_rule(self, method="matrix"):
+        '''method "matrix" counts all pairs of (feature, val) with one-hot matrix products,
+        "loop" checks the pairs one by one'''
         self.rules = []
         error_rates = np.zeros(shape=self.X.shape[1])
         error_rate_vals = np.zeros(shape=self.X.shape[1])
@@ -170,6 +774,18 @@ class DebugRule:
         largest_indices = hfeat_order[::-1][:5]
         self.top_hfeat_list = [{"feature": int(x), "val": error_rate_vals[x], "err_rate": error_rates[x]} for x in largest_indices]
 
+        if (method == "loop"):
+            self.extract_high_level_pair_rule_loop(error_rates)
+        elif (self.n_jobs > 1):
+            arrays = {'X': self.X, 'y': self.y, 'X_test': self.X_test, 'y_test': self.y_test,
+                'num_bin': self.num_bin, 'error_rates': error_rates}
+            self.rules.extend(self.mine_parallel("hfeat", arrays, self.X.shape[1]))
+        else:
+            miner = HfeatPairMiner(self.X, self.y, self.X_test, self.y_test,
+                self.num_bin, error_rates, self.filter_threshold)
+            self.rules.extend(miner.mine(0, self.X.shape[1]))
+
+    def extract_high_level_pair_rule_loop(self, error_rates):
         for i in range(self.X.shape[1]):
             for val_i in range(self.num_bin[i]):
                 temp_cond = (self.X[:, i] == val_i)
@@ -197,45 +813,310 @@ class DebugRule:
                             })
 
 
+    def one_hot_bins(self, X):
+        '''doc x (feature, val) indicator matrix, vals of feature i in range(num_bin[i])'''
+        X = np.asarray(X).astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(self.num_bin)[:-1]])
+        rows, cols = np.nonzero((X >= 0) & (X < self.num_bin[np.newaxis, :]))
+        return sparse.csc_matrix((np.ones(rows.shape[0], dtype=np.int64), (rows, offsets[cols] + X[rows, cols])),
+            shape=(X.shape[0], int(self.num_bin.sum())))
+
+    def extract_deep_rules(self, rule_type, max_depth=DEEP_MAX_DEPTH, time_budget=None, memory_budget_mb=DEEP_MEMORY_MB):
+        '''rules of up to max_depth conditions with LevelwiseMiner, into self.rules. rule_type "token"
+        uses the tokens of the surrogate forest, "hfeat" the binned high-level features (after
+        numerical2ordinal); self.deep_stats tells if the time or memory budget cut the search short'''
+        if (rule_type == "token"):
+            self.get_important_matrix()
+            miner = LevelwiseMiner(self.good_X, self.y, self.good_testX, self.y_test,
+                np.arange(self.good_X.shape[1]), lambda item: {'feature': item, 'sign': '>'}, self.filter_threshold)
+        elif (rule_type == "hfeat"):
+            item_feature = np.repeat(np.arange(self.X.shape[1]), self.num_bin)
+            item_val = np.concatenate([np.arange(num_val) for num_val in self.num_bin])
+            miner = LevelwiseMiner(self.one_hot_bins(self.X), self.y, self.one_hot_bins(self.X_test), self.y_test, item_feature,
+                lambda item: {'feature': int(item_feature[item]), 'sign': '=', 'val': int(item_val[item])}, self.filter_threshold)
+        else:
+            raise ValueError("unknown rule type: "+str(rule_type))
+        self.rules = miner.mine(max_depth, time_budget, memory_budget_mb)
+        self.deep_stats = miner.stats
+        if (self.verbose):
+            print("***** %d rules of up to %d conditions in %.1fs *****" % (len(self.rules), max_depth, miner.stats['elapsed']))
+        return self
+
+    def build_support(self, rule_type):
+        '''keep the docs of the candidate rules, so the rules of another error vector of the same
+        docs are mined by update_rules. rule_type "token" uses the tokens of the surrogate forest
+        (after extract_token_rule), "hfeat" the binned high-level features (after numerical2ordinal)'''
+        train_idx = np.asarray(self.train_idx)
+        test_idx = np.asarray(self.test_idx)
+        min_support = self.filter_threshold['support']
+        if (rule_type == "token"):
+            num_item = self.good_X.shape[1]
+            self.support = RuleSupport.build("token", self.good_X, self.good_testX,
+                np.arange(num_item), np.zeros(num_item, dtype=np.int64), None, train_idx, test_idx, min_support)
+            self.support.extra['good_token_idx'] = self.good_token_idx
+        elif (rule_type == "hfeat"):
+            item_feature = np.repeat(np.arange(self.X.shape[1]), self.num_bin)
+            item_val = np.concatenate([np.arange(num_val) for num_val in self.num_bin])
+            self.support = RuleSupport.build("hfeat", self.one_hot_bins(self.X), self.one_hot_bins(self.X_test),
+                item_feature, item_val, self.num_bin, train_idx, test_idx, min_support)
+            self.support.extra['num_bin'] = self.num_bin
+            if (hasattr(self, 'thresholds')):
+                self.support.extra['thresholds'] = self.thresholds
+        else:
+            raise ValueError("unknown rule type: "+str(rule_type))
+        return self
+
+    def save_support(self, folder):
+        self.support.save(folder)
+        return self
+
+    def load_support(self, folder, filter_threshold, verbose=False):
+        '''instead of initialize, when only the error vector changed since build_support'''
+        self.support = RuleSupport.load(folder)
+        self.filter_threshold = filter_threshold
+        self.verbose = verbose
+        self.n_jobs = 1
+        self.model_err_rate = .3
+        for key, val in self.support.extra.items():
+            setattr(self, key, val)
+        return self
+
+    def update_rules(self, y, filter_threshold=None):
+        '''rules of a new error vector from the saved supports: the same rules as rerunning the
+        extraction with the same tokens or features, without touching the doc matrices'''
+        support = self.support
+        if (filter_threshold is not None):
+            self.filter_threshold = filter_threshold
+        if (self.filter_threshold['support'] < support.min_support):
+            raise ValueError("the supports were kept for a support threshold of %d" % support.min_support)
+        y = np.asarray(y)
+        if (y.shape[0] != support.train_idx.shape[0] + support.test_idx.shape[0]):
+            raise ValueError("y has %d docs, the supports %d" % (y.shape[0], support.train_idx.shape[0] + support.test_idx.shape[0]))
+        self.y = y[support.train_idx].astype(int)
+        self.y_test = y[support.test_idx].astype(int)
+
+        tot, err, tot_test, err_test = support.count(self.y, self.y_test)
+        num_item = support.item_feature.shape[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = err / tot
+            rate_test = err_test / tot_test
+        # pairs without docs have a rate of 0, single conditions a nan rate, as in the extraction
+        rate[num_item:] = np.where(tot[num_item:] > 0, rate[num_item:], 0)
+
+        # the rate of a token, or of the most error-prone val of a high-level feature
+        if (support.rule_type == "token"):
+            error_rates = rate[:num_item]
+        else:
+            error_rates = np.zeros(shape=int(support.item_feature.max())+1 if num_item > 0 else 0)
+            np.maximum.at(error_rates, support.item_feature, np.nan_to_num(rate[:num_item]))
+
+        passed = (rate > self.filter_threshold['err_rate']) & (tot > self.filter_threshold['support'])
+        pair_rate = rate[num_item:]
+        pair_feature = support.item_feature[support.pairs]
+        passed[num_item:] &= (pair_rate > error_rates[pair_feature[:, 0]]) & (pair_rate > error_rates[pair_feature[:, 1]])
+
+        self.rules = []
+        for ix in np.flatnonzero(passed).tolist():
+            items = [ix] if ix < num_item else support.pairs[ix-num_item].tolist()
+            if (support.rule_type == "token"):
+                conds = [{'feature': int(support.item_feature[item]), 'sign': '>'} for item in items]
+            else:
+                conds = [{'feature': int(support.item_feature[item]), 'sign': '=', 'val': int(support.item_val[item])} for item in items]
+            self.rules.append({
+                'rules': conds,
+                'doc_idx': support.members.indices[support.members.indptr[ix]:support.members.indptr[ix+1]].tolist(),
+                'doc_idx_test': support.members_test.indices[support.members_test.indptr[ix]:support.members_test.indptr[ix+1]].tolist(),
+                'err_rate': rate[ix],
+                # the int 0 of the extraction for pairs without test docs
+                'err_rate_test': 0 if (ix >= num_item and tot_test[ix] == 0) else rate_test[ix],
+            })
+
+        if (support.rule_type == "token"):
+            largest_indices = np.argsort(error_rates)[::-1][:10]
+            self.top_token_list = [{"feature": int(x), "err_rate": error_rates[x]} for x in largest_indices]
+        else:
+            error_rate_vals = np.zeros(shape=error_rates.shape[0])
+            best = np.zeros(shape=error_rates.shape[0])
+            for item in range(num_item):
+                feature = support.item_feature[item]
+                if (best[feature] < rate[item]):
+                    best[feature] = rate[item]
+                    error_rate_vals[feature] = support.item_val[item]
+            largest_indices = np.argsort(error_rates)[::-1][:5]
+            self.top_hfeat_list = [{"feature": int(x), "val": error_rate_vals[x], "err_rate": error_rates[x]} for x in largest_indices]
+        return self
+
+    def mine_parallel(self, kind, arrays, num_feat):
+        # shards are merged in order, so the rules are the same as mining in one process
+        shared = SharedArrays(arrays)
+        rules = []
+        try:
+            with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=init_worker,
+                    initargs=(kind, shared.paths, {'filter_threshold': self.filter_threshold})) as pool:
+                for shard_rules in pool.map(mine_shard, split_shards(num_feat, self.n_jobs*4)):
+                    rules.extend(shard_rules)
+        finally:
+            shared.close()
+        return rules
+
+    def map_rules_parallel(self, func, seed=None):
+        # doc lists of all rules are shared as one flat array, a task is a range of rules
+        doc_idx = [rule['doc_idx'] for rule in self.rules]
+        offsets = np.concatenate([[0], np.cumsum([len(x) for x in doc_idx])]).astype(np.int64)
+        flat_idx = np.concatenate([np.asarray(x, dtype=np.int64) for x in doc_idx] + [np.zeros(0, dtype=np.int64)])
+        shared = SharedArrays({'y': self.y, 'doc_idx': flat_idx, 'offsets': offsets})
+        num_shard = self.n_jobs*4
+        bounds = np.linspace(0, len(self.rules), num_shard+1).astype(int).tolist()
+        res = []
+        try:
+            with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=init_rule_worker,
+                    initargs=(shared.paths, seed)) as pool:
+                for shard_res in pool.map(func, list(zip(bounds[:-1], bounds[1:]))):
+                    res.extend(shard_res)
+        finally:
+            shared.close()
+        return res
+
     def get_important_matrix(self):
         if (np.sum(self.importances) > 0):
             self.good_token_idx = np.where(self.importances > 0)[0]
             print("tokens with importance > 0,", self.good_token_idx.shape[0])
         else:
-            self.good_token_idx = np.range(self.importances.shape[0])
-        self.good_X = self.X[:, self.good_token_idx]
-        self.good_testX = self.X_test[:, self.good_token_idx]
-        self.good_all = self.all[:, self.good_token_idx]
+            self.good_token_idx = np.arange(self.importances.shape[0])
+        # binarized once: a token rule matches the docs having the token, whatever its count
+        self.good_X = self.X[:, self.good_token_idx] != 0
+        self.good_testX = self.X_test[:, self.good_token_idx] != 0
+        self.good_all = self.all[:, self.good_token_idx] != 0
+        self.good_cols = None if self.columns is None else [self.columns[ix] for ix in self.good_token_idx]
+        if (sparse.issparse(self.X)):
+            # the rules are mined on the few important tokens, as dense columns
+            self.good_X = self.good_X.toarray()
+            self.good_testX = self.good_testX.toarray()
+            self.good_all = self.good_all.toarray()
+        self.good_X = self.good_X.astype(int)
+        self.good_testX = self.good_testX.astype(int)
+        self.good_all = self.good_all.astype(int)
 
-    def get_subgroup_similarity(self):
-        A =  np.array(self.good_X.T)
-        A_sparse = sparse.csr_matrix(A)
-        self.similarities = cosine_similarity(A_sparse)
+    def get_subgroup_similarity(self, top_k=SIMILARITY_TOP_K, threshold=SIMILARITY_THRESHOLD):
+        '''sparse (token x token) cosine similarity of the good tokens, top_k per token'''
+        self.similarities = top_k_similarity(sparse.csc_matrix(self.good_X), top_k, threshold)
+        return self
 
-    def extract_or_rules(self):
-        similarity_threshold = 0.50
+    def extract_or_rules(self, similarity_threshold=SIMILARITY_THRESHOLD, top_k=SIMILARITY_TOP_K, max_size=OR_MAX_SIZE):
+        '''concept rules: an OR of similar tokens, grown greedily from each token by adding the similar
+        token whose docs raise the error rate of the union the most, after extract_token_rule.
+        The union is counted incrementally from the docs of the added token not yet covered.
+        The server matches the tokens of a concept by name, so the rules list the names of the tokens'''
+        if (self.good_cols is None):
+            raise ValueError("extract_or_rules needs the token names, initialize(..., columns=input_columns)")
+        self.get_subgroup_similarity(top_k, similarity_threshold)
+        X_bin = sparse.csc_matrix(self.good_X)
+        X_test_bin = sparse.csc_matrix(self.good_testX)
+        X_bin.sort_indices()
+        X_test_bin.sort_indices()
+        column_rows = lambda X, i: X.indices[X.indptr[i]:X.indptr[i+1]]
+        neighbors = lambda i: self.similarities.indices[self.similarities.indptr[i]:self.similarities.indptr[i+1]].tolist()
 
+        self.or_rules = []
+        seen = set()
+        covered = np.zeros(shape=X_bin.shape[0], dtype=bool)
+        for seed in range(X_bin.shape[1]):
+            group = [seed]
+            parts = [column_rows(X_bin, seed)]
+            covered[parts[0]] = True
+            tot = parts[0].shape[0]
+            err = int(self.y[parts[0]].sum())
+            candidates = set(neighbors(seed))
+            while (len(group) < max_size and len(candidates) > 0):
+                best = None
+                for cand in sorted(candidates):
+                    rows = column_rows(X_bin, cand)
+                    added = rows[~covered[rows]]
+                    new_tot = tot + added.shape[0]
+                    new_err = err + int(self.y[added].sum())
+                    # rates compared as fractions, new_err/new_tot > err/tot
+                    if (new_err * tot > err * new_tot and (best is None or new_err * best[2] > best[3] * new_tot)):
+                        best = (cand, added, new_tot, new_err)
+                if (best is None):
+                    break
+                cand, added, tot, err = best
+                group.append(cand)
+                parts.append(added)
+                covered[added] = True
+                candidates = (candidates | set(neighbors(cand))) - set(group)
+            for part in parts:
+                covered[part] = False
 
-    def get_p_right(self, doc_err_list, threshold):
-        pop_mean = doc_err_list.mean()
-        t, p_two = stats.ttest_1samp(doc_err_list, threshold)
-        p_one = p_two/2
-        return t, p_one
+            key = frozenset(group)
+            if (len(group) < 2 or key in seen or tot <= self.filter_threshold['support'] or err/tot <= self.filter_threshold['err_rate']):
+                continue
+            seen.add(key)
+            error_idx = np.sort(np.concatenate(parts))
+            error_idx_test = np.unique(np.concatenate([column_rows(X_test_bin, i) for i in group]))
+            err_rate_test = 0
+            if (error_idx_test.shape[0] > 0):
+                err_rate_test = np.sum(self.y_test[error_idx_test])/error_idx_test.shape[0]
+            self.or_rules.append({
+                'rules': [{'feature': "concept", 'sign': 'is', 'val': [self.good_cols[ix] for ix in sorted(group)]}],
+                'doc_idx': error_idx.tolist(),
+                'doc_idx_test': error_idx_test.tolist(),
+                'err_rate': err/tot,
+                'err_rate_test': err_rate_test,
+            })
+        return self
 
-    def calculate_pval(self):
-        for rule in self.rules:
-            doc_err_list = self.y[rule['doc_idx']]
-            t, p_one = self.get_p_right(doc_err_list, self.model_err_rate)
-            rule['t_val'] = t
-            rule['p_one'] = p_one
+
+    def rule_counts(self):
+        '''support and error count of every rule'''
+        tot = np.array([len(rule['doc_idx']) for rule in self.rules], dtype=np.int64)
+        flat_idx = np.concatenate([np.asarray(rule['doc_idx'], dtype=np.int64) for rule in self.rules] + [np.zeros(0, dtype=np.int64)])
+        rule_ids = np.repeat(np.arange(len(self.rules)), tot)
+        error_count = np.bincount(rule_ids, weights=self.y[flat_idx], minlength=len(self.rules))
+        return tot, error_count
+
+    def calculate_pval(self, method="ttest"):
+        '''p-values of all rules at once from their counts (see count_pval), and their
+        Benjamini-Hochberg q-values over all rules'''
+        tot, error_count = self.rule_counts()
+        stat, p_one = count_pval(error_count, tot, self.model_err_rate, method)
+        q_val = benjamini_hochberg(p_one)
+        for ix, rule in enumerate(self.rules):
+            if (method == "ttest"):
+                rule['t_val'] = stat[ix]
+            elif (method == "ztest"):
+                rule['z_val'] = stat[ix]
+            rule['p_one'] = p_one[ix]
+            rule['q_val'] = q_val[ix]
+
+    def significant_rules(self, fdr=0.05):
+        '''rules with an error rate above the model's and a q-value of at most fdr, the q-values
+        are computed by calculate_pval() when missing (e.g., after update_rules)'''
+        if (any(['q_val' not in rule for rule in self.rules])):
+            self.calculate_pval()
+        return [rule for rule in self.rules if rule['err_rate'] > self.model_err_rate and rule['q_val'] <= fdr]
 
     # calculate 0.95 confidence interval (CI)
-    def calculate_ci(self):
-        for rule in self.rules:
-            doc_err_list = (self.y[rule['doc_idx']],)
-            res = bootstrap(doc_err_list, np.mean, confidence_level=0.95, random_state=np.random.default_rng())
-            ci_l, ci_u = res.confidence_interval
-            rule['ci'] = [ci_l, ci_u]
+    def calculate_ci(self, method="wilson", seed=1234):
+        '''method "wilson" or "clopper_pearson" computes the CIs of all rules at once,
+        "bootstrap" resamples the docs of each rule, seeded by (seed, rule index)'''
+        if (method == "bootstrap"):
+            if (self.n_jobs > 1):
+                cis = self.map_rules_parallel(ci_shard, seed=seed)
+            else:
+                cis = [list(bootstrap_ci(self.y[rule['doc_idx']], seed=[seed, ix])) for ix, rule in enumerate(self.rules)]
+            for rule, ci in zip(self.rules, cis):
+                rule['ci'] = ci
+            return
+
+        tot, error_count = self.rule_counts()
+        if (method == "clopper_pearson"):
+            ci_l, ci_u = clopper_pearson_ci(error_count, tot)
+        elif (method == "wilson"):
+            ci_l, ci_u = wilson_ci(error_count, tot)
+        else:
+            raise ValueError("unknown CI method: "+str(method))
+        for rule, l, u in zip(self.rules, ci_l.tolist(), ci_u.tolist()):
+            rule['ci'] = [l, u]
 
 
 
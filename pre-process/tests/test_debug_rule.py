@@ -0,0 +1,225 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import itertools
+import os
+import sys
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import debug_rule
+
+FILTER_THRESHOLD = {'support': 20, 'err_rate': .1}
+
+
+def token_data(seed=0, num_doc=4000, num_token=30):
+    rng = np.random.default_rng(seed)
+    X = (rng.random((num_doc, num_token)) < rng.uniform(.05, .4, num_token)).astype(int)
+    # a base error rate below the model's, token 3 raises it above
+    y = (rng.random(num_doc) < .2 + .3*X[:, 3]).astype(int)
+    return X, y
+
+def token_rules(X, y, filter_threshold=FILTER_THRESHOLD):
+    drule_obj = debug_rule.DebugRule().initialize(X, y, filter_threshold)
+    drule_obj.importances = np.ones(X.shape[1])
+    drule_obj.extract_token_rule()
+    return drule_obj
+
+def test_rules_below_model_error_rate_are_not_significant():
+    X, y = token_data()
+    for method in ["ttest", "ztest", "binomial"]:
+        drule_obj = token_rules(X, y)
+        assert any([rule['err_rate'] < drule_obj.model_err_rate for rule in drule_obj.rules])
+        drule_obj.calculate_pval(method)
+        for rule in drule_obj.rules:
+            if (rule['err_rate'] < drule_obj.model_err_rate):
+                assert rule['p_one'] > .5
+        significant = drule_obj.significant_rules(0.05)
+        assert len(significant) > 0
+        assert all([rule['err_rate'] > drule_obj.model_err_rate for rule in significant])
+
+def test_significant_rules_without_calculate_pval():
+    X, y = token_data()
+    drule_obj = token_rules(X, y)
+    significant = drule_obj.significant_rules(0.05)
+    assert all(['q_val' in rule for rule in drule_obj.rules])
+    assert len(significant) > 0
+
+def assert_same_rules(rules, expected):
+    assert len(rules) == len(expected)
+    for rule, expected_rule in zip(rules, expected):
+        assert rule['rules'] == expected_rule['rules']
+        assert rule['doc_idx'] == expected_rule['doc_idx']
+        assert rule['doc_idx_test'] == expected_rule['doc_idx_test']
+        for key in ['err_rate', 'err_rate_test']:
+            # same values and types, so the list.json files are the same
+            assert type(rule[key]) == type(expected_rule[key])
+            assert np.isclose(rule[key], expected_rule[key], equal_nan=True)
+
+def test_update_rules_matches_token_extraction(tmp_path):
+    X, y = token_data(num_doc=1500, num_token=40)
+    drule_obj = token_rules(X, y)
+    drule_obj.build_support("token").save_support(str(tmp_path))
+
+    rng = np.random.default_rng(1)
+    new_y = (rng.random(X.shape[0]) < .2 + .4*X[:, 7]*X[:, 9]).astype(int)
+    expected = token_rules(X, new_y)
+    updated = debug_rule.DebugRule().load_support(str(tmp_path), FILTER_THRESHOLD).update_rules(new_y)
+    # pairs without test docs are covered
+    assert any([len(rule['rules']) == 2 and len(rule['doc_idx_test']) == 0 for rule in expected.rules])
+    assert_same_rules(updated.rules, expected.rules)
+
+def hfeat_data(seed=0, num_doc=2000):
+    rng = np.random.default_rng(seed)
+    # counts and the model prediction as the last column
+    H = np.column_stack([rng.poisson(3, (num_doc, 6)).astype(float), rng.integers(0, 3, num_doc)])
+    y = (rng.random(num_doc) < .2 + .3*(H[:, 0] > 5)).astype(int)
+    return H, y, rng
+
+def test_update_rules_matches_high_level_extraction(tmp_path):
+    H, y, rng = hfeat_data()
+    drule_obj = debug_rule.DebugRule().initialize(H, y, FILTER_THRESHOLD).numerical2ordinal()
+    drule_obj.build_support("hfeat").save_support(str(tmp_path))
+
+    new_y = (rng.random(2000) < .2 + .4*(H[:, 1] < 2)).astype(int)
+    expected = debug_rule.DebugRule().initialize(H, new_y, FILTER_THRESHOLD).numerical2ordinal()
+    expected.extract_high_level_rule()
+    updated = debug_rule.DebugRule().load_support(str(tmp_path), FILTER_THRESHOLD).update_rules(new_y)
+    assert_same_rules(updated.rules, expected.rules)
+
+def test_or_rules_list_token_names():
+    X, y = token_data(num_doc=3000)
+    # tokens 3 and 5 appear in the same docs, each raises the error rate
+    X[:, 5] = X[:, 3] | (np.random.default_rng(2).random(X.shape[0]) < .05)
+    columns = ["token_"+str(ix) for ix in range(X.shape[1])]
+    drule_obj = debug_rule.DebugRule().initialize(X, y, FILTER_THRESHOLD, columns=columns)
+    drule_obj.importances = np.ones(X.shape[1])
+    drule_obj.extract_token_rule()
+    drule_obj.extract_or_rules(similarity_threshold=.3)
+    assert len(drule_obj.or_rules) > 0
+    for rule in drule_obj.or_rules:
+        cond = rule['rules'][0]
+        assert cond['feature'] == "concept" and all([val in columns for val in cond['val']])
+        # the docs of the rule are those with any of its tokens
+        cols = [columns.index(val) for val in cond['val']]
+        assert rule['doc_idx'] == np.flatnonzero(drule_obj.X[:, cols].any(axis=1)).tolist()
+
+def rule_key(rule):
+    return [(cond['feature'], cond.get('val')) for cond in rule['rules']]
+
+def test_sparse_token_pairs_match_loop():
+    X, y = token_data(num_doc=2000, num_token=25)
+    expected = debug_rule.DebugRule().initialize(X, y, FILTER_THRESHOLD)
+    expected.importances = np.ones(X.shape[1])
+    expected.extract_token_rule(method="loop")
+    drule_obj = token_rules(X, y)
+    assert any([len(rule['rules']) == 2 for rule in expected.rules])
+    assert_same_rules(sorted(drule_obj.rules, key=rule_key), sorted(expected.rules, key=rule_key))
+
+def test_transform_matches_transform_func():
+    H, y, rng = hfeat_data()
+    drule_obj = debug_rule.DebugRule().initialize(H, y, FILTER_THRESHOLD)
+    binned = drule_obj.numerical2ordinal().all
+    # values on the thresholds
+    H[:10, :-1] = drule_obj.thresholds[:-1, 0]
+    expected = [[drule_obj.transform_func(col, H[row, col], 3) for col in range(H.shape[1]-1)] for row in range(H.shape[0])]
+    assert np.array_equal(drule_obj.transform(H)[:, :-1], expected)
+    assert np.array_equal(binned[:, -1], H[:, -1])
+
+def test_high_level_pairs_match_loop():
+    H, y, rng = hfeat_data()
+    rules = []
+    for method in ["matrix", "loop"]:
+        drule_obj = debug_rule.DebugRule().initialize(H, y, FILTER_THRESHOLD).numerical2ordinal()
+        drule_obj.extract_high_level_rule(method)
+        rules.append(sorted(drule_obj.rules, key=rule_key))
+    assert any([len(rule['rules']) == 2 for rule in rules[1]])
+    assert_same_rules(rules[0], rules[1])
+
+def test_parallel_mining_matches_serial():
+    X, y = token_data(num_doc=2000)
+    H, y_hfeat, rng = hfeat_data()
+    rules = []
+    for n_jobs in [1, 2]:
+        drule_obj = debug_rule.DebugRule().initialize(X, y, FILTER_THRESHOLD, n_jobs=n_jobs)
+        drule_obj.importances = np.ones(X.shape[1])
+        drule_obj.extract_token_rule()
+        hfeat_obj = debug_rule.DebugRule().initialize(H, y_hfeat, FILTER_THRESHOLD, n_jobs=n_jobs).numerical2ordinal()
+        hfeat_obj.extract_high_level_rule()
+        mined = drule_obj.rules
+        # the bootstrap is seeded by rule, whichever process resamples it
+        drule_obj.rules = mined[-30:]
+        drule_obj.calculate_ci("bootstrap")
+        rules.append((mined, hfeat_obj.rules))
+    # the shards are merged in order
+    assert any([len(rule['rules']) == 2 for rule in rules[0][0]])
+    assert_same_rules(rules[1][0], rules[0][0])
+    assert_same_rules(rules[1][1], rules[0][1])
+    assert [rule['ci'] for rule in rules[1][0][-30:]] == [rule['ci'] for rule in rules[0][0][-30:]]
+
+def brute_force_rules(X, y, max_depth, filter_threshold=FILTER_THRESHOLD):
+    # all token combinations above the thresholds and above the error rate of all their subsets
+    def err_rate(items):
+        rows = np.flatnonzero(X[:, list(items)].all(axis=1))
+        return (y[rows].mean() if rows.shape[0] > 0 else 0), rows.shape[0]
+    rules = []
+    for depth in range(1, max_depth+1):
+        for items in itertools.combinations(range(X.shape[1]), depth):
+            rate, support = err_rate(items)
+            if (support <= filter_threshold['support'] or rate <= filter_threshold['err_rate']):
+                continue
+            subsets = [sub for size in range(1, depth) for sub in itertools.combinations(items, size)]
+            if (all([rate > err_rate(sub)[0] for sub in subsets])):
+                rules.append([(item, None) for item in items])
+    return sorted(rules)
+
+def test_deep_rules_match_pairs_and_brute_force():
+    X, y = token_data(num_doc=1500, num_token=12)
+    y = (y | (X[:, 1] & X[:, 2] & X[:, 4])).astype(int)
+    drule_obj = token_rules(X, y)
+    deep_obj = token_rules(X, y)
+    deep_obj.extract_deep_rules("token", max_depth=2)
+    assert_same_rules(sorted(deep_obj.rules, key=rule_key), sorted(drule_obj.rules, key=rule_key))
+
+    deep_obj.extract_deep_rules("token", max_depth=3)
+    assert any([len(rule['rules']) == 3 for rule in deep_obj.rules])
+    assert sorted([rule_key(rule) for rule in deep_obj.rules]) == brute_force_rules(deep_obj.good_X, deep_obj.y, 3)
+    for rule in deep_obj.rules:
+        cols = [cond['feature'] for cond in rule['rules']]
+        assert rule['doc_idx'] == np.flatnonzero(deep_obj.good_X[:, cols].all(axis=1)).tolist()
+        assert rule['doc_idx_test'] == np.flatnonzero(deep_obj.good_testX[:, cols].all(axis=1)).tolist()
+
+def test_token_counts_are_binarized_once(tmp_path):
+    X, y = token_data(num_doc=1500, num_token=20)
+    # a corpus of counts, a token rule matches the docs having the token
+    counts = X * np.random.default_rng(3).integers(1, 4, X.shape)
+    drule_obj = token_rules(counts, y)
+    assert_same_rules(drule_obj.rules, token_rules(X, y).rules)
+    for rule in drule_obj.rules:
+        cols = [cond['feature'] for cond in rule['rules']]
+        assert rule['doc_idx'] == np.flatnonzero((drule_obj.X[:, cols] != 0).all(axis=1)).tolist()
+
+    expected = debug_rule.DebugRule().initialize(counts, y, FILTER_THRESHOLD)
+    expected.importances = np.ones(X.shape[1])
+    expected.extract_token_rule(method="loop")
+    drule_obj.build_support("token").save_support(str(tmp_path))
+    updated = debug_rule.DebugRule().load_support(str(tmp_path), FILTER_THRESHOLD).update_rules(y)
+    assert_same_rules(sorted(updated.rules, key=rule_key), sorted(expected.rules, key=rule_key))
+    assert_same_rules(sorted(drule_obj.rules, key=rule_key), sorted(expected.rules, key=rule_key))
+
+def test_sparse_corpus_matches_dense():
+    X, y = token_data(num_doc=2000)
+    dense_obj = debug_rule.DebugRule().initialize(X, y, FILTER_THRESHOLD).train_surrogate_random_forest()
+    sparse_obj = debug_rule.DebugRule().initialize(sparse.csr_matrix(X), y, FILTER_THRESHOLD).train_surrogate_random_forest()
+    # same split, the DataFrames of the split are only kept for a dense X
+    assert np.array_equal(sparse_obj.train_idx, dense_obj.train_idx) and np.array_equal(sparse_obj.test_idx, dense_obj.test_idx)
+    assert np.array_equal(dense_obj.train.index, dense_obj.train_idx)
+    assert sparse_obj.df is None and sparse_obj.train is None and sparse_obj.test is None
+    assert np.allclose(sparse_obj.importances, dense_obj.importances)
+    sparse_obj.importances = dense_obj.importances
+    dense_obj.extract_token_rule()
+    sparse_obj.extract_token_rule()
+    assert_same_rules(sparse_obj.rules, dense_obj.rules)
@@ -0,0 +1,42 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Per-call latency of the CI methods used by /update_concept.
+# Run inside the ui/ folder: python server/benchmarks/bench_ci.py
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_explorer import confidence
+
+SIZES = [100, 1000, 10000, 100000]
+# bootstrap takes seconds per call beyond this size
+MAX_BOOTSTRAP_SIZE = 10000
+METHODS = [confidence.WILSON, confidence.CLOPPER_PEARSON, confidence.BOOTSTRAP]
+REPEAT = 3
+
+
+def timeit(func):
+	elapsed = []
+	for i in range(REPEAT):
+		start = time.perf_counter()
+		res = func()
+		elapsed.append(time.perf_counter() - start)
+	return res, np.median(elapsed)
+
+
+if __name__ == "__main__":
+	rng = np.random.default_rng(0)
+	print("%10s %16s %12s %24s" % ("docs", "method", "latency(ms)", "ci"))
+	for size in SIZES:
+		is_error = (rng.random(size) < .3).astype(int)
+		for method in METHODS:
+			if (method == confidence.BOOTSTRAP and size > MAX_BOOTSTRAP_SIZE):
+				continue
+			ci, elapsed = timeit(lambda: confidence.error_rate_ci(is_error, method))
+			print("%10d %16s %12.3f %24s" % (size, method, elapsed*1000, "[%.4f, %.4f]" % tuple(ci)))
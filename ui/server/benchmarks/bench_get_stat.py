@@ -0,0 +1,103 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Compare util.get_stat with the previous per-column groupby implementation.
+# Run inside the ui/ folder: python server/benchmarks/bench_get_stat.py
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_explorer import store
+from rule_explorer import util
+
+NUM_DOC = 100000
+SIZES = [1000, 10000, 100000]
+KEY_LIST = ['gold_label', 'genre']
+REPEAT = 5
+
+
+def write_dataset(data_dir, data_name, num_doc):
+	rng = np.random.default_rng(0)
+	os.makedirs(os.path.join(data_dir, data_name))
+	y_gt = rng.integers(0, 3, num_doc)
+	y_pred = np.where(rng.random(num_doc) < .7, y_gt, rng.integers(0, 3, num_doc))
+	pd.DataFrame({'y_gt': y_gt, 'y_pred': y_pred}).to_csv(os.path.join(data_dir, data_name, "model_output.csv"), index=False)
+	content = pd.DataFrame({
+		'sentence1': ["premise"] * num_doc,
+		'gold_label': np.array(['entailment', 'neutral', 'contradiction'])[y_gt],
+		'genre': np.array(['travel', 'government'])[rng.integers(0, 2, num_doc)],
+	})
+	with open(os.path.join(data_dir, data_name, "doc.jsonl"), "w") as json_output:
+		json_output.write(json.dumps({'content': content.to_dict("records")}))
+	hfeat_df = pd.DataFrame()
+	for col in ['ADJ', 'ADV', 'NOUN', 'PRON', 'NUM', 'doc_len', 'overlap']:
+		hfeat_df[col] = rng.integers(0, 3, num_doc).astype(float)
+	hfeat_df['pred'] = y_pred
+	hfeat_df.to_csv(os.path.join(data_dir, data_name, "hfeat_stat.csv"), index=False)
+
+
+def legacy_get_stat(dataset, doc_list, key_list):
+	# the groupby implementation, on data already in memory
+	train_data_df = dataset.docs
+	hfeat_df = dataset.hfeat_stat
+	data_df = pd.DataFrame(train_data_df.iloc[doc_list])
+	is_error = dataset.is_error[doc_list]
+
+	to_save = {}
+	cols = data_df.columns.values.tolist()
+	for key in key_list:
+		if (key not in cols):
+			continue
+		stat_df = pd.DataFrame()
+		stat_df[key] = data_df[key]
+		stat_df['is_error'] = is_error
+		to_render = stat_df.groupby([key]).sum().reset_index()
+		to_render['tot'] = stat_df.groupby([key]).count().reset_index()['is_error']
+		to_save['by_'+key] = to_render.to_dict("index")
+
+	hfeat_doc_df = pd.DataFrame(hfeat_df.iloc[doc_list])
+	for key in hfeat_df.columns:
+		stat_df = pd.DataFrame()
+		stat_df[key] = hfeat_doc_df[key]
+		stat_df['is_error'] = is_error
+		to_render = stat_df.groupby([key]).sum().reset_index()
+		to_render['tot'] = stat_df.groupby([key]).count().reset_index()['is_error']
+		to_save['by_'+key] = to_render.to_dict("index")
+	return to_save
+
+
+def timeit(func):
+	elapsed = []
+	for i in range(REPEAT):
+		start = time.perf_counter()
+		res = func()
+		elapsed.append(time.perf_counter() - start)
+	return res, np.median(elapsed)
+
+
+if __name__ == "__main__":
+	data_dir = tempfile.mkdtemp()
+	write_dataset(data_dir, "bench", NUM_DOC)
+	store.store.data_dir = data_dir
+	dataset = store.get_dataset("bench")
+
+	rng = np.random.default_rng(1)
+	print("%10s %12s %12s %8s" % ("docs", "groupby(ms)", "bincount(ms)", "speedup"))
+	for size in SIZES:
+		doc_list = np.sort(rng.choice(NUM_DOC, size=size, replace=False)).tolist()
+		# the first call also encodes the columns
+		util.get_stat("bench", doc_list, KEY_LIST)
+		expected, legacy_time = timeit(lambda: legacy_get_stat(dataset, doc_list, KEY_LIST))
+		res, new_time = timeit(lambda: util.get_stat("bench", doc_list, KEY_LIST))
+		assert json.dumps(res) == json.dumps(expected, default=lambda x: x.item())
+		print("%10d %12.2f %12.2f %7.1fx" % (size, legacy_time*1000, new_time*1000, legacy_time/new_time))
+	shutil.rmtree(data_dir)
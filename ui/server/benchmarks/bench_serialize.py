@@ -0,0 +1,50 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Encoding time of an inspect_rule response, json.dumps of python lists vs. serialize.dumps.
+# Run inside the ui/ folder: python server/benchmarks/bench_serialize.py
+
+import json
+import os
+import sys
+import time
+import zlib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_explorer import serialize
+
+SIZES = [1000, 10000, 100000, 1000000]
+NUM_CORPUS_DOC = 2000000
+REPEAT = 3
+
+
+def timeit(func):
+	elapsed = []
+	for i in range(REPEAT):
+		start = time.perf_counter()
+		res = func()
+		elapsed.append(time.perf_counter() - start)
+	return res, np.median(elapsed)
+
+def make_response(rng, size):
+	doc_list = np.sort(rng.choice(NUM_CORPUS_DOC, size=size, replace=False))
+	top_tokens = [[{'token': "tok%d" % ix, 'val': 0.1}, {'token': "tok%d" % (ix+1), 'val': -0.2}] for ix in range(min(size, 10000))]
+	return {'doc_list': doc_list, 'top_token_list': top_tokens * (size // len(top_tokens))}
+
+
+if __name__ == "__main__":
+	rng = np.random.default_rng(0)
+	print("%10s %14s %16s %16s %10s %12s %12s" % ("docs", "payload", "json.dumps(ms)", "serialize(ms)", "speedup", "size(MB)", "gzip(MB)"))
+	for size in SIZES:
+		res = make_response(rng, size)
+		for payload, to_encode in [("doc_list", {'doc_list': res['doc_list']}), ("response", res)]:
+			# the routes used to call .tolist() on the matched docs before json.dumps
+			legacy_body, legacy_elapsed = timeit(lambda: json.dumps(dict(to_encode, doc_list=to_encode['doc_list'].tolist())))
+			body, elapsed = timeit(lambda: serialize.dumps(to_encode))
+			assert json.loads(body) == json.loads(legacy_body)
+			compressed = zlib.compress(body, serialize.GZIP_LEVEL, wbits=31)
+			print("%10d %14s %16.2f %16.2f %9.1fx %12.2f %12.2f" % (size, payload, legacy_elapsed*1000, elapsed*1000,
+				legacy_elapsed/elapsed, len(body)/2**20, len(compressed)/2**20))
@@ -0,0 +1,56 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Replay recorded inspect_rule/ payloads against a running server and report the throughput.
+# Record the payloads by starting the server with ISEA_RECORD_PAYLOADS=<file> and using the interface, then:
+# python server/benchmarks/load_inspect_rule.py <file> [concurrency] [num_requests] [url]
+
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+URL = "http://localhost:7070/inspect_rule/"
+
+
+def send(url, para):
+	# the front-end posts the payload as a json string
+	body = json.dumps(json.dumps(para)).encode("utf-8")
+	req = urllib.request.Request(url, data=body, headers={'Content-Type': "application/json"})
+	start = time.perf_counter()
+	try:
+		with urllib.request.urlopen(req) as response:
+			response.read()
+			status = response.status
+	except urllib.error.HTTPError as e:
+		status = e.code
+	return status, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+	if (len(sys.argv) < 2):
+		print("usage: python server/benchmarks/load_inspect_rule.py <payloads.jsonl> [concurrency] [num_requests] [url]")
+		sys.exit(1)
+	with open(sys.argv[1]) as json_input:
+		payloads = [json.loads(line) for line in json_input if line.strip()]
+	concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+	num_requests = int(sys.argv[3]) if len(sys.argv) > 3 else len(payloads)
+	url = sys.argv[4] if len(sys.argv) > 4 else URL
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		results = list(pool.map(lambda ix: send(url, payloads[ix % len(payloads)]), range(num_requests)))
+	elapsed = time.perf_counter() - start
+
+	latency = np.array([res[1] for res in results]) * 1000
+	statuses = {}
+	for status, _ in results:
+		statuses[status] = statuses.get(status, 0) + 1
+	print("requests: %d, concurrency: %d, elapsed: %.2fs, throughput: %.2f req/s" % (num_requests, concurrency, elapsed, num_requests/elapsed))
+	print("latency(ms): p50 %.1f, p95 %.1f, max %.1f" % (np.percentile(latency, 50), np.percentile(latency, 95), latency.max()))
+	print("status: %s" % json.dumps(statuses))
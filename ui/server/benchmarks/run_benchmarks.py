@@ -0,0 +1,231 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Timed scenarios for the routes of server.py and the mining steps of DebugRule on a synthetic dataset,
+# with the peak memory of each scenario. The results are written as json, and compared to a previous
+# run with --baseline (the exit code is 1 when a scenario got slower).
+# Run inside the ui/ folder: python server/benchmarks/run_benchmarks.py --docs 10000 --output results.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "pre-process"))
+import synthetic
+import server
+from rule_explorer import store
+from rule_explorer.cache import match_cache
+
+DATA_NAME = "bench"
+REPEAT = 5
+MINE_REPEAT = 3
+# a scenario is a regression when it is this much slower than the baseline
+REGRESSION = 1.2
+FILTER_THRESHOLD = {'support': 20, 'err_rate': .27}
+
+
+def measure(name, func, setup=None, repeat=REPEAT):
+	elapsed = []
+	for i in range(repeat):
+		if (setup is not None):
+			setup()
+		start = time.perf_counter()
+		func()
+		elapsed.append(time.perf_counter() - start)
+	# the peak memory is traced in a separate run, tracing slows the code down
+	if (setup is not None):
+		setup()
+	tracemalloc.start()
+	func()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return summarize(name, elapsed, peak)
+
+def summarize(name, elapsed, peak):
+	elapsed = np.array(elapsed) * 1000
+	return {
+		'name': name,
+		'median_ms': float(np.median(elapsed)),
+		'min_ms': float(elapsed.min()),
+		'max_ms': float(elapsed.max()),
+		'repeat': int(elapsed.shape[0]),
+		'peak_mb': peak / 2**20,
+	}
+
+def cold():
+	store.store.clear()
+	match_cache.clear()
+
+def post(client, route, para):
+	# as the front-end, the payload is posted as a json string
+	response = client.post(route, json=json.dumps(para))
+	body = response.get_data()
+	if (response.status_code != 200):
+		raise RuntimeError(route+" returned "+str(response.status_code)+": "+body.decode()[:200])
+	return body
+
+def route_scenarios(key_list):
+	client = server.app.test_client()
+	tok = lambda ix: {'feature': "tok%d" % ix, 'sign': '>'}
+	rules = {
+		'frequent_token': [tok(0)],
+		'bug_token': [tok(10)],
+		'three_tokens': [tok(0), tok(1), tok(10)],
+		'concept': [{'feature': "concept_bug", 'sign': 'is', 'val': ["tok%d" % ix for ix in range(10, 15)]}],
+		'token_and_hfeat': [tok(0), {'feature': "ADJ", 'sign': '=', 'val': 3.0}],
+	}
+	all_docs = list(range(store.get_dataset(DATA_NAME).is_error.shape[0]))
+	scenarios = []
+	for rule_name, rule in rules.items():
+		para = {'rules': rule, 'data_name': DATA_NAME, 'key_list': key_list, 'error_only': 0}
+		scenarios.append(("inspect_rule/"+rule_name, lambda para=para: post(client, "/inspect_rule/", para)))
+		scenarios.append(("hints/"+rule_name, lambda para=para: post(client, "/hints/", para)))
+	scenarios.extend([
+		("inspect_rule/paged", lambda: post(client, "/inspect_rule/", {'rules': rules['frequent_token'],
+			'data_name': DATA_NAME, 'key_list': key_list, 'error_only': 0, 'page_size': 50})),
+		("inspect_docs/page", lambda: post(client, "/inspect_docs/", {'rules': rules['frequent_token'],
+			'data_name': DATA_NAME, 'offset': 50, 'page_size': 50})),
+		("inspect_rules/all", lambda: post(client, "/inspect_rules/", {'rule_list': list(rules.values()),
+			'data_name': DATA_NAME, 'key_list': key_list, 'error_only': 0})),
+		("get_stat/all_docs", lambda: post(client, "/get_stat/", {'data_name': DATA_NAME, 'doc_list': all_docs, 'key_list': key_list})),
+		("update_concept/five_tokens", lambda: post(client, "/update_concept", {'data_name': DATA_NAME,
+			'concept': ["tok%d" % ix for ix in range(10, 15)]})),
+	])
+
+	results = []
+	for name, func in scenarios:
+		results.append(measure("route/cold/"+name, func, setup=cold))
+		func()
+		results.append(measure("route/warm/"+name, func))
+	return results
+
+def mining_steps(debug_rule, kind, X, y):
+	# time each step of one mining run, and its peak memory when traced
+	traced = tracemalloc.is_tracing()
+	drule_obj = debug_rule.DebugRule()
+	if (kind == "token"):
+		steps = [
+			("initialize", lambda: drule_obj.initialize(X, y, FILTER_THRESHOLD)),
+			("train_surrogate_random_forest", drule_obj.train_surrogate_random_forest),
+			("extract_token_rule", drule_obj.extract_token_rule),
+		]
+	else:
+		steps = [
+			("initialize", lambda: drule_obj.initialize(X, y, FILTER_THRESHOLD)),
+			("numerical2ordinal", drule_obj.numerical2ordinal),
+			("extract_high_level_rule", drule_obj.extract_high_level_rule),
+		]
+	steps.extend([
+		("calculate_pval", drule_obj.calculate_pval),
+		("calculate_ci", drule_obj.calculate_ci),
+	])
+	res = []
+	for name, func in steps:
+		if (traced):
+			tracemalloc.reset_peak()
+		start = time.perf_counter()
+		func()
+		res.append((name, time.perf_counter() - start, tracemalloc.get_traced_memory()[1] if traced else 0))
+	res.append(("num_rules", len(drule_obj.rules), 0))
+	return res
+
+def mining_scenarios(mine_vocab):
+	# pre-process/debug_rule.py and its dependencies (e.g., scikit-learn) are optional
+	try:
+		import debug_rule
+	except ImportError as e:
+		print("skip the mining scenarios: "+str(e))
+		return []
+	dataset = store.get_dataset(DATA_NAME)
+	y = np.asarray(dataset.is_error)
+	inputs = {
+		'token': sparse.csc_matrix(dataset.corpus)[:, :mine_vocab].toarray(),
+		'hfeat': dataset.hfeat.values,
+	}
+	results = []
+	for kind, X in inputs.items():
+		runs = [mining_steps(debug_rule, kind, X, y) for i in range(MINE_REPEAT)]
+		tracemalloc.start()
+		traced = mining_steps(debug_rule, kind, X, y)
+		tracemalloc.stop()
+		for step_ix, (name, _, peak) in enumerate(traced[:-1]):
+			results.append(summarize("mining/"+kind+"/"+name, [run[step_ix][1] for run in runs], peak))
+		print("%s mining: %d rules" % (kind, traced[-1][1]))
+	return results
+
+def compare(results, config, baseline_path):
+	with open(baseline_path) as json_input:
+		baseline = json.load(json_input)
+	if (baseline['config'] != config):
+		print("\nthe baseline ran on another dataset: "+json.dumps(baseline['config']))
+	baseline = dict([(res['name'], res) for res in baseline['results']])
+	regressions = []
+	print("\n%-60s %12s %12s %8s" % ("scenario", "baseline(ms)", "current(ms)", "ratio"))
+	for res in results:
+		if (res['name'] not in baseline):
+			continue
+		ratio = res['median_ms'] / max(baseline[res['name']]['median_ms'], 1e-6)
+		flag = ""
+		if (ratio > REGRESSION):
+			flag = "  REGRESSION"
+			regressions.append(res['name'])
+		print("%-60s %12.2f %12.2f %7.2fx%s" % (res['name'], baseline[res['name']]['median_ms'], res['median_ms'], ratio, flag))
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--docs", type=int, default=10000)
+	parser.add_argument("--vocab", type=int, default=5000)
+	parser.add_argument("--density", type=float, default=.005)
+	parser.add_argument("--mine_vocab", type=int, default=300, help="tokens (columns) used by the token mining scenarios")
+	parser.add_argument("--skip_mining", action="store_true")
+	parser.add_argument("--bundle", action="store_true", help="serve the dataset from a binary bundle")
+	parser.add_argument("--output", default=None, help="json file of the results")
+	parser.add_argument("--baseline", default=None, help="json results of a previous run to compare with")
+	args = parser.parse_args()
+
+	data_dir = tempfile.mkdtemp()
+	try:
+		config = synthetic.write_dataset(data_dir, DATA_NAME, args.docs, args.vocab, args.density)
+		if (args.bundle):
+			from rule_explorer import bundle
+			bundle.convert(DATA_NAME, data_dir)
+		config['bundle'] = args.bundle
+		store.store.data_dir = data_dir
+		cold()
+		print("dataset: "+json.dumps(config))
+
+		results = route_scenarios(['gold_label', 'genre'])
+		if (not args.skip_mining):
+			results.extend(mining_scenarios(args.mine_vocab))
+	finally:
+		shutil.rmtree(data_dir)
+
+	print("\n%-60s %12s %12s %10s" % ("scenario", "median(ms)", "min(ms)", "peak(MB)"))
+	for res in results:
+		print("%-60s %12.2f %12.2f %10.2f" % (res['name'], res['median_ms'], res['min_ms'], res['peak_mb']))
+
+	output = {
+		'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'config': config,
+		'results': results,
+	}
+	if (args.output is not None):
+		with open(args.output, "w") as json_output:
+			json_output.write(json.dumps(output, indent=1))
+	if (args.baseline is not None and len(compare(results, config, args.baseline)) > 0):
+		sys.exit(1)
@@ -0,0 +1,110 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Synthetic datasets in the ui/data layout, for the benchmarks.
+# Run inside the ui/ folder: python server/benchmarks/synthetic.py <data_name> [num_doc] [vocab_size] [density]
+
+import json
+import os
+import sys
+import pandas as pd
+from scipy import sparse
+import numpy as np
+
+LABELS = ['entailment', 'neutral', 'contradiction']
+GENRES = ['travel', 'government', 'fiction']
+HFEAT = ['ADJ', 'ADV', 'NOUN', 'PRON', 'NUM', 'doc_len', 'overlap']
+# tokens raising the error rate of the docs having them
+NUM_BUG_TOKEN = 10
+NUM_GOOD_TOKEN = 1000
+NUM_SHAP_TOKEN = 3
+
+
+def token_corpus(rng, num_doc, vocab_size, density):
+	# doc x token binary matrix, token frequencies follow a power law so a few tokens are in many docs
+	weights = 1. / np.arange(1, vocab_size+1) ** .8
+	weights /= weights.sum()
+	nnz = int(num_doc * vocab_size * density)
+	rows = rng.integers(0, num_doc, nnz)
+	cols = rng.choice(vocab_size, size=nnz, p=weights)
+	corpus = sparse.csr_matrix((np.ones(nnz, dtype=int), (rows, cols)), shape=(num_doc, vocab_size))
+	corpus.sum_duplicates()
+	corpus.data[:] = 1
+	return corpus
+
+def write_dataset(data_dir, data_name, num_doc=10000, vocab_size=5000, density=.005, seed=0):
+	rng = np.random.default_rng(seed)
+	path = os.path.join(data_dir, data_name)
+	binary_path = os.path.join(data_dir, data_name+"_binary")
+	os.makedirs(path, exist_ok=True)
+	os.makedirs(binary_path, exist_ok=True)
+
+	corpus = token_corpus(rng, num_doc, vocab_size, density)
+	sparse.save_npz(os.path.join(path, "corpus_mat.npz"), corpus)
+	columns = ["tok%d" % ix for ix in range(vocab_size)]
+	good_idx = list(range(min(vocab_size, NUM_GOOD_TOKEN)))
+	with open(os.path.join(binary_path, "test.json"), "w") as json_output:
+		json_output.write(json.dumps({
+			'columns': columns,
+			'good_cols': [columns[ix] for ix in good_idx],
+			'good_idx': good_idx,
+		}))
+
+	# errors are more likely for docs having one of the bug tokens
+	bug_tokens = np.arange(10, 10+NUM_BUG_TOKEN) % vocab_size
+	has_bug = np.asarray(corpus[:, bug_tokens].sum(axis=1)).reshape(-1) > 0
+	is_error = rng.random(num_doc) < np.where(has_bug, .6, .2)
+	y_gt = rng.integers(0, len(LABELS), num_doc)
+	y_pred = np.where(is_error, (y_gt + rng.integers(1, len(LABELS), num_doc)) % len(LABELS), y_gt)
+	pd.DataFrame({'y_gt': y_gt, 'y_pred': y_pred}).to_csv(os.path.join(path, "model_output.csv"), index=False)
+
+	content = pd.DataFrame({
+		'sentence1': ["premise %d" % ix for ix in range(num_doc)],
+		'sentence2': ["hypothesis %d" % ix for ix in range(num_doc)],
+		'gold_label': np.array(LABELS)[y_gt],
+		'genre': np.array(GENRES)[rng.integers(0, len(GENRES), num_doc)],
+	})
+	with open(os.path.join(path, "doc.jsonl"), "w") as json_output:
+		json_output.write(json.dumps({'content': content.to_dict("records")}))
+
+	# the last column is always the prediction
+	hfeat_df = pd.DataFrame()
+	for col in HFEAT:
+		hfeat_df[col] = rng.poisson(3, num_doc).astype(float)
+	hfeat_df['pred'] = y_pred
+	hfeat_df.to_csv(os.path.join(path, "hfeat_stat.csv"), index=False)
+
+	# shap tokens of each doc, one list per class
+	shap_tokens = rng.integers(0, vocab_size, (num_doc, len(LABELS), NUM_SHAP_TOKEN))
+	shap_vals = np.round(rng.normal(0, .1, shap_tokens.shape), 4)
+	top_tokens = [[[{'token': columns[tok], 'val': val} for tok, val in zip(toks, vals)]
+		for toks, vals in zip(doc_toks, doc_vals)] for doc_toks, doc_vals in zip(shap_tokens.tolist(), shap_vals.tolist())]
+	with open(os.path.join(path, "shap_values.json"), "w") as json_output:
+		json_output.write(json.dumps({'top_tokens': top_tokens}))
+
+	with open(os.path.join(path, "train_token_stat.json"), "w") as json_output:
+		json_output.write(json.dumps({
+			'token_labels': rng.integers(0, 100, (vocab_size, len(LABELS))).astype(float).tolist(),
+			'token_list': columns,
+		}))
+
+	pd.DataFrame(rng.normal(0, 10, (num_doc, 2)), columns=['x', 'y']).to_csv(os.path.join(path, "sentence_tsne.csv"), index=False)
+	return {
+		'num_doc': num_doc,
+		'vocab_size': vocab_size,
+		'density': density,
+		'nnz': int(corpus.nnz),
+		'error_rate': float(is_error.mean()),
+	}
+
+
+if __name__ == "__main__":
+	if (len(sys.argv) < 2):
+		print("usage: python server/benchmarks/synthetic.py <data_name> [num_doc] [vocab_size] [density]")
+		sys.exit(1)
+	num_doc = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+	vocab_size = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+	density = float(sys.argv[4]) if len(sys.argv) > 4 else .005
+	print(write_dataset("./data/", sys.argv[1], num_doc, vocab_size, density))
@@ -0,0 +1,23 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+# Convert the files of one or more datasets into binary bundles read by the server.
+# Run inside the ui/ folder: python server/convert_bundle.py <data_name> [<data_name> ...]
+
+import sys
+import time
+from rule_explorer import bundle
+from rule_explorer.store import DATA_DIR
+
+
+if __name__ == '__main__':
+	if (len(sys.argv) < 2):
+		print("usage: python server/convert_bundle.py <data_name> [<data_name> ...]")
+		sys.exit(1)
+	for data_name in sys.argv[1:]:
+		start = time.perf_counter()
+		manifest = bundle.convert(data_name, DATA_DIR)
+		print("%s: %d docs, written to %s in %.1fs" % (data_name, manifest['num_doc'],
+			bundle.bundle_path(DATA_DIR, data_name), time.perf_counter() - start))
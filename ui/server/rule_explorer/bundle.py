@@ -0,0 +1,185 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import json
+import os
+import shutil
+import pandas as pd
+from scipy import sparse
+import numpy as np
+from rule_explorer.encoding import encode_columns, value_postings
+
+BUNDLE_DIR = "bundle"
+MANIFEST = "manifest.json"
+VERSION = 2
+# doc fields with at most this many distinct values are stored as integer codes for the stat. view
+MAX_DOC_FIELD_VALUES = 1000
+# files of ./data/<data_name> a bundle is converted from, with <data_name>_binary/test.json
+SOURCES = ["model_output.csv", "hfeat_stat.csv", "corpus_mat.npz", "doc.jsonl", "shap_values.json",
+	"train_token_stat.json", "train_corpus_mat.npz", "train_doc_labels.npy"]
+
+
+class BlobList():
+	# read-only list of json items stored back to back in one file, item i is blob[offsets[i]:offsets[i+1]]
+	def __init__(self, blob_path, offsets_path):
+		self.offsets = np.load(offsets_path, mmap_mode='r')
+		self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+	def __len__(self):
+		return self.offsets.shape[0] - 1
+
+	def __getitem__(self, ix):
+		return json.loads(self.blob[self.offsets[ix]:self.offsets[ix+1]].tobytes())
+
+
+def write_blobs(items, blob_path, offsets_path):
+	offsets = np.zeros(shape=len(items)+1, dtype=np.int64)
+	with open(blob_path, "wb") as blob_output:
+		for ix, item in enumerate(items):
+			encoded = json.dumps(item).encode("utf-8")
+			blob_output.write(encoded)
+			offsets[ix+1] = offsets[ix] + len(encoded)
+	np.save(offsets_path, offsets)
+
+def write_column(path, values):
+	values = np.asarray(values)
+	if (values.dtype == object):
+		raise ValueError("cannot store a column of python objects: "+path)
+	np.save(path, values)
+
+def read_files(folder, chunk_size=1 << 20):
+	# read every file once, so it is in the page cache
+	for root, dirs, files in os.walk(folder):
+		for filename in files:
+			with open(os.path.join(root, filename), "rb") as file_input:
+				while (file_input.read(chunk_size)):
+					pass
+
+def index_dtype(max_val):
+	return np.int32 if max_val < np.iinfo(np.int32).max else np.int64
+
+def write_csc(folder, matrix):
+	# data, indices and indptr of the matrix by column, as separate files to be mapped
+	matrix = matrix.tocsc()
+	matrix.sort_indices()
+	os.makedirs(folder)
+	np.save(os.path.join(folder, "data.npy"), matrix.data)
+	np.save(os.path.join(folder, "indices.npy"), matrix.indices.astype(index_dtype(matrix.shape[0])))
+	np.save(os.path.join(folder, "indptr.npy"), matrix.indptr.astype(index_dtype(matrix.nnz)))
+	return list(matrix.shape)
+
+def bundle_path(data_dir, data_name, *names):
+	return os.path.join(data_dir, data_name, BUNDLE_DIR, *names)
+
+def has_bundle(data_dir, data_name):
+	return os.path.exists(bundle_path(data_dir, data_name, MANIFEST))
+
+def stale_sources(data_dir, data_name):
+	# source files modified after the bundle was converted
+	mtime = os.path.getmtime(bundle_path(data_dir, data_name, MANIFEST))
+	paths = [os.path.join(data_dir, data_name, name) for name in SOURCES] + [os.path.join(data_dir, data_name+"_binary", "test.json")]
+	return [path for path in paths if os.path.exists(path) and os.path.getmtime(path) > mtime]
+
+def convert(data_name, data_dir):
+	# convert the files of ./data/<data_name> (and <data_name>_binary) into a bundle of binary columns
+	src = os.path.join(data_dir, data_name)
+	dst = bundle_path(data_dir, data_name)
+	tmp = dst+".tmp"
+	if os.path.exists(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	manifest = {'version': VERSION, 'num_doc': None, 'doc_fields': [], 'encoded_doc_fields': []}
+
+	# model output
+	model_output = pd.read_csv(filepath_or_buffer=os.path.join(src, "model_output.csv"))
+	manifest['num_doc'] = model_output.shape[0]
+	manifest['model_output'] = model_output.columns.values.tolist()
+	os.makedirs(os.path.join(tmp, "model_output"))
+	for ix, col in enumerate(manifest['model_output']):
+		write_column(os.path.join(tmp, "model_output", "%d.npy" % ix), model_output[col].values)
+	is_error = (model_output['y_gt'] != model_output['y_pred']).values.astype(int)
+	np.save(os.path.join(tmp, "is_error.npy"), is_error)
+
+	# high-level features
+	hfeat_path = os.path.join(src, "hfeat_stat.csv")
+	if os.path.exists(hfeat_path):
+		hfeat_df = pd.read_csv(filepath_or_buffer=hfeat_path)
+		manifest['hfeat'] = hfeat_df.columns.values.tolist()
+		os.makedirs(os.path.join(tmp, "hfeat"))
+		os.makedirs(os.path.join(tmp, "hfeat_postings"))
+		for ix, col in enumerate(manifest['hfeat']):
+			write_column(os.path.join(tmp, "hfeat", "%d.npy" % ix), hfeat_df[col].values)
+			order, offsets, uniques = value_postings(hfeat_df[col])
+			np.save(os.path.join(tmp, "hfeat_postings", "%d.npy" % ix), order.astype(index_dtype(order.shape[0])))
+			np.save(os.path.join(tmp, "hfeat_postings", "%d_offsets.npy" % ix), offsets)
+			with open(os.path.join(tmp, "hfeat_postings", "%d.json" % ix), "w") as json_output:
+				json_output.write(json.dumps(uniques))
+
+		# high-level features and the ground truth encoded for the stat. view
+		if ("label" not in hfeat_df.columns):
+			hfeat_df['label'] = model_output['y_gt'].values
+		encoded = encode_columns(hfeat_df, hfeat_df.columns.values.tolist())
+		np.save(os.path.join(tmp, "hfeat_stat_codes.npy"), encoded['codes'])
+		with open(os.path.join(tmp, "hfeat_stat_codes.json"), "w") as json_output:
+			json_output.write(json.dumps({'columns': encoded['columns'], 'uniques': encoded['uniques']}))
+
+	# token corpus, by column as used for rule matching
+	corpus_path = os.path.join(src, "corpus_mat.npz")
+	if os.path.exists(corpus_path):
+		manifest['corpus_shape'] = write_csc(os.path.join(tmp, "corpus"), sparse.load_npz(corpus_path))
+	token_path = os.path.join(data_dir, data_name+"_binary", "test.json")
+	if os.path.exists(token_path):
+		shutil.copyfile(token_path, os.path.join(tmp, "tokens.json"))
+
+	# documents, one json blob per doc, and the doc fields with few values as codes
+	doc_path = os.path.join(src, "doc.jsonl")
+	if os.path.exists(doc_path):
+		with open(doc_path, "r") as json_input:
+			content = json.load(json_input)['content']
+		write_blobs(content, os.path.join(tmp, "docs.bin"), os.path.join(tmp, "docs_offsets.npy"))
+		docs = pd.DataFrame(content)
+		manifest['doc_fields'] = docs.columns.values.tolist()
+		os.makedirs(os.path.join(tmp, "doc_fields"))
+		for ix, col in enumerate(manifest['doc_fields']):
+			try:
+				codes, uniques = pd.factorize(docs[col], sort=True)
+			except TypeError:
+				continue
+			if (len(uniques) > MAX_DOC_FIELD_VALUES):
+				continue
+			np.save(os.path.join(tmp, "doc_fields", "%d.npy" % ix), codes.astype(np.int32))
+			with open(os.path.join(tmp, "doc_fields", "%d.json" % ix), "w") as json_output:
+				json_output.write(json.dumps(np.asarray(uniques).tolist()))
+			manifest['encoded_doc_fields'].append(col)
+
+	# shap tokens, one json blob per doc
+	shap_path = os.path.join(src, "shap_values.json")
+	if os.path.exists(shap_path):
+		with open(shap_path) as json_input:
+			top_tokens = json.load(json_input)['top_tokens']
+		write_blobs(top_tokens, os.path.join(tmp, "shap.bin"), os.path.join(tmp, "shap_offsets.npy"))
+
+	# label histograms of the training tokens
+	train_path = os.path.join(src, "train_token_stat.json")
+	if os.path.exists(train_path):
+		with open(train_path) as json_input:
+			data = json.load(json_input)
+		np.save(os.path.join(tmp, "train_token_labels.npy"), np.array(data['token_labels']))
+		with open(os.path.join(tmp, "train_token_list.json"), "w") as json_output:
+			json_output.write(json.dumps(data['token_list']))
+
+	# training docs by token and their labels, for the stat. of token conjunctions
+	train_corpus_path = os.path.join(src, "train_corpus_mat.npz")
+	if os.path.exists(train_corpus_path):
+		manifest['train_corpus_shape'] = write_csc(os.path.join(tmp, "train_corpus"), sparse.load_npz(train_corpus_path))
+		shutil.copyfile(os.path.join(src, "train_doc_labels.npy"), os.path.join(tmp, "train_doc_labels.npy"))
+
+	# the manifest is written last, a bundle without it is ignored
+	with open(os.path.join(tmp, MANIFEST), "w") as json_output:
+		json_output.write(json.dumps(manifest))
+	if os.path.exists(dst):
+		shutil.rmtree(dst)
+	os.rename(tmp, dst)
+	return manifest
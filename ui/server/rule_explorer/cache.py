@@ -0,0 +1,71 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# memory (in MB) for the matched docs of conditions and rule prefixes
+MATCH_CACHE_MB = int(os.environ.get("ISEA_MATCH_CACHE_MB", 256))
+
+
+class MatchCache():
+	# LRU cache from a normalized condition / rule prefix to (matched doc ids, error count)
+	def __init__(self, memory_budget_mb=MATCH_CACHE_MB):
+		self.memory_budget = memory_budget_mb * 1024 * 1024
+		self.entries = OrderedDict()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if (entry is None):
+				self.misses += 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key, rows, error_count=None):
+		# cached arrays are shared between requests, so they are made read-only
+		rows = np.array(rows)
+		rows.flags.writeable = False
+		nbytes = rows.nbytes
+		if (nbytes > self.memory_budget):
+			return rows, error_count
+		with self.lock:
+			if (key in self.entries):
+				self.nbytes -= self.entries.pop(key)[1]
+			self.entries[key] = ((rows, error_count), nbytes)
+			self.nbytes += nbytes
+			while (self.nbytes > self.memory_budget):
+				old_key, (value, old_nbytes) = self.entries.popitem(last=False)
+				self.nbytes -= old_nbytes
+				self.evictions += 1
+		return rows, error_count
+
+	def stats(self):
+		with self.lock:
+			return {
+				'entries': len(self.entries),
+				'bytes': self.nbytes,
+				'budget_bytes': self.memory_budget,
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+			}
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.nbytes = 0
+
+
+match_cache = MatchCache()
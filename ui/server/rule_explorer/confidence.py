@@ -0,0 +1,70 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import os
+import numpy as np
+from scipy import stats
+from scipy.stats import bootstrap
+from rule_explorer.metrics import timed
+
+WILSON = "wilson"
+CLOPPER_PEARSON = "clopper_pearson"
+BOOTSTRAP = "bootstrap"
+CI_METHODS = [WILSON, CLOPPER_PEARSON, BOOTSTRAP]
+CI_METHOD = os.environ.get("ISEA_CI_METHOD", WILSON)
+BOOTSTRAP_SEED = 1234
+
+
+def wilson_ci(error_count, tot, confidence_level=0.95):
+	# closed form CI of the error rate, error_count and tot can be arrays
+	error_count = np.asarray(error_count, dtype=float)
+	tot = np.asarray(tot, dtype=float)
+	z = stats.norm.ppf(1 - (1 - confidence_level) / 2)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		p = error_count / tot
+		denom = 1 + z**2 / tot
+		center = (p + z**2 / (2 * tot)) / denom
+		half = z / denom * np.sqrt(p * (1 - p) / tot + z**2 / (4 * tot**2))
+	return np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+def clopper_pearson_ci(error_count, tot, confidence_level=0.95):
+	# exact binomial CI, error_count and tot can be arrays
+	error_count = np.asarray(error_count, dtype=float)
+	tot = np.asarray(tot, dtype=float)
+	alpha = 1 - confidence_level
+	with np.errstate(divide='ignore', invalid='ignore'):
+		ci_l = np.where(error_count > 0, stats.beta.ppf(alpha / 2, error_count, tot - error_count + 1), 0.)
+		ci_u = np.where(error_count < tot, stats.beta.ppf(1 - alpha / 2, error_count + 1, tot - error_count), 1.)
+	return ci_l, ci_u
+
+def bootstrap_ci(is_error, confidence_level=0.95, seed=BOOTSTRAP_SEED):
+	# resample in batches so memory stays bounded for large subpopulations
+	batch = max(1, 10**7 // max(1, is_error.shape[0]))
+	res = bootstrap((is_error,), np.mean, confidence_level=confidence_level,
+		batch=batch, random_state=np.random.default_rng(seed))
+	ci_l, ci_u = res.confidence_interval
+	return ci_l, ci_u
+
+@timed("confidence_interval")
+def error_rate_ci(is_error, method=CI_METHOD, confidence_level=0.95, seed=BOOTSTRAP_SEED):
+	# 0.95 CI of the error rate of a subpopulation, given the error labels of its docs
+	if (method == BOOTSTRAP):
+		ci_l, ci_u = bootstrap_ci(is_error, confidence_level, seed)
+	elif (method == CLOPPER_PEARSON):
+		ci_l, ci_u = clopper_pearson_ci(is_error.sum(), is_error.shape[0], confidence_level)
+	elif (method == WILSON):
+		ci_l, ci_u = wilson_ci(is_error.sum(), is_error.shape[0], confidence_level)
+	else:
+		raise ValueError("unknown CI method: "+str(method))
+	return [float(ci_l), float(ci_u)]
+
+@timed("confidence_interval")
+def count_ci(error_count, tot, method=CI_METHOD, confidence_level=0.95):
+	# CIs of many subpopulations from their counts, the bootstrap needs the docs so Wilson is used instead
+	if (method == CLOPPER_PEARSON):
+		return clopper_pearson_ci(error_count, tot, confidence_level)
+	if (method == WILSON or method == BOOTSTRAP):
+		return wilson_ci(error_count, tot, confidence_level)
+	raise ValueError("unknown CI method: "+str(method))
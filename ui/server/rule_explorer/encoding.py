@@ -0,0 +1,37 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+import pandas as pd
+
+
+def encode_columns(df, columns):
+	# integer code of each value (sorted, -1 for missing) for counting with np.bincount
+	codes = np.zeros(shape=(df.shape[0], len(columns)), dtype=np.int32)
+	uniques = []
+	for ix, col in enumerate(columns):
+		col_codes, col_uniques = pd.factorize(df[col], sort=True)
+		codes[:, ix] = col_codes
+		uniques.append(np.asarray(col_uniques).tolist())
+	return {
+		'columns': columns,
+		'codes': codes,
+		'uniques': uniques,
+	}
+
+def value_postings(values):
+	# rows grouped by value: the rows of uniques[k] are order[offsets[k]:offsets[k+1]],
+	# missing values (code -1) come first and never match
+	codes, uniques = pd.factorize(values, sort=True)
+	order = np.argsort(codes, kind="stable")
+	counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+	offsets = np.zeros(shape=len(uniques)+1, dtype=np.int64)
+	offsets[0] = int((codes < 0).sum())
+	offsets[1:] = offsets[0] + np.cumsum(counts)
+	return order, offsets, np.asarray(uniques).tolist()
+
+def postings_dict(order, offsets, uniques):
+	# views of order, no copy
+	return dict([(val, order[offsets[k]:offsets[k+1]]) for k, val in enumerate(uniques)])
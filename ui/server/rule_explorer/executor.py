@@ -0,0 +1,124 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import os
+import threading
+import time
+from concurrent import futures
+
+# threads running the rule / concept computations
+WORKERS = int(os.environ.get("ISEA_WORKERS", os.cpu_count() or 1))
+# computations of one dataset running at the same time, so a dataset cannot take all workers
+DATASET_CONCURRENCY = int(os.environ.get("ISEA_DATASET_CONCURRENCY", max(1, WORKERS // 2)))
+# computations waiting or running, further requests are rejected
+MAX_PENDING = int(os.environ.get("ISEA_MAX_PENDING", 4 * WORKERS))
+# seconds before a request gives up, its computation stops at the next check_cancelled()
+REQUEST_TIMEOUT = float(os.environ.get("ISEA_REQUEST_TIMEOUT", 120))
+
+
+class Overloaded(Exception):
+	pass
+
+
+class Cancelled(Exception):
+	pass
+
+
+_task = threading.local()
+
+
+def check_cancelled():
+	# called between the steps of long computations
+	cancelled = getattr(_task, 'cancelled', None)
+	if (cancelled is not None and cancelled.is_set()):
+		raise Cancelled()
+
+
+class TaskRunner():
+	# bounded thread pool for the computations of the routes, the loaded datasets are shared
+	# by all threads through the store
+	def __init__(self, workers=WORKERS, dataset_concurrency=DATASET_CONCURRENCY, max_pending=MAX_PENDING):
+		self.pool = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="isea")
+		self.dataset_concurrency = dataset_concurrency
+		self.pending = threading.BoundedSemaphore(max_pending)
+		self.dataset_slots = {}
+		self.tasks = {}
+		self.lock = threading.Lock()
+		self.counts = {'done': 0, 'timeout': 0, 'cancelled': 0, 'rejected': 0}
+
+	def slot(self, data_name):
+		with self.lock:
+			if (data_name not in self.dataset_slots):
+				self.dataset_slots[data_name] = threading.BoundedSemaphore(self.dataset_concurrency)
+			return self.dataset_slots[data_name]
+
+	def count(self, key):
+		with self.lock:
+			self.counts[key] += 1
+
+	def run(self, data_name, func, *args, request_id=None, timeout=REQUEST_TIMEOUT):
+		# run func(*args) in the pool and wait for it, a request_id lets the client cancel it
+		deadline = time.monotonic() + timeout
+		if (not self.pending.acquire(blocking=False)):
+			self.count('rejected')
+			raise Overloaded()
+		slot = self.slot(data_name)
+		if (not slot.acquire(timeout=timeout)):
+			self.pending.release()
+			self.count('timeout')
+			raise futures.TimeoutError()
+
+		cancelled = threading.Event()
+		if (request_id is not None):
+			with self.lock:
+				self.tasks[request_id] = cancelled
+
+		def task():
+			_task.cancelled = cancelled
+			try:
+				check_cancelled()
+				return func(*args)
+			finally:
+				_task.cancelled = None
+
+		def done(future):
+			# the slots are released when the computation ends, not when the request gives up
+			slot.release()
+			self.pending.release()
+			with self.lock:
+				if (request_id is not None and self.tasks.get(request_id) is cancelled):
+					del self.tasks[request_id]
+
+		future = self.pool.submit(task)
+		future.add_done_callback(done)
+		try:
+			res = future.result(timeout=max(0, deadline - time.monotonic()))
+		except futures.TimeoutError:
+			cancelled.set()
+			future.cancel()
+			self.count('timeout')
+			raise
+		except Cancelled:
+			self.count('cancelled')
+			raise
+		self.count('done')
+		return res
+
+	def cancel(self, request_id):
+		with self.lock:
+			cancelled = self.tasks.get(request_id)
+		if (cancelled is None):
+			return False
+		cancelled.set()
+		return True
+
+	def stats(self):
+		with self.lock:
+			stats = dict(self.counts)
+			stats['running'] = len(self.tasks)
+		return stats
+
+
+task_runner = TaskRunner()
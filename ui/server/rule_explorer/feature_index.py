@@ -0,0 +1,36 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureIndex():
+	# hash index from feature name to column id, the first occurrence wins as with list.index()
+	def __init__(self, names):
+		self.names = names
+		index = pd.Index(names, dtype=object)
+		first = ~index.duplicated(keep="first")
+		self.index = index[first]
+		self.ids = np.flatnonzero(first)
+		self.lookup = dict(zip(self.index.tolist(), self.ids.tolist()))
+
+	def __len__(self):
+		return len(self.names)
+
+	def __contains__(self, name):
+		return name in self.lookup
+
+	def get(self, name, default=-1):
+		return self.lookup.get(name, default)
+
+	def resolve(self, names):
+		# column ids of all names in one vectorized lookup, -1 for missing names
+		if (len(names) == 0):
+			return np.zeros(shape=0, dtype=int)
+		pos = self.index.get_indexer(pd.Index(names, dtype=object))
+		ids = np.full(shape=pos.shape[0], fill_value=-1, dtype=int)
+		ids[pos >= 0] = self.ids[pos[pos >= 0]]
+		return ids
@@ -0,0 +1,82 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import numpy as np
+from rule_explorer.feature_index import FeatureIndex
+
+
+class RuleMatcher():
+	# match rule conditions on the sparse token corpus (CSC) and on the high-level features,
+	# the matched docs are kept as sorted arrays of row ids
+	def intialize(self, dataset, read_doc=True, read_hfeat=True):
+		self.num_doc = dataset.is_error.shape[0]
+		self.token_index = FeatureIndex([])
+		self.hfeat_index = FeatureIndex([])
+		if (read_doc):
+			self.corpus = dataset.corpus
+			self.token_index = dataset.token_index
+		if (read_hfeat):
+			self.hfeat_df = dataset.hfeat
+			self.hfeat_postings = dataset.hfeat_postings
+			self.hfeat_index = dataset.hfeat_index
+		return self
+
+	def all_rows(self):
+		if (len(self.token_index) == 0 and len(self.hfeat_index) == 0):
+			return np.arange(0)
+		return np.arange(self.num_doc)
+
+	def exists(self, col):
+		return (col in self.token_index) or (col in self.hfeat_index)
+
+	def existing(self, cols):
+		# keep the features that exist, resolved in one batch
+		found = (self.token_index.resolve(cols) >= 0) | (self.hfeat_index.resolve(cols) >= 0)
+		return [col for col, is_found in zip(cols, found) if is_found]
+
+	def token_column(self, ix):
+		start, end = self.corpus.indptr[ix], self.corpus.indptr[ix+1]
+		return self.corpus.indices[start:end], self.corpus.data[start:end]
+
+	def column_values(self, col):
+		if (col in self.hfeat_index):
+			return self.hfeat_df[col].values
+		values = np.zeros(shape=self.num_doc)
+		rows, data = self.token_column(self.token_index.get(col))
+		values[rows] = data
+		return values
+
+	def rows_greater(self, col, threshold=0.5):
+		# tokens take priority over high-level features with the same name
+		if (col in self.token_index):
+			rows, data = self.token_column(self.token_index.get(col))
+			return rows[data > threshold]
+		return np.flatnonzero(self.column_values(col) > threshold)
+
+	def rows_equal(self, col, val):
+		# high-level features take priority over tokens with the same name
+		if (col in self.hfeat_index):
+			rows = self.hfeat_postings[col].get(val)
+			if (rows is None):
+				return np.arange(0)
+			return rows
+		return np.flatnonzero(self.column_values(col) == val)
+
+	def rows_any(self, cols):
+		# docs having at least one of the given features
+		mask = np.zeros(shape=self.num_doc, dtype=bool)
+		ids = self.token_index.resolve(cols)
+		if ((ids >= 0).any()):
+			sub_corpus = self.corpus[:, ids[ids >= 0]]
+			mask[sub_corpus.indices[sub_corpus.data == 1]] = True
+		for col, ix in zip(cols, ids):
+			if (ix < 0 and col in self.hfeat_index):
+				mask |= (self.column_values(col) == 1)
+		return np.flatnonzero(mask)
+
+	def intersect(self, matched, rows):
+		mask = np.zeros(shape=self.num_doc, dtype=bool)
+		mask[rows] = True
+		return matched[mask[matched]]
@@ -0,0 +1,293 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# per-request phase timings and counters, off by default
+ENABLED = os.environ.get("ISEA_METRICS", "0") == "1"
+# requests slower than this (in ms) dump their sampled stacks, 0 only profiles the requests asking for it
+PROFILE_SLOW_MS = float(os.environ.get("ISEA_PROFILE_SLOW_MS", 0))
+PROFILE_INTERVAL_MS = float(os.environ.get("ISEA_PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.environ.get("ISEA_PROFILE_DIR", "./profiles/")
+# request header asking for the stacks of one request
+PROFILE_HEADER = "X-Isea-Profile"
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 120.)
+
+
+def escape(value):
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(labels):
+	if (len(labels) == 0):
+		return ""
+	return "{"+",".join(["%s=\"%s\"" % (key, escape(val)) for key, val in labels])+"}"
+
+def format_value(value):
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+def exposition(families):
+	# prometheus text format, a family is (name, type, help, [(suffix, labels, value)]),
+	# the suffix is empty except for the _bucket, _sum and _count samples of histograms
+	lines = []
+	for name, kind, help_text, samples in families:
+		lines.append("# HELP %s %s" % (name, help_text))
+		lines.append("# TYPE %s %s" % (name, kind))
+		for suffix, labels, value in samples:
+			lines.append("%s%s%s %s" % (name, suffix, format_labels(labels), format_value(value)))
+	return "\n".join(lines)+"\n"
+
+
+class StackSampler():
+	# samples the stacks of the threads working on one request, written in the collapsed format
+	# of flamegraph.pl and speedscope ("frame;frame;frame count")
+	def __init__(self, interval=PROFILE_INTERVAL_MS/1000.):
+		self.interval = interval
+		self.threads = set()
+		self.stacks = defaultdict(int)
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, name="isea-profiler", daemon=True)
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+
+	def add_thread(self, ident):
+		with self.lock:
+			self.threads.add(ident)
+
+	def remove_thread(self, ident):
+		with self.lock:
+			self.threads.discard(ident)
+
+	def run(self):
+		while (not self.stopped.wait(self.interval)):
+			frames = sys._current_frames()
+			with self.lock:
+				threads = list(self.threads)
+			for ident in threads:
+				frame = frames.get(ident)
+				stack = []
+				while (frame is not None):
+					code = frame.f_code
+					stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+					frame = frame.f_back
+				if (len(stack) > 0):
+					self.stacks[";".join(reversed(stack))] += 1
+
+	def dump(self, path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, "w") as output:
+			for stack, count in sorted(self.stacks.items()):
+				output.write("%s %d\n" % (stack, count))
+		return path
+
+
+class RequestTimer():
+	# time of each phase of one request, phases are exclusive: a nested phase (e.g., a file loaded
+	# while filtering the docs of a condition) is not counted in the enclosing one
+	def __init__(self, route, profile=False):
+		self.route = route
+		self.start = time.perf_counter()
+		self.phases = defaultdict(float)
+		self.lock = threading.Lock()
+		self.sampler = None
+		if (profile or PROFILE_SLOW_MS > 0):
+			self.sampler = StackSampler().start()
+			self.sampler.add_thread(threading.get_ident())
+		self.forced_profile = profile
+		self.finished = False
+
+	def add(self, phase, seconds):
+		with self.lock:
+			self.phases[phase] += seconds
+
+	def elapsed(self):
+		return time.perf_counter() - self.start
+
+	def server_timing(self):
+		with self.lock:
+			return ", ".join(["%s;dur=%.2f" % (phase, seconds * 1000) for phase, seconds in self.phases.items()])
+
+	def finish(self):
+		# called once the response is sent, including the streamed chunks
+		if (self.finished):
+			return None
+		self.finished = True
+		elapsed = self.elapsed()
+		metrics.observe("isea_request_duration_seconds", elapsed, route=self.route)
+		with self.lock:
+			phases = list(self.phases.items())
+		# time outside of the instrumented phases, e.g., parsing the payload
+		phases.append(("other", max(0., elapsed - sum([seconds for _, seconds in phases]))))
+		for phase, seconds in phases:
+			metrics.inc("isea_phase_seconds_total", seconds, route=self.route, phase=phase)
+		if (getattr(_local, 'timer', None) is self):
+			_local.timer = None
+
+		path = None
+		if (self.sampler is not None):
+			self.sampler.stop()
+			if (self.forced_profile or elapsed * 1000 >= PROFILE_SLOW_MS):
+				name = "%s-%s-%dms.folded" % (time.strftime("%Y%m%d-%H%M%S"), self.route, elapsed * 1000)
+				path = self.sampler.dump(os.path.join(PROFILE_DIR, name))
+				metrics.inc("isea_profiles_total", route=self.route)
+		return path
+
+
+class Metrics():
+	# counters and histograms, labels are given as keyword arguments
+	def __init__(self):
+		self.counters = defaultdict(float)
+		self.histograms = {}
+		self.lock = threading.Lock()
+
+	def inc(self, name, value=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.counters[key] += value
+
+	def observe(self, name, value, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			hist = self.histograms.get(key)
+			if (hist is None):
+				hist = self.histograms[key] = [[0] * len(BUCKETS), 0., 0]
+			for ix, bound in enumerate(BUCKETS):
+				if (value <= bound):
+					hist[0][ix] += 1
+			hist[1] += value
+			hist[2] += 1
+
+	def families(self):
+		with self.lock:
+			counters = list(self.counters.items())
+			histograms = [(key, [list(hist[0]), hist[1], hist[2]]) for key, hist in self.histograms.items()]
+		res = OrderedFamilies()
+		for (name, labels), value in sorted(counters):
+			res.add(name, "counter", [("", labels, value)])
+		for (name, labels), (buckets, tot, count) in sorted(histograms):
+			samples = [("_bucket", labels + (("le", format_value(bound)),), bucket) for bound, bucket in zip(BUCKETS, buckets)]
+			samples.append(("_bucket", labels + (("le", "+Inf"),), count))
+			samples.append(("_sum", labels, tot))
+			samples.append(("_count", labels, count))
+			res.add(name, "histogram", samples)
+		return res.families
+
+	def clear(self):
+		with self.lock:
+			self.counters.clear()
+			self.histograms.clear()
+
+
+class OrderedFamilies():
+	# samples grouped by family name, in the order the families are first seen
+	HELP = {
+		'isea_request_duration_seconds': "time to compute and send the response of a route",
+		'isea_phase_seconds_total': "time spent in each phase of the requests of a route",
+		'isea_store_loads_total': "files loaded (or structures built) by the data store",
+		'isea_store_hits_total': "data store lookups served from memory",
+		'isea_store_bytes_read_total': "bytes of the text files parsed by the data store",
+		'isea_profiles_total': "sampled stacks dumped to ISEA_PROFILE_DIR",
+	}
+
+	def __init__(self):
+		self.families = []
+		self.index = {}
+
+	def add(self, name, kind, samples, help_text=None):
+		if (name not in self.index):
+			self.index[name] = len(self.families)
+			self.families.append((name, kind, help_text or self.HELP.get(name, name), []))
+		self.families[self.index[name]][3].extend(samples)
+
+
+metrics = Metrics()
+_local = threading.local()
+
+
+def current():
+	return getattr(_local, 'timer', None)
+
+def start_request(route, profile=False):
+	if (not ENABLED and not profile):
+		return None
+	_local.timer = RequestTimer(route, profile)
+	return _local.timer
+
+def bind(func):
+	# run func in another thread (the task runner's) on behalf of the current request
+	timer = current()
+	if (timer is None):
+		return func
+	caller = threading.get_ident()
+	def run(*args, **kwargs):
+		_local.timer = timer
+		ident = threading.get_ident()
+		if (timer.sampler is not None):
+			timer.sampler.add_thread(ident)
+			timer.sampler.remove_thread(caller)
+		try:
+			return func(*args, **kwargs)
+		finally:
+			_local.timer = None
+			_local.stack = []
+			if (timer.sampler is not None):
+				timer.sampler.remove_thread(ident)
+				timer.sampler.add_thread(caller)
+	return run
+
+@contextmanager
+def phase(name):
+	# with phase("condition_filtering"): ..., a no-op unless a request is timed
+	timer = current()
+	if (timer is None):
+		yield
+		return
+	stack = getattr(_local, 'stack', None)
+	if (stack is None):
+		stack = _local.stack = []
+	# [elapsed time of the nested phases]
+	frame = [0.]
+	stack.append(frame)
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		elapsed = time.perf_counter() - start
+		stack.pop()
+		if (len(stack) > 0):
+			stack[-1][0] += elapsed
+		timer.add(name, elapsed - frame[0])
+
+def timed(name):
+	# decorator running a whole function as a phase
+	def decorator(func):
+		@functools.wraps(func)
+		def run(*args, **kwargs):
+			with phase(name):
+				return func(*args, **kwargs)
+		return run
+	return decorator
+
+def add_phase(name, seconds):
+	# time measured by the caller, e.g., the encoding of a streamed response
+	timer = current()
+	if (timer is not None):
+		timer.add(name, seconds)
+
+def inc(name, value=1, **labels):
+	if (ENABLED):
+		metrics.inc(name, value, **labels)
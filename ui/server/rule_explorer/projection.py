@@ -0,0 +1,150 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import math
+import os
+import numpy as np
+
+# the finest grid has 2**MAX_LEVEL cells per side
+MAX_LEVEL = 8
+# a viewport with at most this many docs is sent as points, otherwise as density bins
+MAX_POINTS = int(os.environ.get("ISEA_PROJECTION_MAX_POINTS", 5000))
+# bins per side of the viewport
+TILE_GRID = 64
+
+
+class ProjectionIndex():
+	# grid pyramid over the 2d projection of the docs: the docs sorted by cell of the finest grid,
+	# and the doc / error counts of the cells at every level (level l has 2**l cells per side)
+	def __init__(self, x, y, is_error):
+		self.x = np.asarray(x, dtype=float)
+		self.y = np.asarray(y, dtype=float)
+		self.is_error = np.asarray(is_error).astype(np.int64)
+		self.num_doc = self.x.shape[0]
+		if (self.num_doc > 0):
+			self.bounds = [float(self.x.min()), float(self.y.min()), float(self.x.max()), float(self.y.max())]
+		else:
+			self.bounds = [0., 0., 1., 1.]
+		# cells have a positive size even when all docs have the same coordinate
+		self.extent = [max(self.bounds[2] - self.bounds[0], 1e-9), max(self.bounds[3] - self.bounds[1], 1e-9)]
+
+		side = 1 << MAX_LEVEL
+		self.cell_x = self.cell_of(self.x, 0, MAX_LEVEL)
+		self.cell_y = self.cell_of(self.y, 1, MAX_LEVEL)
+		cell = self.cell_y * side + self.cell_x
+		self.order = np.argsort(cell, kind='stable')
+		self.cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=side*side))])
+
+		# counts[l] is a (2**l, 2**l) grid indexed by [cell_y, cell_x]
+		tot = np.bincount(cell, minlength=side*side).reshape(side, side)
+		err = np.bincount(cell, weights=self.is_error, minlength=side*side).astype(np.int64).reshape(side, side)
+		self.counts = [None] * (MAX_LEVEL+1)
+		self.counts[MAX_LEVEL] = (tot, err)
+		for level in range(MAX_LEVEL-1, -1, -1):
+			tot = tot.reshape(tot.shape[0]//2, 2, tot.shape[1]//2, 2).sum(axis=(1, 3))
+			err = err.reshape(err.shape[0]//2, 2, err.shape[1]//2, 2).sum(axis=(1, 3))
+			self.counts[level] = (tot, err)
+
+	def cell_of(self, coord, axis, level):
+		side = 1 << level
+		cell = np.floor((np.asarray(coord, dtype=float) - self.bounds[axis]) / self.extent[axis] * side).astype(np.int64)
+		return np.clip(cell, 0, side-1)
+
+	def cell_range(self, viewport, level):
+		# cells (x0, y0, x1, y1), inclusive, overlapping the viewport
+		x0, y0, x1, y1 = viewport
+		cx = self.cell_of([x0, x1], 0, level)
+		cy = self.cell_of([y0, y1], 1, level)
+		return int(cx[0]), int(cy[0]), int(cx[1]), int(cy[1])
+
+	def level_for(self, viewport):
+		# the level with about TILE_GRID cells across the viewport
+		x0, y0, x1, y1 = viewport
+		span = max((x1 - x0) / self.extent[0], (y1 - y0) / self.extent[1], 1e-9)
+		return int(min(MAX_LEVEL, max(0, math.ceil(math.log2(TILE_GRID / span)))))
+
+	def in_viewport(self, docs, viewport):
+		x0, y0, x1, y1 = viewport
+		x = self.x[docs]
+		y = self.y[docs]
+		return docs[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+	def viewport_docs(self, viewport):
+		# docs of the finest cells overlapping the viewport, one slice of the sorted docs per row of cells
+		cx0, cy0, cx1, cy1 = self.cell_range(viewport, MAX_LEVEL)
+		side = 1 << MAX_LEVEL
+		rows = [self.order[self.cell_offsets[cy*side+cx0]:self.cell_offsets[cy*side+cx1+1]] for cy in range(cy0, cy1+1)]
+		docs = np.sort(np.concatenate(rows + [np.zeros(0, dtype=np.int64)]))
+		return self.in_viewport(docs, viewport)
+
+	def count_in_cells(self, viewport, level):
+		cx0, cy0, cx1, cy1 = self.cell_range(viewport, level)
+		return int(self.counts[level][0][cy0:cy1+1, cx0:cx1+1].sum())
+
+	def points(self, docs):
+		return {
+			'mode': "points",
+			'doc_list': docs,
+			'x': np.round(self.x[docs], 4),
+			'y': np.round(self.y[docs], 4),
+			'is_error': self.is_error[docs],
+		}
+
+	def bins(self, viewport, level, tot, err):
+		# non-empty cells overlapping the viewport, tot / err are the grids of the level
+		cx0, cy0, cx1, cy1 = self.cell_range(viewport, level)
+		tot = tot[cy0:cy1+1, cx0:cx1+1]
+		err = err[cy0:cy1+1, cx0:cx1+1]
+		cy, cx = np.nonzero(tot)
+		side = 1 << level
+		return {
+			'mode': "bins",
+			'level': level,
+			'origin': self.bounds[:2],
+			'cell_size': [self.extent[0] / side, self.extent[1] / side],
+			'cx': cx + cx0,
+			'cy': cy + cy0,
+			'tot': tot[cy, cx],
+			'err': err[cy, cx],
+		}
+
+	def query(self, viewport=None, matched=None, max_points=MAX_POINTS):
+		# the docs of the viewport (or the matched docs of a rule in the viewport), as points
+		# when there are at most max_points of them, otherwise as density bins
+		if (viewport is None):
+			viewport = self.bounds
+		viewport = [float(val) for val in viewport]
+		level = self.level_for(viewport)
+		res = {
+			'bounds': self.bounds,
+			'viewport': viewport,
+		}
+		if (matched is None):
+			# the cell counts bound the docs of the viewport, the docs are only gathered for small counts
+			if (self.count_in_cells(viewport, MAX_LEVEL) <= max_points):
+				docs = self.viewport_docs(viewport)
+				res['num_doc'] = int(docs.shape[0])
+				res.update(self.points(docs))
+				return res
+			# docs of the cells overlapping the viewport
+			res['num_doc'] = self.count_in_cells(viewport, level)
+			res.update(self.bins(viewport, level, *self.counts[level]))
+			return res
+
+		matched = np.asarray(matched, dtype=np.int64)
+		docs = self.in_viewport(matched, viewport)
+		if (docs.shape[0] <= max_points):
+			res['num_doc'] = int(docs.shape[0])
+			res.update(self.points(docs))
+			return res
+		# bins of the matched docs, over the same cells as the bins of all docs
+		side = 1 << level
+		shift = MAX_LEVEL - level
+		cell = (self.cell_y[matched] >> shift) * side + (self.cell_x[matched] >> shift)
+		tot = np.bincount(cell, minlength=side*side).reshape(side, side)
+		err = np.bincount(cell, weights=self.is_error[matched], minlength=side*side).astype(np.int64).reshape(side, side)
+		res['num_doc'] = int(docs.shape[0])
+		res.update(self.bins(viewport, level, tot, err))
+		return res
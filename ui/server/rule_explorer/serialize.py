@@ -0,0 +1,182 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import json
+import os
+import threading
+import time
+import zlib
+import numpy as np
+from flask import Response
+from rule_explorer import metrics
+
+# gzip the responses of clients accepting it
+GZIP = os.environ.get("ISEA_GZIP", "0") == "1"
+GZIP_LEVEL = 6
+# items of a big list or array encoded per streamed chunk
+CHUNK_ITEMS = 10000
+# containers deeper than this are encoded in one piece by json.dumps
+MAX_DEPTH = 3
+POW10 = 10 ** np.arange(1, 19, dtype=np.int64)
+
+
+def default(obj):
+	# numpy values left in a result
+	if isinstance(obj, np.integer):
+		return int(obj)
+	if isinstance(obj, np.floating):
+		return float(obj)
+	if isinstance(obj, np.bool_):
+		return bool(obj)
+	if isinstance(obj, np.ndarray):
+		return obj.tolist()
+	raise TypeError("cannot serialize "+type(obj).__name__)
+
+def encode_ints(arr):
+	# ascii of the integers separated by ", " as in json.dumps, written digit by digit for all values at once
+	arr = np.asarray(arr, dtype=np.int64).reshape(-1)
+	if (arr.shape[0] == 0):
+		return b""
+	neg = (arr < 0).astype(np.int64)
+	mag = np.abs(arr)
+	num_digit = np.searchsorted(POW10, mag, side='right') + 1
+	lengths = num_digit + neg + 2
+	ends = np.cumsum(lengths)
+	starts = ends - lengths
+	buf = np.full(shape=int(ends[-1]), fill_value=ord(' '), dtype=np.uint8)
+	buf[ends - 2] = ord(',')
+	buf[starts[neg > 0]] = ord('-')
+	last = starts + neg + num_digit - 1
+	for digit in range(int(num_digit.max())):
+		mask = num_digit > digit
+		buf[last[mask] - digit] = ord('0') + mag[mask] // 10**digit % 10
+	return buf[:-2].tobytes()
+
+def is_int_array(obj):
+	return isinstance(obj, np.ndarray) and obj.ndim == 1 and np.issubdtype(obj.dtype, np.integer)
+
+def encode_key(key):
+	# same as the keys written by json.dumps, e.g., 1 -> "1"
+	if isinstance(key, str):
+		return json.dumps(key).encode()
+	return json.dumps({key: 0})[1:-4].encode()
+
+def has_container(values):
+	# e.g., the per rule results of inspect_rules, lists of lists go to json.dumps in one piece
+	return any([isinstance(val, (dict, np.ndarray)) for val in values])
+
+def iter_json(obj, depth=0):
+	# json text of obj in pieces (bytes), big lists and integer arrays are split in chunks
+	if is_int_array(obj):
+		yield b"["
+		for start in range(0, obj.shape[0], CHUNK_ITEMS):
+			if (start > 0):
+				yield b", "
+			yield encode_ints(obj[start:start+CHUNK_ITEMS])
+		yield b"]"
+	elif isinstance(obj, dict) and depth < MAX_DEPTH:
+		yield b"{"
+		for ix, (key, val) in enumerate(obj.items()):
+			yield (", " if ix > 0 else "").encode() + encode_key(key) + b": "
+			yield from iter_json(val, depth+1)
+		yield b"}"
+	elif isinstance(obj, list) and depth < MAX_DEPTH and len(obj) <= CHUNK_ITEMS and has_container(obj):
+		yield b"["
+		for ix, val in enumerate(obj):
+			if (ix > 0):
+				yield b", "
+			yield from iter_json(val, depth+1)
+		yield b"]"
+	elif isinstance(obj, list) and len(obj) > CHUNK_ITEMS:
+		yield b"["
+		for start in range(0, len(obj), CHUNK_ITEMS):
+			if (start > 0):
+				yield b", "
+			yield json.dumps(obj[start:start+CHUNK_ITEMS], default=default)[1:-1].encode()
+		yield b"]"
+	else:
+		yield json.dumps(obj, default=default).encode()
+
+def dumps(obj):
+	return b"".join(iter_json(obj))
+
+
+class SerializationStats():
+	# time spent encoding (and compressing) the responses of each route
+	def __init__(self):
+		self.routes = {}
+		self.lock = threading.Lock()
+
+	def add(self, route, seconds, nbytes):
+		with self.lock:
+			stat = self.routes.setdefault(route, {'count': 0, 'seconds': 0., 'bytes': 0})
+			stat['count'] += 1
+			stat['seconds'] += seconds
+			stat['bytes'] += nbytes
+
+	def stats(self):
+		with self.lock:
+			return dict([(route, dict(stat)) for route, stat in self.routes.items()])
+
+
+serialization_stats = SerializationStats()
+
+
+def accepts_gzip(request):
+	return GZIP and "gzip" in request.headers.get("Accept-Encoding", "")
+
+def json_response(res, route, request, stream=False):
+	# stream=True sends the pieces as they are encoded, for big results such as the docs of a rule
+	compress = accepts_gzip(request)
+	headers = {}
+	if (compress):
+		headers['Content-Encoding'] = "gzip"
+		headers['Vary'] = "Accept-Encoding"
+
+	if (not stream):
+		start = time.perf_counter()
+		body = dumps(res)
+		if (compress):
+			body = zlib.compress(body, GZIP_LEVEL, wbits=31)
+		elapsed = time.perf_counter() - start
+		serialization_stats.add(route, elapsed, len(body))
+		metrics.add_phase("serialization", elapsed)
+		headers['Server-Timing'] = "serialize;dur=%.2f" % (elapsed * 1000)
+		return Response(body, mimetype="application/json", headers=headers)
+
+	def generate():
+		# the encoding time excludes the time spent sending the chunks
+		elapsed = 0.
+		nbytes = 0
+		pieces = iter_json(res)
+		compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+		buffered = []
+		buffered_size = 0
+		while True:
+			start = time.perf_counter()
+			piece = next(pieces, None)
+			if (piece is not None):
+				buffered.append(piece)
+				buffered_size += len(piece)
+			chunk = None
+			# send pieces of at least 64KB
+			if (buffered_size >= 1 << 16 or (piece is None and buffered_size > 0)):
+				chunk = b"".join(buffered)
+				buffered = []
+				buffered_size = 0
+				if (compressor is not None):
+					chunk = compressor.compress(chunk)
+			if (piece is None and compressor is not None):
+				chunk = (chunk or b"") + compressor.flush()
+			elapsed += time.perf_counter() - start
+			if (chunk):
+				nbytes += len(chunk)
+				yield chunk
+			if (piece is None):
+				break
+		serialization_stats.add(route, elapsed, nbytes)
+		metrics.add_phase("serialization", elapsed)
+
+	return Response(generate(), mimetype="application/json", headers=headers)
@@ -0,0 +1,470 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from scipy import sparse
+import numpy as np
+from rule_explorer.feature_index import FeatureIndex
+from rule_explorer.projection import ProjectionIndex
+from rule_explorer import bundle
+from rule_explorer import metrics
+from rule_explorer.encoding import encode_columns, value_postings, postings_dict
+
+DATA_DIR = "./data/"
+# total memory (in MB) the resident datasets may use before the least recently used ones are dropped
+MEMORY_BUDGET_MB = int(os.environ.get("ISEA_MEMORY_BUDGET_MB", 4096))
+# entries computed from other entries rather than read from files
+# seconds between two checks of the source files of a bundle (see Dataset.manifest)
+STALE_CHECK_SECONDS = float(os.environ.get("ISEA_STALE_CHECK_SECONDS", 1))
+BUILT_ENTRIES = ["hfeat_index", "hfeat_stat_codes", "doc_codes", "hfeat_postings", "corpus_present", "shap_index"]
+
+
+def is_mapped(value):
+	# arrays (or views of arrays) backed by a memory-mapped file
+	while isinstance(value, np.ndarray):
+		if isinstance(value, np.memmap):
+			return True
+		value = value.base
+	return isinstance(value, mmap.mmap)
+
+
+def estimate_nbytes(value):
+	# memory-mapped bundle files live in the page cache, not in the process
+	if isinstance(value, bundle.BlobList) or is_mapped(value):
+		return 0
+	if isinstance(value, np.ndarray):
+		return int(value.nbytes)
+	if sparse.issparse(value):
+		return sum([estimate_nbytes(arr) for arr in [value.data, value.indices, value.indptr]])
+	if isinstance(value, pd.DataFrame):
+		if (value.shape[1] > 0 and all([is_mapped(value.iloc[:, ix].values) for ix in range(value.shape[1])])):
+			return 0
+		return int(value.memory_usage(index=True, deep=True).sum())
+	if isinstance(value, dict):
+		sizes = [estimate_nbytes(val) for val in value.values()]
+		if (None not in sizes):
+			return sum(sizes)
+	return None
+
+
+class Dataset():
+	# files are loaded lazily, the first time a route needs them, and reloaded when their mtime changes,
+	# a binary bundle (see bundle.py) is used instead of the text files when there is one
+	def __init__(self, data_name, data_dir=DATA_DIR, on_load=None):
+		self.data_name = data_name
+		self.data_dir = data_dir
+		self.on_load = on_load
+		self.entries = {}
+		# bytes of the entries, kept up to date under the lock so that enforce_budget can read it
+		# from other threads without waiting for a load
+		self.bytes = 0
+		self.lock = threading.RLock()
+		# (manifest mtime, time of the check, source files modified after the conversion)
+		self.stale_check = None
+
+	def path(self, filename):
+		return os.path.join(self.data_dir, self.data_name, filename)
+
+	def binary_path(self, filename):
+		return os.path.join(self.data_dir, self.data_name+"_binary", filename)
+
+	def bundle_path(self, *names):
+		return bundle.bundle_path(self.data_dir, self.data_name, *names)
+
+	@property
+	def manifest(self):
+		# None when the dataset has not been converted to a bundle, or when a source file was
+		# modified after the conversion (the text files are served until the bundle is converted again)
+		if (not bundle.has_bundle(self.data_dir, self.data_name)):
+			return None
+		# every entry checks the manifest, the source files are only checked again when the bundle
+		# is converted again or after STALE_CHECK_SECONDS
+		mtime = os.path.getmtime(self.bundle_path(bundle.MANIFEST))
+		now = time.monotonic()
+		check = self.stale_check
+		if (check is None or check[0] != mtime or now - check[1] > STALE_CHECK_SECONDS):
+			stale = bundle.stale_sources(self.data_dir, self.data_name)
+			if (len(stale) > 0 and (check is None or stale != check[2])):
+				print("ignoring the bundle of "+self.data_name+", older than "+", ".join([os.path.basename(path) for path in stale])
+					+", run server/convert_bundle.py again")
+			check = (mtime, now, stale)
+			self.stale_check = check
+		if (len(check[2]) > 0):
+			return None
+		def load():
+			with open(self.bundle_path(bundle.MANIFEST)) as json_input:
+				manifest = json.load(json_input)
+			if (manifest.get('version') != bundle.VERSION):
+				print("ignoring the outdated bundle of "+self.data_name+", run server/convert_bundle.py again")
+				return None
+			return manifest
+		return self.get("manifest", [self.bundle_path(bundle.MANIFEST)], load)
+
+	def sources(self, *paths):
+		# files an entry depends on, the manifest stands for all files of a bundle
+		if (self.manifest is not None):
+			return [self.bundle_path(bundle.MANIFEST)]
+		return list(paths)
+
+	def version(self):
+		# changes whenever a file that rule matching depends on is modified
+		paths = self.sources(self.path("corpus_mat.npz"), self.binary_path("test.json"),
+			self.path("hfeat_stat.csv"), self.path("model_output.csv"))
+		return tuple([os.path.getmtime(path) if os.path.exists(path) else None for path in paths])
+
+	def has_tokens(self):
+		if (self.manifest is not None):
+			return os.path.exists(self.bundle_path("corpus")) and os.path.exists(self.bundle_path("tokens.json"))
+		return os.path.exists(self.path("corpus_mat.npz")) and os.path.exists(self.binary_path("test.json"))
+
+	def has_hfeat(self):
+		if (self.manifest is not None):
+			return os.path.exists(self.bundle_path("hfeat"))
+		return os.path.exists(self.path("hfeat_stat.csv"))
+
+	def prewarm(self):
+		# load what rule matching needs, and read the bundle files once so that their pages are
+		# in the page cache (shared by all processes mapping them) before the first request
+		self.is_error
+		self.model_output
+		if (self.manifest is not None):
+			bundle.read_files(self.bundle_path())
+		if (self.has_tokens()):
+			self.corpus
+			self.token_info
+		if (self.has_hfeat()):
+			self.hfeat_index
+			self.hfeat_postings
+			self.hfeat_stat_codes
+		if (os.path.exists(self.path("sentence_tsne.csv"))):
+			self.projection
+		if (os.path.exists(self.bundle_path("shap.bin")) if self.manifest is not None else os.path.exists(self.path("shap_values.json"))):
+			self.shap_index
+		return self
+
+	def nbytes(self):
+		return self.bytes
+
+	def get(self, key, paths, loader):
+		mtimes = tuple([(path, os.path.getmtime(path)) for path in paths])
+		with self.lock:
+			entry = self.entries.get(key)
+			if (entry is not None and entry[0] == mtimes):
+				metrics.inc("isea_store_hits_total", dataset=self.data_name)
+				return entry[1]
+			# structures derived from loaded files are timed apart from the files themselves
+			with metrics.phase("matrix_build" if key.split("/")[0] in BUILT_ENTRIES else "file_load"):
+				value = loader()
+			metrics.inc("isea_store_loads_total", dataset=self.data_name, entry=key.split("/")[0])
+			# the bundle files are mapped, not read
+			read = [path for path in paths if not path.endswith(bundle.MANIFEST)]
+			metrics.inc("isea_store_bytes_read_total", sum([os.path.getsize(path) for path in read]), dataset=self.data_name)
+			nbytes = estimate_nbytes(value)
+			if (nbytes is None):
+				# nested python objects (e.g., shap tokens), use the size on disk as an approximation
+				nbytes = sum([os.path.getsize(path) for path in paths])
+			self.bytes += nbytes - (entry[2] if entry is not None else 0)
+			self.entries[key] = (mtimes, value, nbytes)
+		if (self.on_load is not None):
+			self.on_load(self)
+		return value
+
+	def read_columns(self, folder, columns):
+		# one memory-mapped .npy per column of a bundle table
+		return pd.DataFrame(dict([(col, np.load(self.bundle_path(folder, "%d.npy" % ix), mmap_mode='r'))
+			for ix, col in enumerate(columns)]), columns=columns, copy=False)
+
+	def read_csc(self, folder, shape):
+		arrays = [np.load(self.bundle_path(folder, name+".npy"), mmap_mode='r') for name in ["data", "indices", "indptr"]]
+		matrix = sparse.csc_matrix(tuple(arrays), shape=tuple(shape), copy=False)
+		matrix.has_sorted_indices = True
+		return matrix
+
+	@property
+	def docs(self):
+		def load():
+			if (self.manifest is not None):
+				doc_blobs = bundle.BlobList(self.bundle_path("docs.bin"), self.bundle_path("docs_offsets.npy"))
+				return pd.DataFrame([doc_blobs[ix] for ix in range(len(doc_blobs))])
+			with open(self.path("doc.jsonl"), "r") as json_input:
+				data = json.load(json_input)
+			return pd.DataFrame(data['content'])
+		return self.get("docs", self.sources(self.path("doc.jsonl")), load)
+
+	@property
+	def doc_fields(self):
+		if (self.manifest is not None):
+			return self.manifest['doc_fields']
+		return self.docs.columns.values.tolist()
+
+	@property
+	def model_output(self):
+		def load():
+			if (self.manifest is not None):
+				return self.read_columns("model_output", self.manifest['model_output'])
+			return pd.read_csv(filepath_or_buffer=self.path("model_output.csv"))
+		return self.get("model_output", self.sources(self.path("model_output.csv")), load)
+
+	@property
+	def is_error(self):
+		def load():
+			if (self.manifest is not None):
+				return np.load(self.bundle_path("is_error.npy"), mmap_mode='r')
+			model_output = self.model_output
+			return (model_output['y_gt'] != model_output['y_pred']).values.astype(int)
+		return self.get("is_error", self.sources(self.path("model_output.csv")), load)
+
+	@property
+	def hfeat(self):
+		def load():
+			if (self.manifest is not None):
+				return self.read_columns("hfeat", self.manifest['hfeat'])
+			return pd.read_csv(filepath_or_buffer=self.path("hfeat_stat.csv"))
+		return self.get("hfeat", self.sources(self.path("hfeat_stat.csv")), load)
+
+	@property
+	def hfeat_index(self):
+		return self.get("hfeat_index", self.sources(self.path("hfeat_stat.csv")),
+			lambda: FeatureIndex(self.hfeat.columns.values.tolist()))
+
+	@property
+	def hfeat_stat(self):
+		# high-level features together with the ground truth, as shown in the stat. view
+		def load():
+			hfeat_df = pd.DataFrame(self.hfeat)
+			if ("label" not in hfeat_df.columns):
+				hfeat_df['label'] = self.model_output['y_gt'].values
+			return hfeat_df
+		return self.get("hfeat_stat", self.sources(self.path("hfeat_stat.csv"), self.path("model_output.csv")), load)
+
+	@property
+	def hfeat_stat_codes(self):
+		def load():
+			if (self.manifest is not None):
+				with open(self.bundle_path("hfeat_stat_codes.json")) as json_input:
+					encoded = json.load(json_input)
+				encoded['codes'] = np.load(self.bundle_path("hfeat_stat_codes.npy"), mmap_mode='r')
+				return encoded
+			hfeat_df = self.hfeat_stat
+			return encode_columns(hfeat_df, hfeat_df.columns.values.tolist())
+		return self.get("hfeat_stat_codes", self.sources(self.path("hfeat_stat.csv"), self.path("model_output.csv")), load)
+
+	def doc_codes(self, col):
+		# encoded lazily, only the doc fields used as stat. keys are needed
+		def load():
+			manifest = self.manifest
+			if (manifest is not None and col in manifest['encoded_doc_fields']):
+				ix = manifest['doc_fields'].index(col)
+				with open(self.bundle_path("doc_fields", "%d.json" % ix)) as json_input:
+					uniques = json.load(json_input)
+				return {
+					'columns': [col],
+					'codes': np.load(self.bundle_path("doc_fields", "%d.npy" % ix), mmap_mode='r').reshape(-1, 1),
+					'uniques': [uniques],
+				}
+			return encode_columns(self.docs, [col])
+		return self.get("doc_codes/"+col, self.sources(self.path("doc.jsonl")), load)
+
+	@property
+	def hfeat_postings(self):
+		# rows of each high-level feature value, for '=' conditions
+		def load():
+			postings = {}
+			for ix, col in enumerate(self.hfeat.columns.values.tolist()):
+				if (self.manifest is not None):
+					order = np.load(self.bundle_path("hfeat_postings", "%d.npy" % ix), mmap_mode='r')
+					offsets = np.load(self.bundle_path("hfeat_postings", "%d_offsets.npy" % ix))
+					with open(self.bundle_path("hfeat_postings", "%d.json" % ix)) as json_input:
+						uniques = json.load(json_input)
+				else:
+					order, offsets, uniques = value_postings(self.hfeat[col])
+				postings[col] = postings_dict(order, offsets, uniques)
+			return postings
+		return self.get("hfeat_postings", self.sources(self.path("hfeat_stat.csv")), load)
+
+	@property
+	def corpus(self):
+		# doc x token matrix, kept sparse by column so a condition is a slice of one column
+		def load():
+			if (self.manifest is not None):
+				return self.read_csc("corpus", self.manifest['corpus_shape'])
+			corpus = sparse.load_npz(self.path("corpus_mat.npz")).tocsc()
+			corpus.sort_indices()
+			return corpus
+		return self.get("corpus", self.sources(self.path("corpus_mat.npz")), load)
+
+	@property
+	def corpus_present(self):
+		# 1 where a token is present (> 0.5), to count the docs of every token with one product
+		def load():
+			corpus = self.corpus
+			if (np.isin(corpus.data, [0, 1]).all()):
+				return corpus
+			present = sparse.csc_matrix(((corpus.data > 0.5).astype(np.float32), corpus.indices, corpus.indptr), shape=corpus.shape)
+			present.has_sorted_indices = True
+			return present
+		return self.get("corpus_present", self.sources(self.path("corpus_mat.npz")), load)
+
+	@property
+	def token_info(self):
+		def load():
+			path = self.bundle_path("tokens.json") if self.manifest is not None else self.binary_path("test.json")
+			with open(path) as json_input:
+				data = json.load(json_input)
+			return {
+				'columns': data['columns'],
+				'good_idx': data['good_idx'],
+				'token_index': FeatureIndex(data['columns']),
+			}
+		return self.get("token_info", self.sources(self.binary_path("test.json")), load)
+
+	@property
+	def columns(self):
+		return self.token_info['columns']
+
+	@property
+	def good_idx(self):
+		return self.token_info['good_idx']
+
+	@property
+	def token_index(self):
+		return self.token_info['token_index']
+
+	@property
+	def top_tokens(self):
+		def load():
+			if (self.manifest is not None):
+				# decoded per doc, when the doc is matched
+				return bundle.BlobList(self.bundle_path("shap.bin"), self.bundle_path("shap_offsets.npy"))
+			with open(self.path("shap_values.json")) as json_input:
+				return json.load(json_input)['top_tokens']
+		return self.get("top_tokens", self.sources(self.path("shap_values.json")), load)
+
+	@property
+	def shap_index(self):
+		# the top shap tokens of all docs as arrays, in doc order: the class, token id and sign of
+		# every (doc, class, token) entry, the entries of doc i are offsets[i]:offsets[i+1]
+		def load():
+			tokens = {}
+			classes, token_ids, positive, counts = [], [], [], []
+			for doc in self.top_tokens:
+				num_entry = 0
+				for class_ix, items in enumerate(doc):
+					for item in items:
+						classes.append(class_ix)
+						token_ids.append(tokens.setdefault(item['token'], len(tokens)))
+						positive.append(item['val'] >= 0)
+					num_entry += len(items)
+				counts.append(num_entry)
+			return {
+				'tokens': np.array(list(tokens), dtype=object),
+				'offsets': np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64),
+				'class': np.array(classes, dtype=np.int64),
+				'token': np.array(token_ids, dtype=np.int64),
+				'positive': np.array(positive, dtype=bool),
+			}
+		return self.get("shap_index", self.sources(self.path("shap_values.json")), load)
+
+	def shap_version(self):
+		paths = self.sources(self.path("shap_values.json"))
+		return tuple([os.path.getmtime(path) if os.path.exists(path) else None for path in paths])
+
+	@property
+	def projection(self):
+		# grid index over the 2d positions of the docs, for the projection view
+		def load():
+			positions = pd.read_csv(filepath_or_buffer=self.path("sentence_tsne.csv"))
+			return ProjectionIndex(positions['x'].values, positions['y'].values, self.is_error)
+		return self.get("projection", [self.path("sentence_tsne.csv")] + self.sources(self.path("model_output.csv")), load)
+
+	@property
+	def train_token_stat(self):
+		def load():
+			if (self.manifest is not None):
+				with open(self.bundle_path("train_token_list.json")) as json_input:
+					data = {'token_list': json.load(json_input)}
+				data['token_labels'] = np.load(self.bundle_path("train_token_labels.npy"), mmap_mode='r')
+			else:
+				with open(self.path("train_token_stat.json")) as json_input:
+					data = json.load(json_input)
+				# token id x label counts
+				data['token_labels'] = np.array(data['token_labels'])
+			data['token_index'] = FeatureIndex(data['token_list'])
+			return data
+		return self.get("train_token_stat", self.sources(self.path("train_token_stat.json")), load)
+
+	def has_train_corpus(self):
+		if (self.manifest is not None):
+			return 'train_corpus_shape' in self.manifest
+		return os.path.exists(self.path("train_corpus_mat.npz")) and os.path.exists(self.path("train_doc_labels.npy"))
+
+	@property
+	def train_corpus(self):
+		# training docs x tokens (columns of train_token_stat's token_list), and the label of each doc
+		def load():
+			if (self.manifest is not None):
+				corpus = self.read_csc("train_corpus", self.manifest['train_corpus_shape'])
+				labels = np.load(self.bundle_path("train_doc_labels.npy"), mmap_mode='r')
+			else:
+				corpus = sparse.load_npz(self.path("train_corpus_mat.npz")).tocsc()
+				corpus.sort_indices()
+				labels = np.load(self.path("train_doc_labels.npy"))
+			return {
+				'corpus': corpus,
+				'labels': labels,
+			}
+		return self.get("train_corpus", self.sources(self.path("train_corpus_mat.npz"), self.path("train_doc_labels.npy")), load)
+
+
+class DataStore():
+	def __init__(self, data_dir=DATA_DIR, memory_budget_mb=MEMORY_BUDGET_MB):
+		self.data_dir = data_dir
+		self.memory_budget = memory_budget_mb * 1024 * 1024
+		self.datasets = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, data_name):
+		with self.lock:
+			dataset = self.datasets.pop(data_name, None)
+			if (dataset is None):
+				dataset = Dataset(data_name, self.data_dir, on_load=self.enforce_budget)
+			# most recently used dataset at the end
+			self.datasets[data_name] = dataset
+		return dataset
+
+	def enforce_budget(self, loaded):
+		with self.lock:
+			tot = sum([dataset.nbytes() for dataset in self.datasets.values()])
+			for data_name in list(self.datasets.keys()):
+				if (tot <= self.memory_budget):
+					break
+				dataset = self.datasets[data_name]
+				# never drop the dataset that is being served
+				if (dataset is loaded):
+					continue
+				tot -= dataset.nbytes()
+				del self.datasets[data_name]
+
+	def stats(self):
+		with self.lock:
+			datasets = list(self.datasets.items())
+		return dict([(data_name, {'entries': len(dataset.entries), 'bytes': dataset.nbytes()}) for data_name, dataset in datasets])
+
+	def clear(self):
+		with self.lock:
+			self.datasets.clear()
+
+
+store = DataStore()
+
+
+def get_dataset(data_name):
+	return store.get(data_name)
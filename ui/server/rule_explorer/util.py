@@ -5,55 +5,78 @@
 
 import json
 import pandas as pd
-from scipy import sparse
 import numpy as np
-from scipy.stats import bootstrap
+from rule_explorer.store import get_dataset
+from rule_explorer.matcher import RuleMatcher
+from rule_explorer.confidence import CI_METHOD, CI_METHODS, error_rate_ci, count_ci
+from rule_explorer.cache import match_cache
+from rule_explorer.executor import check_cancelled
+from rule_explorer.metrics import timed
+from rule_explorer.projection import MAX_POINTS
+
+# docs per page of the doc view
+PAGE_SIZE = 50
+# next-condition hints returned, and the docs a hint must match
+HINT_TOP_K = 10
+HINT_MIN_SUPPORT = 20
+
+
+def count_by_group(codes, uniques, is_error):
+	# error and total counts of every (column, value) pair, in one bincount over all columns
+	num_vals = np.array([len(vals) for vals in uniques], dtype=int)
+	offsets = np.cumsum(num_vals) - num_vals
+	valid = codes >= 0
+	group_ids = (codes + offsets)[valid]
+	weights = np.broadcast_to(is_error[:, np.newaxis], codes.shape)[valid]
+	tot = np.bincount(group_ids, minlength=num_vals.sum())
+	err = np.rint(np.bincount(group_ids, weights=weights, minlength=num_vals.sum())).astype(int)
 
+	res = []
+	for col_ix, vals in enumerate(uniques):
+		col_tot = tot[offsets[col_ix]:offsets[col_ix]+num_vals[col_ix]]
+		col_err = err[offsets[col_ix]:offsets[col_ix]+num_vals[col_ix]]
+		res.append((col_tot, col_err))
+	return res
 
+@timed("stat_aggregation")
 def get_stat(data_name, doc_list, key_list):
-	# read doc data
-	with open("./data/"+data_name+"/doc.jsonl", "r") as json_input:
-		data = json.load(json_input)
-	model_output = pd.read_csv(filepath_or_buffer = "./data/"+data_name+"/model_output.csv")
-	train_data_df = pd.DataFrame(data['content'])
-
-	# read high-level feature
-	hfeat_df = pd.read_csv(filepath_or_buffer = "./data/"+data_name+"/hfeat_stat.csv")
-	if ("label" not in hfeat_df.columns):
-		hfeat_df['label'] = model_output['y_gt'].values
-
-	# get docs
-	data_df = pd.DataFrame(train_data_df.iloc[doc_list])
-	is_error = (model_output['y_gt'] != model_output['y_pred']).values.astype(int)[doc_list]
-
-	# get stat by key
-	to_save = {}
-	charts = []
-	cols = data_df.columns.values.tolist()
+	dataset = get_dataset(data_name)
+	doc_list = np.asarray(doc_list, dtype=int)
+	is_error = dataset.is_error[doc_list]
+
+	# encoded doc fields by key, and high-level features
+	columns = []
+	codes = []
+	uniques = []
+	doc_cols = dataset.doc_fields
 	for key in key_list:
-		try:
-			cols.index(key)
-		except ValueError:
+		if (key not in doc_cols):
 			continue
-		stat_df = pd.DataFrame()
-		stat_df[key] = data_df[key]
-		stat_df['is_error'] = is_error
-		to_render = stat_df.groupby([key]).sum().reset_index()
-		to_render['tot'] = stat_df.groupby([key]).count().reset_index()['is_error']
-		to_save['by_'+key] = to_render.to_dict("index")
-
-	# stat by hfeat
-	hfeat_doc_df = pd.DataFrame(hfeat_df.iloc[doc_list])
-	for key in hfeat_df.columns:
-		stat_df = pd.DataFrame()
-		stat_df[key] = hfeat_doc_df[key]
-		stat_df['is_error'] = is_error
-		to_render = stat_df.groupby([key]).sum().reset_index()
-		to_render['tot'] = stat_df.groupby([key]).count().reset_index()['is_error']
-		to_save['by_'+key] = to_render.to_dict("index")
+		encoded = dataset.doc_codes(key)
+		columns.extend(encoded['columns'])
+		codes.append(encoded['codes'][doc_list])
+		uniques.extend(encoded['uniques'])
+	encoded = dataset.hfeat_stat_codes
+	columns.extend(encoded['columns'])
+	codes.append(encoded['codes'][doc_list])
+	uniques.extend(encoded['uniques'])
+
+	# get stat by key, in the same format as DataFrame.to_dict("index") of the grouped counts
+	to_save = {}
+	counts = count_by_group(np.concatenate(codes, axis=1), uniques, is_error)
+	for key, vals, (tot, err) in zip(columns, uniques, counts):
+		to_render = {}
+		for val_ix in np.flatnonzero(tot).tolist():
+			to_render[len(to_render)] = {
+				key: vals[val_ix],
+				'is_error': int(err[val_ix]),
+				'tot': int(tot[val_ix]),
+			}
+		to_save['by_'+key] = to_render
 
 	return to_save
 
+@timed("stat_aggregation")
 def get_stat_in_train(data_name, rules):
 	read_train = False
 	for rule in rules:
@@ -64,23 +87,44 @@ def get_stat_in_train(data_name, rules):
 	if not read_train:
 		return {}
 
-	# read training set
-	with open("./data/"+data_name+"/train_token_stat.json") as json_input:
-		data = json.load(json_input)
-		train_token_labels = data['token_labels']
-		train_token_list = data['token_list']
+	# training set
+	dataset = get_dataset(data_name)
+	data = dataset.train_token_stat
+	train_token_labels = data['token_labels']
+	train_token_index = data['token_index']
 
 	stat = {}
 	for rule in rules:
 		if rule['sign'] == '>':
-			stat[rule['feature']] = [0] * len(train_token_labels[0])
-			try:
-				idx = train_token_list.index(rule['feature'])
-				stat[rule['feature']] = train_token_labels[idx]
-			except ValueError:
-				continue
+			stat[rule['feature']] = [0] * train_token_labels.shape[1]
+			idx = train_token_index.get(rule['feature'])
+			if (idx >= 0):
+				stat[rule['feature']] = np.asarray(train_token_labels[idx]).tolist()
+
+	# training docs having all tokens of the rule, when the training corpus is available
+	features = list(stat.keys())
+	if (len(features) > 1 and dataset.has_train_corpus()):
+		stat[" & ".join(features)] = train_conjunction_labels(dataset, features, train_token_labels.shape[1])
 	return stat
 
+def train_conjunction_labels(dataset, features, num_label):
+	# label counts of the training docs in the intersection of the posting lists of the tokens
+	train_corpus = dataset.train_corpus
+	corpus = train_corpus['corpus']
+	ids = dataset.train_token_stat['token_index'].resolve(features)
+	if ((ids < 0).any()):
+		return [0] * num_label
+	postings = []
+	for ix in ids.tolist():
+		start, end = corpus.indptr[ix], corpus.indptr[ix+1]
+		postings.append(corpus.indices[start:end][corpus.data[start:end] > 0])
+	# shortest lists first, so the intersection shrinks quickly
+	postings.sort(key=len)
+	rows = postings[0]
+	for posting in postings[1:]:
+		rows = np.intersect1d(rows, posting, assume_unique=True)
+	return np.bincount(np.asarray(train_corpus['labels'])[rows], minlength=num_label).tolist()
+
 def get_stat_id(data_name, doc_list, key_list):
 	# read data
 	with open("./data/"+data_name+"/doc_id.jsonl", "r") as json_input:
@@ -105,16 +149,72 @@ def get_stat_id(data_name, doc_list, key_list):
 		to_save['by_'+key] = to_render.to_dict("index")
 	return to_save
 
-def inspect_rule(rule, data_name, error_only=False):
+def inspect_rule(rule, data_name, error_only=False, key_list=None, page_size=None):
+	# with a page_size, only the counts and the first page of docs are returned, see get_doc_page
+	path_generator = PathGenerator()
+	path_generator.intialize(data_name, rule)
+	res = []
+	if (page_size is None):
+		res = path_generator.get_doc_matched(rule, error_only)
+	else:
+		res = path_generator.get_page(0, page_size)
+		res['path_info'] = path_generator.path_info
+		if (path_generator.SHAP):
+			# the shap overview of the doc view counts the tokens of all matched docs, not only of the page
+			res['shap_stat'] = path_generator.shap_stat()
+	if (key_list is not None):
+		res['stat'] = get_stat(data_name, path_generator.matched_index, key_list)
+	return res
+
+def get_doc_page(rule, data_name, offset=0, page_size=PAGE_SIZE):
+	# the matched docs are read from the match cache, so a page only decodes its own docs
 	path_generator = PathGenerator()
 	path_generator.intialize(data_name, rule)
+	return path_generator.get_page(offset, page_size)
+
+def inspect_rules(rules, data_name, key_list, error_only=False):
+	# rules sharing their first conditions filter the docs once, through the match cache
 	res = []
-	res = path_generator.get_doc_matched(rule, error_only)
+	for rule in rules:
+		check_cancelled()
+		path_generator = PathGenerator()
+		path_generator.intialize(data_name, rule)
+		rule_res = path_generator.get_doc_matched(rule, error_only)
+		rule_res['stat'] = get_stat(data_name, path_generator.matched_index, key_list)
+		res.append(rule_res)
 	return res
 
-def evaluate_concept(data_name, concept):
+def get_hints(rule, data_name, top_k=HINT_TOP_K, min_support=HINT_MIN_SUPPORT, ci_method=CI_METHOD):
+	path_generator = PathGenerator()
+	path_generator.intialize(data_name, rule)
+	return path_generator.generate_hints(top_k, min_support, ci_method)
+
+def get_projection(data_name, rule=None, viewport=None, max_points=MAX_POINTS):
+	# the docs in the viewport of the projection view, only those matched by the rule when there is one
+	dataset = get_dataset(data_name)
+	matched = None
+	if (rule is not None and len(rule) > 0):
+		path_generator = PathGenerator()
+		path_generator.intialize(data_name, rule)
+		path_generator.match()
+		matched = path_generator.matched_index
+	return dataset.projection.query(viewport, matched, max_points)
+
+def normalize_cond(cond):
+	# conditions matching the same docs have the same key
+	sign = cond['sign']
+	if (sign == 'is'):
+		return (sign, None, tuple(sorted(set(cond['val']))))
+	if (sign == '='):
+		val = cond['val']
+		if isinstance(val, list):
+			val = tuple(val)
+		return (sign, cond['feature'], val)
+	return (sign, cond['feature'], None)
+
+def evaluate_concept(data_name, concept, ci_method=CI_METHOD):
 	concept_obj = Concept().intialize(data_name)
-	res = concept_obj.generate_stat(concept)
+	res = concept_obj.generate_stat(concept, ci_method)
 	return res
 
 class PathGenerator():
@@ -124,9 +224,11 @@ class PathGenerator():
 	SHAP = True
 
 	def intialize(self, data_name, rule):
-		# read model output
-		model_output = pd.read_csv(filepath_or_buffer = "./data/"+data_name+"/model_output.csv")
-		self.is_error = (model_output['y_gt'] != model_output['y_pred']).values.astype(int)
+		dataset = get_dataset(data_name)
+		self.dataset = dataset
+		self.is_error = dataset.is_error
+		self.rule_to_inspect = rule
+		self.path_info = None
 
 		read_doc = False
 		read_hfeat = False
@@ -139,58 +241,101 @@ class PathGenerator():
 				read_hfeat = True
 				break
 
-		# read dense matrix
-		self.matched_data = pd.DataFrame()
-		self.cols = []
+		# match on the sparse corpus and the high-level features
+		self.matcher = RuleMatcher().intialize(dataset, read_doc, read_hfeat)
+		self.matched_index = self.matcher.all_rows()
+		# which features exist depends on the loaded data
+		self.data_key = (data_name, dataset.version(), read_doc, read_hfeat)
+		self.prefix_key = ()
 		if (read_doc):
-			loaded = sparse.load_npz("./data/"+data_name+"/corpus_mat.npz")
-			X = loaded.toarray()
-			# read col nams
-			with open("./data/"+data_name+"_binary/test.json") as json_input:
-				data = json.load(json_input)
-				cols = data['columns']
-				self.good_idx = data['good_idx']
-			self.df = pd.DataFrame(data=X, columns=cols)
-			# self.words = cols
-			self.matched_data = pd.concat([self.matched_data, self.df], axis=1, ignore_index=True)
-			self.cols.extend(cols)
-
-		if (read_hfeat):
-			self.hfeat_df = pd.read_csv(filepath_or_buffer="./data/"+data_name+"/hfeat_stat.csv")
-			# self.hfeat = self.hfeat_df.columns.values.tolist()
-			self.matched_data = pd.concat([self.matched_data, self.hfeat_df], axis=1, ignore_index=True)
-			self.cols.extend(self.hfeat_df.columns.values.tolist())
-
-		self.matched_data.columns = self.cols
+			self.good_idx = dataset.good_idx
+			self.cols = dataset.columns
 
 		# read shap values
 		if (self.SHAP):
-			with open('./data/'+data_name+"/shap_values.json") as json_input:
-				self.top_tokens = json.load(json_input)['top_tokens']
+			self.top_tokens = dataset.top_tokens
 
 		return self
 
+	@timed("condition_filtering")
+	def match(self):
+		if (self.path_info is None):
+			self.path_info = self.get_cond_matched(0)
+		return self.path_info
+
 	def get_doc_matched(self, rule, error_only=False):
 		self.rule_to_inspect = rule
 		res = {}
-		rule_matched_table = np.zeros(shape=self.matched_data.shape[0])
 		conds = rule
 		
-		path_info = self.get_cond_matched(0)
+		path_info = self.match()
 
-		matched_index = self.matched_data.index.values.astype(int)
+		matched_index = self.matched_index
 		self.final_error_rate = 0
 		if (matched_index.shape[0] > 0):
 			self.final_error_rate = int(self.is_error[matched_index].sum())/matched_index.shape[0]
 		
-		res['doc_list'] = matched_index.tolist()
+		# kept as an array, see serialize.py
+		res['doc_list'] = matched_index
 		res['path_info'] = path_info
 		if (self.SHAP):
 			res['top_token_list'] = [self.top_tokens[x] for x in matched_index]
 
 		return res
 
+	def get_page(self, offset, page_size):
+		# ids of a page of the matched docs with the errors first, in the order of the doc view
+		# (the doc view renders them from its own docs), the order is cached with the rule prefix
+		self.match()
+		key = ("ordered", self.data_key, self.prefix_key)
+		cached = match_cache.get(key)
+		if (cached is None):
+			matched_index = self.matched_index
+			is_error = np.asarray(self.is_error[matched_index]).astype(bool)
+			cached = match_cache.put(key, np.concatenate([matched_index[is_error], matched_index[~is_error]]), int(is_error.sum()))
+		ordered, error_count = cached
+
+		return {
+			'doc_count': int(ordered.shape[0]),
+			'error_count': error_count,
+			'offset': offset,
+			'page_size': page_size,
+			'doc_list': ordered[offset:offset+page_size],
+		}
+
+	def shap_stat(self):
+		# for each class, the tokens among the top shap tokens of the matched docs, with the number of
+		# docs where their shap value is negative / positive, as counted by the doc view
+		self.match()
+		index = self.dataset.shap_index
+		key = ("shap", self.data_key, self.dataset.shap_version(), self.prefix_key)
+		cached = match_cache.get(key)
+		if (cached is None):
+			# entries of the matched docs, one slice of the entries per doc
+			offsets = index['offsets']
+			starts = offsets[self.matched_index]
+			lengths = offsets[self.matched_index+1] - starts
+			entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+			num_token = index['tokens'].shape[0]
+			codes, inverse = np.unique(index['class'][entries] * num_token + index['token'][entries], return_inverse=True)
+			positive = np.bincount(inverse, weights=index['positive'][entries], minlength=codes.shape[0]).astype(np.int64)
+			negative = np.bincount(inverse, minlength=codes.shape[0]) - positive
+			# rows of (class, token id, negative count, positive count)
+			cached = match_cache.put(key, np.column_stack([codes // num_token, codes % num_token, negative, positive]))
+		rows = cached[0]
+
+		stat = []
+		for class_ix in range(int(rows[:, 0].max())+1 if rows.shape[0] > 0 else 0):
+			class_rows = rows[rows[:, 0] == class_ix]
+			stat.append({
+				'token': index['tokens'][class_rows[:, 1]].tolist(),
+				'negative': class_rows[:, 2],
+				'positive': class_rows[:, 3],
+			})
+		return stat
+
 	def get_cond_matched(self, ix):
+		check_cancelled()
 		cond = self.rule_to_inspect[ix]
 		col = cond['feature']
 		sign = cond['sign']
@@ -201,41 +346,28 @@ class PathGenerator():
 
 		# check the feature name exists or not
 		if (sign == 'is'):
-			for val in cond['val']:
-				try:
-					self.cols.index(val)
-					vals.append(val)
-				except ValueError:
-					continue
+			vals = self.matcher.existing(cond['val'])
 			if (len(vals) == 0):
 				node_stat["size"] = 0
 				return node_stat
-		else:
-			try:
-				self.cols.index(col)
-			except ValueError:
-				node_stat["size"] = 0
-				return node_stat
-
-		# check conditions
-		if (sign == '>'):
-			self.matched_data = self.matched_data[self.matched_data[col] > 0.5]
-		elif (sign == '='):
-			# hfeat
-			val = cond['val']
-			self.matched_data = self.matched_data[self.matched_data[col] == val]
-		elif (sign == 'is'):
-			# concept
-			conds = pd.Series([False] * self.matched_data.shape[0])
-			for val in vals:
-				conds = conds | (self.matched_data[val] == 1)
-			self.matched_data = self.matched_data[conds] 
-		else:
-			print("!!!!!! Error rule !!!!!!")
+		elif (not self.matcher.exists(col)):
+			node_stat["size"] = 0
+			return node_stat
 
-		matched_index = self.matched_data.index.values.astype(int)
+		# check conditions, extending the cached docs of the prefix with this condition only
+		cond_key = normalize_cond(cond)
+		self.prefix_key = self.prefix_key + (cond_key,)
+		cached = match_cache.get(("prefix", self.data_key, self.prefix_key))
+		if (cached is None):
+			rows = self.get_cond_rows(cond, cond_key, vals)
+			if (rows is not None):
+				self.matched_index = self.matcher.intersect(self.matched_index, rows)
+			error_count = int(self.is_error[self.matched_index].sum())
+			cached = match_cache.put(("prefix", self.data_key, self.prefix_key), self.matched_index, error_count)
+		self.matched_index, error_count = cached
+
+		matched_index = self.matched_index
 		tot_doc = matched_index.shape[0]
-		error_count = int(self.is_error[matched_index].sum())
 		node_stat["size"] = tot_doc
 		if tot_doc:
 			node_stat['error_rate'] = error_count/float(tot_doc)
@@ -244,33 +376,43 @@ class PathGenerator():
 			node_stat['children'] = [child_node]
 		return node_stat
 
+	def get_cond_rows(self, cond, cond_key, vals):
+		# docs matching a single condition, None for an invalid condition
+		cached = match_cache.get(("cond", self.data_key, cond_key))
+		if (cached is not None):
+			return cached[0]
+		col = cond['feature']
+		sign = cond['sign']
+		if (sign == '>'):
+			rows = self.matcher.rows_greater(col)
+		elif (sign == '='):
+			# hfeat
+			rows = self.matcher.rows_equal(col, cond['val'])
+		elif (sign == 'is'):
+			# concept
+			rows = self.matcher.rows_any(vals)
+		else:
+			print("!!!!!! Error rule !!!!!!")
+			return None
+		return match_cache.put(("cond", self.data_key, cond_key), rows)[0]
+
 	def get_or_cond_matched(self, ix):
 		cond = self.rule_to_inspect[ix]
 		node_stat = cond
 		node_stat["error_rate"] = 0
 
-		vals = []
-
-		for val in cond['val']:
-			try:
-				self.cols.index(val)
-				vals.append(val)
-			except ValueError:
-				continue
-		
+		vals = self.matcher.existing(cond['val'])
 		if (len(vals) == 0):
 			node_stat["size"] = 0
 			return node_stat
 
 		if (cond['sign'] == 'is'):
-			conds = pd.Series([False] * self.matched_data.shape[0])
-			for val in vals:
-				conds = conds | (self.matched_data[val] == 1)
-			self.matched_data = self.matched_data[conds]
+			rows = self.matcher.rows_any(vals)
+			self.matched_index = self.matcher.intersect(self.matched_index, rows)
 		else:
 			print("!!!!!! Error or rule !!!!!!")
 
-		matched_index = self.matched_data.index.values.astype(int)
+		matched_index = self.matched_index
 		tot_doc = matched_index.shape[0]
 		error_count = int(self.is_error[matched_index].sum())
 		node_stat["size"] = tot_doc
@@ -281,66 +423,101 @@ class PathGenerator():
 			node_stat['children'] = [child_node]
 		return node_stat
 
-	def generate_hints(self):
-		if (self.rule_type != self.BINARY):
-			return []
-		increase_err = []
-		for col_idx in self.good_idx:
-			col = self.cols[col_idx]
-			x = self.matched_data[self.matched_data[col] > 0.5]
-			matched_index = x.index.values.astype(int)
-			error_count = int(self.is_error[matched_index].sum())
-			if (matched_index.shape[0] > 20):
-				err_rate = error_count/float(matched_index.shape[0])
-				if (err_rate > self.final_error_rate):
-					increase_err.append({
-						'feature': col,
-						'sign': '>',
-						'threshold': 0.5,
-						'err_rate': err_rate
-					})
-		return sorted(increase_err, key=lambda x: -x['err_rate'])[:2]
+	@timed("stat_aggregation")
+	def generate_hints(self, top_k=HINT_TOP_K, min_support=HINT_MIN_SUPPORT, ci_method=CI_METHOD):
+		# rank the conditions that could be added to the rule by the lift of the error rate
+		# of the matched docs, counted for all tokens and high-level feature values at once
+		if (len(self.rule_to_inspect) > 0):
+			self.match()
+			matched_index = self.matched_index
+		else:
+			matched_index = np.arange(self.is_error.shape[0])
+		res = {
+			'support': int(matched_index.shape[0]),
+			'err_rate': 0,
+			'hint': [],
+		}
+		if (matched_index.shape[0] == 0):
+			return res
+		error_count = int(self.is_error[matched_index].sum())
+		base_rate = error_count/float(matched_index.shape[0])
+		res['err_rate'] = base_rate
+
+		# candidate conditions and their counts, the dicts are only built for the top-k
+		conds = []
+		tots = []
+		errs = []
+		# tokens, X[matched].T @ [1, is_error] as one product over the columns of the corpus
+		dataset = self.dataset
+		if (dataset.has_tokens()):
+			present = dataset.corpus_present
+			weights = np.zeros(shape=(present.shape[0], 2))
+			weights[matched_index, 0] = 1
+			weights[matched_index, 1] = self.is_error[matched_index]
+			counts = np.asarray(present.T @ weights)
+			good_idx = np.asarray(dataset.good_idx, dtype=int)
+			columns = dataset.columns
+			conds.append(lambda ix: {'feature': columns[good_idx[ix]], 'sign': '>', 'threshold': 0.5})
+			tots.append(np.rint(counts[good_idx, 0]).astype(int))
+			errs.append(np.rint(counts[good_idx, 1]).astype(int))
+		check_cancelled()
+
+		# high-level feature values, counted on the codes of the stat. view
+		if (dataset.has_hfeat()):
+			encoded = dataset.hfeat_stat_codes
+			hfeat_index = dataset.hfeat_index
+			code_ix = [ix for ix, col in enumerate(encoded['columns']) if col in hfeat_index]
+			vals = [(encoded['columns'][ix], val) for ix in code_ix for val in encoded['uniques'][ix]]
+			counts = count_by_group(np.asarray(encoded['codes'][matched_index])[:, code_ix],
+				[encoded['uniques'][ix] for ix in code_ix], self.is_error[matched_index])
+			conds.append(lambda ix: {'feature': vals[ix][0], 'sign': '=', 'val': vals[ix][1]})
+			tots.append(np.concatenate([np.zeros(0, dtype=int)] + [tot for tot, err in counts]))
+			errs.append(np.concatenate([np.zeros(0, dtype=int)] + [err for tot, err in counts]))
+
+		if (len(conds) == 0):
+			return res
+		offsets = np.cumsum([0] + [tot.shape[0] for tot in tots])
+		tot = np.concatenate(tots)
+		err = np.concatenate(errs)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			rate = np.where(tot > 0, err / tot, 0)
+		# conditions keeping the whole subset do not refine the rule
+		keep = np.flatnonzero((tot >= min_support) & (tot < matched_index.shape[0]) & (rate > base_rate))
+		keep = keep[np.lexsort((-tot[keep], -rate[keep]))][:top_k]
+		ci_l, ci_u = count_ci(err[keep], tot[keep], ci_method)
+		for ix, l, u in zip(keep.tolist(), np.atleast_1d(ci_l).tolist(), np.atleast_1d(ci_u).tolist()):
+			group = int(np.searchsorted(offsets, ix, side='right')) - 1
+			hint = conds[group](ix - offsets[group])
+			hint['support'] = int(tot[ix])
+			hint['error_count'] = int(err[ix])
+			hint['err_rate'] = float(rate[ix])
+			hint['lift'] = float(rate[ix] / base_rate) if base_rate > 0 else None
+			hint['ci'] = [float(l), float(u)]
+			res['hint'].append(hint)
+		return res
 
 class Concept():
 	def intialize(self, data_name):
-		model_output = pd.read_csv(filepath_or_buffer = "./data/"+data_name+"/model_output.csv")
-		self.is_error = (model_output['y_gt'] != model_output['y_pred']).values.astype(int)
-
-		loaded = sparse.load_npz("./data/"+data_name+"/corpus_mat.npz")
-		X = loaded.toarray()
-		with open("./data/"+data_name+"_binary/test.json") as json_input:
-			data = json.load(json_input)
-			cols = data['columns']
-		self.df = pd.DataFrame(data=X, columns=cols)
-		self.cols = cols
+		dataset = get_dataset(data_name)
+		self.is_error = dataset.is_error
+
+		self.matcher = RuleMatcher().intialize(dataset, read_hfeat=False)
 		return self 
 
-	def generate_stat(self, concept):
+	@timed("condition_filtering")
+	def generate_stat(self, concept, ci_method=CI_METHOD):
 		concept_stat = {
 			"err_rate": 0,
 			"ci": [0,0],
 			"support": 0,
 		}
 		# check word existence
-		vals = []
-		for val in concept:
-			try:
-				self.cols.index(val)
-				vals.append(val)
-			except ValueError:
-				continue
-		
+		vals = self.matcher.existing(concept)
 		if (len(vals) == 0):
 			concept_stat["support"] = 0
 			return concept_stat
 
-		self.matched_data = pd.DataFrame(self.df)
-		conds = pd.Series([False] * self.matched_data.shape[0])
-		for val in vals:
-			conds = conds | (self.matched_data[val] == 1)
-		self.matched_data = self.matched_data[conds]
-
-		matched_index = self.matched_data.index.values.astype(int)
+		matched_index = self.matcher.rows_any(vals)
 		tot_doc = matched_index.shape[0]
 		concept_stat["support"] = tot_doc
 
@@ -348,10 +525,5 @@ class Concept():
 		if tot_doc:
 			concept_stat['err_rate'] = error_count/float(tot_doc)
 			# calculate 0.95 ci
-			data = (self.is_error[matched_index],)
-			res = bootstrap(data, np.mean, confidence_level=0.95, random_state=np.random.default_rng())
-			ci_l, ci_u = res.confidence_interval
-			concept_stat['ci'] = [ci_l, ci_u]
+			concept_stat['ci'] = error_rate_ci(self.is_error[matched_index], ci_method)
 		return concept_stat
-
-
@@ -11,13 +11,83 @@ from flask import Flask
 from flask_cors import CORS
 from flask import request
 from flask import send_from_directory
+from flask import Response
 import os
 from rule_explorer import util
+from rule_explorer.serialize import json_response, serialization_stats
+from rule_explorer.executor import task_runner, Overloaded, Cancelled
+from rule_explorer import metrics
+from rule_explorer.cache import match_cache
+from rule_explorer.store import store
+from concurrent import futures
+import threading
 
 
 app = Flask(__name__, static_folder="../static", template_folder="../static")
 CORS(app)
 
+# datasets loaded at boot, e.g., ISEA_PREWARM=mnli_government,twitter
+for data_name in [name for name in os.environ.get("ISEA_PREWARM", "").split(",") if name]:
+	print("prewarm "+data_name)
+	util.get_dataset(data_name).prewarm()
+
+# append the payloads of inspect_rule/ to this file, replayed by benchmarks/load_inspect_rule.py
+RECORD_PAYLOADS = os.environ.get("ISEA_RECORD_PAYLOADS")
+record_lock = threading.Lock()
+
+
+def record_payload(para):
+	with record_lock:
+		with open(RECORD_PAYLOADS, "a") as output:
+			output.write(json.dumps(para)+"\n")
+
+class InvalidParameter(ValueError):
+	pass
+
+def get_ci_method(para):
+	# an unknown method is an error of the client, not of the computation
+	ci_method = para.get('ci_method', util.CI_METHOD)
+	if (ci_method not in util.CI_METHODS):
+		raise InvalidParameter("unknown ci_method: "+str(ci_method)+", one of "+", ".join(util.CI_METHODS))
+	return ci_method
+
+def run_task(para, func, *args):
+	# the computations run in the bounded pool of executor.py, a request_id in the payload
+	# lets the client cancel them through /cancel/
+	return task_runner.run(para['data_name'], metrics.bind(func), *args, request_id=para.get('request_id'))
+
+@app.before_request
+def start_timer():
+	# phase timings when ISEA_METRICS=1, sampled stacks when asked by the X-Isea-Profile header
+	metrics.start_request(request.endpoint or "none", request.headers.get(metrics.PROFILE_HEADER) == "1")
+
+@app.after_request
+def finish_timer(response):
+	timer = metrics.current()
+	if (timer is not None):
+		if (not response.is_streamed):
+			response.headers['Server-Timing'] = timer.server_timing()
+		# the streamed responses are timed until their last chunk
+		response.call_on_close(timer.finish)
+	return response
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(e):
+	return json_response({'error': "too many pending requests"}, "error", request), 503
+
+@app.errorhandler(futures.TimeoutError)
+def handle_timeout(e):
+	return json_response({'error': "timeout"}, "error", request), 504
+
+@app.errorhandler(InvalidParameter)
+def handle_invalid_parameter(e):
+	return json_response({'error': str(e)}, "error", request), 400
+
+@app.errorhandler(Cancelled)
+def handle_cancelled(e):
+	# client closed request
+	return json_response({'error': "cancelled"}, "error", request), 499
+
 
 @app.route("/",  methods=['POST', 'GET'])
 def index():
@@ -41,24 +111,88 @@ def get_stat():
 	data_name = para['data_name']
 	doc_list = para['doc_list']
 	key_list = para['key_list']
-	res = util.get_stat(data_name, doc_list, key_list)
-	return json.dumps(res)
+	res = run_task(para, util.get_stat, data_name, doc_list, key_list)
+	return json_response(res, "get_stat", request)
 
 @app.route("/inspect_rule/", methods=['POST', 'GET'])
 def inspect_rule():
 	print("======== inspect customized rule =========")
 	para = json.loads(str(request.get_json(force=True)))
+	if (RECORD_PAYLOADS):
+		record_payload(para)
 	rules = para['rules']
 	data_name = para['data_name']
 	key_list = para['key_list']
 	error_only = para['error_only']
+	# optional, only the first page of docs is returned, the others through /inspect_docs/
+	page_size = para.get('page_size')
 	
-	res = util.inspect_rule(rules, data_name, bool(+error_only))
-	res['stat'] = util.get_stat(data_name, res['doc_list'], key_list)
-	if (data_name == 'twitter' or 'mnli' in data_name):
-		res['train_stat'] = util.get_stat_in_train(data_name, rules)
+	def compute():
+		res = util.inspect_rule(rules, data_name, bool(+error_only), key_list, page_size)
+		if (data_name == 'twitter' or 'mnli' in data_name):
+			res['train_stat'] = util.get_stat_in_train(data_name, rules)
+		return res
+	res = run_task(para, compute)
+
+	# the docs and shap tokens of broad rules are streamed
+	return json_response(res, "inspect_rule", request, stream=True)
+
+@app.route("/inspect_rules/", methods=['POST', 'GET'])
+def inspect_rules():
+	print("======== inspect a list of rules =========")
+	para = json.loads(str(request.get_json(force=True)))
+	rule_list = para['rule_list']
+	data_name = para['data_name']
+	key_list = para['key_list']
+	error_only = para['error_only']
 
-	return json.dumps(res)
+	def compute():
+		res = util.inspect_rules(rule_list, data_name, key_list, bool(+error_only))
+		if (data_name == 'twitter' or 'mnli' in data_name):
+			for rules, rule_res in zip(rule_list, res):
+				rule_res['train_stat'] = util.get_stat_in_train(data_name, rules)
+		return res
+	res = run_task(para, compute)
+
+	return json_response({'results': res}, "inspect_rules", request, stream=True)
+
+@app.route("/inspect_docs/", methods=['POST', 'GET'])
+def inspect_docs():
+	print("======== get a page of matched docs =========")
+	para = json.loads(str(request.get_json(force=True)))
+	rules = para['rules']
+	data_name = para['data_name']
+	offset = int(para.get('offset', 0))
+	page_size = int(para.get('page_size', util.PAGE_SIZE))
+
+	res = run_task(para, util.get_doc_page, rules, data_name, offset, page_size)
+	return json_response(res, "inspect_docs", request)
+
+@app.route("/hints/", methods=['POST', 'GET'])
+def hints():
+	print("======== hint next conditions =========")
+	para = json.loads(str(request.get_json(force=True)))
+	rules = para['rules']
+	data_name = para['data_name']
+	top_k = int(para.get('top_k', util.HINT_TOP_K))
+	min_support = int(para.get('min_support', util.HINT_MIN_SUPPORT))
+	ci_method = get_ci_method(para)
+
+	res = run_task(para, util.get_hints, rules, data_name, top_k, min_support, ci_method)
+	return json_response(res, "hints", request)
+
+@app.route("/projection/", methods=['POST', 'GET'])
+def projection():
+	print("======== get the projection of a viewport =========")
+	para = json.loads(str(request.get_json(force=True)))
+	data_name = para['data_name']
+	# [x0, y0, x1, y1] in the coordinates of sentence_tsne.csv, all docs by default
+	viewport = para.get('viewport')
+	rules = para.get('rules')
+	max_points = int(para.get('max_points', util.MAX_POINTS))
+
+	res = run_task(para, util.get_projection, data_name, rules, viewport, max_points)
+	return json_response(res, "projection", request)
 
 @app.route("/update_concept", methods=['POST', 'GET'])
 def update_concept():
@@ -66,8 +200,45 @@ def update_concept():
 	para = json.loads(str(request.get_json(force=True)))
 	concept = para['concept']
 	data_name = para['data_name']
-	res = util.evaluate_concept(data_name, concept)
-	return json.dumps(res)
+	ci_method = get_ci_method(para)
+	res = run_task(para, util.evaluate_concept, data_name, concept, ci_method)
+	return json_response(res, "update_concept", request)
+
+@app.route("/cancel/", methods=['POST', 'GET'])
+def cancel():
+	# e.g., when the user selects another rule before the previous one is inspected
+	para = json.loads(str(request.get_json(force=True)))
+	return json_response({'cancelled': task_runner.cancel(para['request_id'])}, "cancel", request)
+
+@app.route("/serialization_stats/", methods=['GET'])
+def get_serialization_stats():
+	# time spent encoding the responses of each route since the server started
+	return json_response(serialization_stats.stats(), "serialization_stats", request)
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+	# prometheus text format, the phase timings need ISEA_METRICS=1
+	families = metrics.metrics.families()
+	cache_stats = match_cache.stats()
+	families.append(("isea_match_cache_lookups_total", "counter", "lookups of the matched docs of conditions and rule prefixes",
+		[("", (("result", "hit"),), cache_stats['hits']), ("", (("result", "miss"),), cache_stats['misses'])]))
+	families.append(("isea_match_cache_evictions_total", "counter", "matched docs dropped from the match cache",
+		[("", (), cache_stats['evictions'])]))
+	families.append(("isea_match_cache_bytes", "gauge", "memory used by the match cache", [("", (), cache_stats['bytes'])]))
+	store_stats = store.stats()
+	families.append(("isea_store_bytes", "gauge", "estimated memory of the resident datasets",
+		[("", (("dataset", data_name),), stat['bytes']) for data_name, stat in store_stats.items()]))
+	task_stats = task_runner.stats()
+	families.append(("isea_tasks_total", "counter", "computations of the task runner by outcome",
+		[("", (("state", state),), count) for state, count in task_stats.items() if state != 'running']))
+	families.append(("isea_tasks_running", "gauge", "computations with a request_id that are running", [("", (), task_stats['running'])]))
+	serialization = serialization_stats.stats()
+	families.append(("isea_serialization_seconds_total", "counter", "time spent encoding the responses",
+		[("", (("route", route),), stat['seconds']) for route, stat in serialization.items()]))
+	families.append(("isea_response_bytes_total", "counter", "bytes of the encoded responses",
+		[("", (("route", route),), stat['bytes']) for route, stat in serialization.items()]))
+	return Response(metrics.exposition(families), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=7070)
\ No newline at end of file
+    # one thread per connection, the computations are bounded by the task runner
+    app.run(host="0.0.0.0", port=7070, threaded=True)
\ No newline at end of file
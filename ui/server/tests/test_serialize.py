@@ -0,0 +1,36 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import os
+import sys
+import json
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rule_explorer import serialize
+
+
+def test_int_arrays_same_as_json_dumps():
+	rng = np.random.default_rng(0)
+	arrays = [np.array([], dtype=int), np.array([0]), np.array([-1, 9, 10, -10, 99, 100]),
+		np.array([np.iinfo(np.int64).max, -np.iinfo(np.int64).max]),
+		rng.integers(-10**6, 10**6, serialize.CHUNK_ITEMS*2+3), rng.integers(0, 100, 5).astype(np.int32)]
+	for arr in arrays:
+		assert serialize.dumps(arr) == json.dumps(arr.tolist()).encode()
+
+def test_round_trip():
+	rng = np.random.default_rng(1)
+	doc_list = rng.integers(0, 10**5, serialize.CHUNK_ITEMS+7)
+	obj = {
+		'doc_list': doc_list,
+		'err_rate': np.float64(.25),
+		'support': np.int64(3),
+		'rules': [{'feature': "tok1", 'sign': '>', 'threshold': 0.5}, {'feature': 2, 'sign': '=', 'val': 1}],
+		'token_list': ["w"+str(ix) for ix in range(serialize.CHUNK_ITEMS+1)],
+		1: {'shap_stat': [{'token': ["a", "b"], 'negative': np.array([1, 0]), 'positive': np.array([2, 5])}]},
+		'empty': np.array([], dtype=np.int64),
+	}
+	expected = json.loads(json.dumps(obj, default=serialize.default))
+	assert json.loads(serialize.dumps(obj)) == expected
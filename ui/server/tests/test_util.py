@@ -0,0 +1,79 @@
+# Copyright (c) 2022, salesforce.com, inc.
+# All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+# For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
+
+import os
+import sys
+import copy
+import json
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import synthetic
+from bench_get_stat import legacy_get_stat
+from rule_explorer import bundle
+from rule_explorer import store
+from rule_explorer import util
+
+RULES = [
+	[{'feature': "tok1", 'sign': '>'}],
+	[{'feature': "tok0", 'sign': '>'}, {'feature': "tok3", 'sign': '>'}],
+	[{'feature': "ADJ", 'sign': '=', 'val': 2.}],
+	[{'feature': "tok2", 'sign': '>'}, {'feature': "NOUN", 'sign': '=', 'val': 3.}, {'feature': "pred", 'sign': '=', 'val': 1}],
+	[{'feature': "concept", 'sign': 'is', 'val': ["tok5", "tok7", "missing"]}],
+	[{'feature': "concept", 'sign': 'is', 'val': ["tok0", "tok9"]}, {'feature': "doc_len", 'sign': '=', 'val': 4.}],
+	[{'feature': "missing", 'sign': '>'}],
+]
+
+
+@pytest.fixture(scope="module", params=["text", "bundle"])
+def data_name(request, tmp_path_factory):
+	# the synthetic dataset of the benchmarks, from the text files or from a bundle
+	data_dir = str(tmp_path_factory.mktemp("data"))
+	synthetic.write_dataset(data_dir, request.param, num_doc=600, vocab_size=200, density=.03)
+	if (request.param == "bundle"):
+		bundle.convert(request.param, data_dir)
+	store.store.data_dir = data_dir
+	store.store.clear()
+	return request.param
+
+def dense_frame(dataset):
+	# the corpus and the high-level features as one DataFrame, as rules were matched before RuleMatcher
+	corpus = pd.DataFrame(dataset.corpus.toarray(), columns=dataset.columns)
+	return pd.concat([corpus, dataset.hfeat.reset_index(drop=True)], axis=1)
+
+def mask_rows(df, rule):
+	# conditions on features that do not exist are skipped
+	mask = pd.Series(True, index=df.index)
+	for cond in rule:
+		if (cond['sign'] != 'is' and cond['feature'] not in df.columns):
+			continue
+		if (cond['sign'] == '>'):
+			mask &= df[cond['feature']] > 0.5
+		elif (cond['sign'] == '='):
+			mask &= df[cond['feature']] == cond['val']
+		elif (cond['sign'] == 'is'):
+			mask &= df[[val for val in cond['val'] if val in df.columns]].eq(1).any(axis=1)
+	return np.flatnonzero(mask.values)
+
+def test_rule_matcher_matches_pandas_mask(data_name):
+	df = dense_frame(store.get_dataset(data_name))
+	for rule in RULES:
+		expected = mask_rows(df, rule)
+		assert np.array_equal(util.inspect_rule(copy.deepcopy(rule), data_name)['doc_list'], expected), rule
+		# again from the match cache
+		assert np.array_equal(util.inspect_rule(copy.deepcopy(rule), data_name)['doc_list'], expected), rule
+	assert any([len(mask_rows(df, rule)) > 0 for rule in RULES[1:]])
+
+def test_get_stat_matches_groupby(data_name):
+	dataset = store.get_dataset(data_name)
+	key_list = ['gold_label', 'genre', 'missing']
+	# the docs of some rules, and all docs
+	doc_lists = [np.asarray(util.inspect_rule(copy.deepcopy(rule), data_name)['doc_list']).tolist() for rule in RULES[:4]]
+	for doc_list in doc_lists + [list(range(dataset.is_error.shape[0]))]:
+		expected = legacy_get_stat(dataset, doc_list, key_list)
+		assert json.dumps(util.get_stat(data_name, doc_list, key_list)) == json.dumps(expected, default=lambda x: x.item())
@@ -23,7 +23,10 @@ vis.docView = function () {
         xScale, yScale,
         shap_svg = d3.select('#shap_overview'),
         shap_vals,
+        shap_stat,
         shap_pred = 0,
+        // the rule whose docs are paged in, see update_rule_page
+        page = null,
         svg_height = 100,
         bar_width = 15,
         legend_svg = d3.select('#shap_legend'),
@@ -37,6 +40,12 @@ vis.docView = function () {
     docView.container = function (_) {
         if (!arguments.length) return container;
         container = _;
+        container.on('scroll', function() {
+            // load the next page of docs when scrolled to the bottom
+            if (this.scrollTop + this.clientHeight >= this.scrollHeight - 50) {
+                load_next_page();
+            }
+        });
         return docView;
     };
 
@@ -73,6 +82,13 @@ vis.docView = function () {
 
     docView.shap_vals = function(_) {
         shap_vals = _;
+        shap_stat = undefined;
+        return docView;
+    }
+
+    // token counts of the shap overview computed by the server, instead of the shap values of each doc
+    docView.shap_stat = function(_) {
+        shap_stat = _;
         return docView;
     }
 
@@ -110,6 +126,7 @@ vis.docView = function () {
         // clear existing points
         container.selectAll(".doc_box").remove();
         shap_svg.selectAll('*').remove();
+        page = null;
 
         return docView;
     }
@@ -144,6 +161,26 @@ vis.docView = function () {
         }
     }
 
+    docView.update_rule_page = function(res, rules, rule_idx=undefined) {
+        // res: the first page of an inspect_rule/ response with a page_size, errors first
+        page = {
+            'rules': rules,
+            'offset': res['doc_list'].length,
+            'doc_count': res['doc_count'],
+            'loading': false,
+        };
+        append_documents(res['doc_list']);
+        d3.select('#text_doc_num').html(res['doc_count']);
+        d3.select('#text_err_num').html(res['error_count']);
+        if (rule_idx!==undefined) {
+            d3.select('#text_rid').html(`Rule ${rule_idx+1}`);
+        } else {
+            d3.select('#text_rid').html(`Edited rule`);
+        }
+
+        return docView;
+    }
+
     docView.render_shap_bars = function() {
         update_shap_view();
 
@@ -187,7 +224,35 @@ vis.docView = function () {
         d3.select('#text_err_num').html(err_num);
     }
 
+    function load_next_page() {
+        if (page === null || page.loading || page.offset >= page.doc_count) return;
+        let current = page;
+        current.loading = true;
+
+        let para = {
+            "rules": current.rules,
+            "data_name": data_name,
+            "offset": current.offset,
+            "page_size": vis.doc_page_size,
+        }
+        postData("inspect_docs/", JSON.stringify(para), (res) => {
+            current.loading = false;
+            // another rule was selected meanwhile
+            if (page !== current) return;
+            current.offset += res['doc_list'].length;
+            append_documents(res['doc_list']);
+        });
+    }
+
     function show_document(doc_list) {
+        let err_num = append_documents(doc_list);
+
+        // update document subgroup information
+        d3.select('#text_doc_num').html(doc_list.length);
+        d3.select('#text_err_num').html(err_num);
+    }
+
+    function append_documents(doc_list) {
         let err_num = 0;
         doc_list.forEach((doc_idx) => {
             let doc_box = container.append('div')
@@ -205,14 +270,9 @@ vis.docView = function () {
                 render_sentiment(doc_box, doc_idx, is_error);
             }
 
-            doc_box.append
-
             err_num += is_error;
         });
-
-        // update document subgroup information
-        d3.select('#text_doc_num').html(doc_list.length);
-        d3.select('#text_err_num').html(err_num);
+        return err_num;
     }
 
     function render_qa(doc_box, doc_idx, is_error) {
@@ -383,18 +443,25 @@ vis.docView = function () {
 
     function process_shap_by_label() {
         token_list = {};
-        shap_vals.forEach(doc_shaps => {
-            doc_shaps[shap_pred].forEach(item => {
-                if (!(item['token'] in token_list)) {
-                    token_list[item['token']] = [0, 0];
-                }
-                if (item['val'] < 0) {
-                    token_list[item['token']][0]++;
-                } else {
-                    token_list[item['token']][1]++;
-                }
+        if (shap_stat !== undefined) {
+            let class_stat = shap_stat[shap_pred] || {'token': [], 'negative': [], 'positive': []};
+            class_stat['token'].forEach((token, i) => {
+                token_list[token] = [class_stat['negative'][i], class_stat['positive'][i]];
+            });
+        } else {
+            shap_vals.forEach(doc_shaps => {
+                doc_shaps[shap_pred].forEach(item => {
+                    if (!(item['token'] in token_list)) {
+                        token_list[item['token']] = [0, 0];
+                    }
+                    if (item['val'] < 0) {
+                        token_list[item['token']][0]++;
+                    } else {
+                        token_list[item['token']][1]++;
+                    }
+                })
             })
-        })
+        }
         stat = [];
         Object.keys(token_list).forEach(key => {
             let processed_key;
@@ -83,7 +83,6 @@ function loadData() {
       .defer(d3.csv, `data/${data}/hfeat_stat.csv`) // 5, extracted high-level feature values
       .defer(d3.json, `data/${data}_hfeat/list.json`) // 6, rules based on high-level features
       .defer(d3.json, `data/${data}_hfeat/test.json`) // 7, features used as high-level features, and thresholds for low/medium/high values
-      .defer(d3.csv, `data/${data}/sentence_tsne.csv`) // 8, 2d positions for document embeddings
       .await(render);
 }
 
@@ -98,11 +97,10 @@ function render(err, ...vals){
         .hfeat(vals[6], vals[7], doc_type)
         .render();
 
-    // render projection
+    // render projection, the 2d positions are sent by the server for the viewport
     projectionView.container(d3.select('#projectionView'))
         .make_legend()
-        .position(vals[8])
-        .model_output(vals[3])
+        .data_name(data_name)
         .render()
 
     // rendering rule list
@@ -138,6 +136,7 @@ function wire_events() {
             "data_name": data_name,
             "key_list": statView.key_list(),
             "error_only": 0,
+            "page_size": vis.doc_page_size,
         }
 
         postData("inspect_rule/", JSON.stringify(updated_rule), (res) => {
@@ -147,10 +146,11 @@ function wire_events() {
                 .update_hint(res['hint'])
                 .render_condition_path();
 
+            // the first page of docs, the others are loaded when scrolling the doc view
             docView.processed_rule(processed_rule).clear()
-                .shap_vals(res['top_token_list'])
+                .shap_stat(res['shap_stat'])
                 .render_shap_bars()
-                .update_rule_collection(res['doc_list'], rule_idx);
+                .update_rule_page(res, processed_rule, rule_idx);
             
             statView.container(d3.select("#select_stat"), rule_idx).data(res['stat']).draw();
 
@@ -158,7 +158,7 @@ function wire_events() {
                 statView.container(d3.select("#select_stat")).train_data(res['train_stat']).draw_train_stat();
             }
 
-            projectionView.highlight_subpopulation(res['doc_list'], rule_idx);
+            projectionView.highlight_subpopulation(processed_rule, rule_idx);
         })
     })
 
@@ -169,6 +169,7 @@ function wire_events() {
             "data_name": data_name,
             "key_list": statView.key_list(),
             "error_only": 0,
+            "page_size": vis.doc_page_size,
         }
 
         console.log(updated_rule['rules']);
@@ -186,16 +187,16 @@ function wire_events() {
 
             // update document collection
             docView.processed_rule(updated_rule['rules']).clear()
-                .shap_vals(res['top_token_list'])
+                .shap_stat(res['shap_stat'])
                 .render_shap_bars()
-                .update_rule_collection(res['doc_list']);
+                .update_rule_page(res, updated_rule['rules']);
             
             statView.container(d3.select("#select_stat"), "edited").data(res['stat']).draw();
             if ('train_stat' in res) {
                 statView.container(d3.select("#select_stat")).train_data(res['train_stat']).draw_train_stat();
             }
 
-            projectionView.highlight_subpopulation(res['doc_list']);
+            projectionView.highlight_subpopulation(updated_rule['rules']);
         })
     })
 
@@ -13,7 +13,13 @@ vis.projectionView = function () {
         width = 350,
         height = 140,
         margin = 10,
-        position = [],
+        data_name,
+        // bounds of all docs, and the zoom of the canvas
+        bounds,
+        transform,
+        zoom,
+        rules,
+        rule_idx,
         top_k = 5,
         canvas,
         pred_des = [],
@@ -27,27 +33,14 @@ vis.projectionView = function () {
     // Public Functions
     //=======================
 
-    projectionView.position = function(_) {
-        position = _;
-        let coord_max = position.reduce((max, p) => +p.x > max ? +p.x : max, position[0].x),
-            coord_min = position.reduce((min, p) => +p.x < min ? +p.x : min, position[0].x);
-
-        xScale = d3.scaleLinear()
-            .domain([coord_min, coord_max])
-            .range([margin, size[0]-margin]);
-
-        ccoord_max = position.reduce((max, p) => +p.y > max ? +p.y : max, +position[0].y);
-        coord_min = position.reduce((min, p) => +p.y < min ? +p.y : min, +position[0].y);
-
-        yScale = d3.scaleLinear()
-            .domain([coord_min, coord_max])
-            .range([margin, size[1]-margin]);
-        
-        return projectionView;
-    }
-
-    projectionView.model_output = function(_) {
-        model_output = _;
+    projectionView.data_name = function(_) {
+        data_name = _;
+        rules = undefined;
+        bounds = undefined;
+        if (zoom != undefined) {
+            canvas.call(zoom.transform, d3.zoomIdentity);
+        }
+        transform = undefined;
         return projectionView;
     }
 
@@ -55,18 +48,34 @@ vis.projectionView = function () {
         canvas = _.select("canvas")
         size = [canvas.attr('width'), canvas.attr('height')];
         legend_svg = d3.select("#projection_legend");
+
+        // the server sends the points (or density bins) of the zoomed viewport
+        zoom = d3.zoom()
+            .scaleExtent([1, 256])
+            .on("end", function() {
+                transform = d3.event.transform;
+                // not when the zoom is reset for another dataset
+                if (d3.event.sourceEvent != null) {
+                    request();
+                }
+            });
+        canvas.call(zoom);
         
         return projectionView;
     }
 
   
     projectionView.render = function() {
-        render_list();
+        rules = undefined;
+        rule_idx = undefined;
+        request();
         return projectionView;
     }
 
-    projectionView.highlight_subpopulation = function(doc_list, rule_idx=undefined) {
-        render_list(doc_list, true, rule_idx);
+    projectionView.highlight_subpopulation = function(rule, idx=undefined) {
+        rules = rule;
+        rule_idx = idx;
+        request();
         return projectionView;
     }
 
@@ -103,38 +112,75 @@ vis.projectionView = function () {
     //=======================
     // Private Functions
     //=======================
-    function render_list(doc_list=undefined, highlight=false, rule_idx=undefined) {
+    function request() {
+        let para = {
+            "data_name": data_name,
+            "viewport": current_viewport(),
+        }
+        if (rules != undefined) {
+            para["rules"] = rules;
+        }
+        postData("projection/", JSON.stringify(para), (res) => {
+            bounds = res['bounds'];
+            render_list(res);
+        });
+    }
+
+    function current_viewport() {
+        // data coordinates of the zoomed canvas, all docs before the first zoom
+        if (bounds == undefined || transform == undefined) {
+            return null;
+        }
+        let scales = base_scales();
+        return [scales[0].invert(transform.invertX(0)), scales[1].invert(transform.invertY(0)),
+            scales[0].invert(transform.invertX(size[0])), scales[1].invert(transform.invertY(size[1]))];
+    }
+
+    function base_scales() {
+        return [
+            d3.scaleLinear().domain([bounds[0], bounds[2]]).range([margin, size[0]-margin]),
+            d3.scaleLinear().domain([bounds[1], bounds[3]]).range([margin, size[1]-margin]),
+        ];
+    }
+
+    function render_list(res) {
         let context = canvas.node().getContext('2d');
+        let scales = base_scales();
+        let xScale = transform == undefined ? scales[0] : transform.rescaleX(scales[0]),
+            yScale = transform == undefined ? scales[1] : transform.rescaleY(scales[1]);
 
         // clear existing points
         context.clearRect(0, 0, size[0], size[1]);
         
-        // draw scatterplot
-        if (highlight) {
-            for (let i = 0; i < doc_list.length; i++) {
-                let j = doc_list[i];
-
-                let is_error = +(+model_output[j]['y_gt'] !== +model_output[j]['y_pred']);
-
-                context.fillStyle = is_error ? vis.projectColor['error'] : vis.projectColor['right'];
-                drawPoint(xScale(position[j].x), yScale(position[j].y), context);
+        if (res['mode'] == "points") {
+            for (let i = 0; i < res['doc_list'].length; i++) {
+                context.fillStyle = res['is_error'][i] ? vis.projectColor['error'] : vis.projectColor['right'];
+                drawPoint(xScale(res['x'][i]), yScale(res['y'][i]), context);
             }
-            if (rule_idx == undefined) {
-                d3.select('#proj_rid')
-                    .html("Edited rule")
-            } else {
-                d3.select('#proj_rid')
-                    .html(`Rule ${rule_idx+1}`)
-            }
-            
         } else {
-            for (let i = 0; i < d3.min([position.length, 5000]); i++) {
-                let is_error = +(+model_output[i]['y_gt'] !== +model_output[i]['y_pred']);
-                context.fillStyle = is_error ? vis.projectColor['error'] : vis.projectColor['right'];
-                drawPoint(xScale(position[i].x), yScale(position[i].y), context);
+            // density bins, colored by their most frequent outcome
+            let max_tot = d3.max(res['tot']);
+            for (let i = 0; i < res['tot'].length; i++) {
+                let x0 = res['origin'][0] + res['cx'][i] * res['cell_size'][0],
+                    y0 = res['origin'][1] + res['cy'][i] * res['cell_size'][1];
+                context.globalAlpha = .2 + .8 * Math.log(1 + res['tot'][i]) / Math.log(1 + max_tot);
+                context.fillStyle = 2 * res['err'][i] >= res['tot'][i] ? vis.projectColor['error'] : vis.projectColor['right'];
+                context.fillRect(xScale(x0), yScale(y0),
+                    Math.max(1, xScale(x0 + res['cell_size'][0]) - xScale(x0)),
+                    Math.max(1, yScale(y0 + res['cell_size'][1]) - yScale(y0)));
             }
+            context.globalAlpha = 1;
+        }
+
+        if (rules == undefined) {
             d3.select('#proj_rid')
                 .html("all")
+        } else if (rule_idx == undefined) {
+            d3.select('#proj_rid')
+                .html("Edited rule")
+        } else {
+            d3.select('#proj_rid')
+                .html(`Rule ${rule_idx+1}`)
         }
     }
 
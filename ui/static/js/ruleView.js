@@ -100,6 +100,11 @@ vis.ruleView = function () {
         let rules = [];
 
         ruleSet[rule_idx]['rules'].forEach((cond) => {
+            if (cond['sign'] == 'is') {
+                // concept rule, the tokens are listed by name
+                rules.push({'feature': cond['feature'], 'sign': 'is', 'val': cond['val']});
+                return;
+            }
             let processed = {
                 'feature': attrs[cond['feature']],
                 'sign': cond['sign'],
@@ -427,7 +432,9 @@ vis.ruleView = function () {
 
             conditions.forEach((rule, i) => {
                 let feat = attrs[rule["feature"]];
-                if (binary) {
+                if (rule['sign'] == 'is') {
+                    feat = "(" + rule['val'].join(" OR ") + ")";
+                } else if (binary) {
                     
                 } else {
                     feat += rule['sign'];
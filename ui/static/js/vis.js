@@ -15,6 +15,8 @@ vis = function() {
 
 	// replace this domain address by your own port, or server address
 	vis.domain = "http://localhost:7070/";
+	// docs of a rule sent per request to the doc view
+	vis.doc_page_size = 50;
 
 	vis.pred_err_color = ['#9ecae1', '#de2d26'];
 	vis.shap_color = ['#cbd5e8', '#dfc27d'];